@@ -0,0 +1,96 @@
+# bytes per object for the old dataclass layout vs the __slots__ + shape layout
+#
+#   python benchmarks/bench_layout.py [n]
+#
+# builds the same binary tree (n nodes, "left" / "right" fields) with every
+# collector and measures the traced allocation with tracemalloc
+
+import gc as _pygc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "mark_sweep"))
+sys.path.insert(0, str(ROOT / "reference_counter"))
+
+from ms_gc import MarkSweepGC  # noqa: E402
+from ms_gc_gen import MarkSweepGC as GenMarkSweepGC  # noqa: E402
+from rc_gc import ReferenceCountingGC  # noqa: E402
+
+
+# the layout every collector used before shapes, kept here as the baseline
+@dataclass
+class _OldObj:
+    id: int
+    value: Any = None
+    fields: Dict[str, "_OldRef"] = field(default_factory=dict)
+    marked: bool = False
+    freed: bool = False
+
+
+class _OldRef:
+    def __init__(self, _obj):
+        self._obj = _obj
+
+
+class _OldHeap:
+    def __init__(self):
+        self.heap = {}
+        self._next = 0
+
+    def alloc(self, value=None):
+        self._next += 1
+        obj = _OldObj(id=self._next, value=value)
+        self.heap[obj.id] = obj
+        return _OldRef(obj)
+
+    def set_field(self, parent_ref, name, child_ref):
+        parent_ref._obj.fields[name] = child_ref
+
+
+def build_tree(gc, n):
+    refs = [gc.alloc(None) for _ in range(n)]
+    for i in range(n):
+        left, right = 2 * i + 1, 2 * i + 2
+        if left < n:
+            gc.set_field(refs[i], "left", refs[left])
+        if right < n:
+            gc.set_field(refs[i], "right", refs[right])
+    # the refs list is the "program", not the heap
+    del refs
+    return gc
+
+
+def measure(make, n):
+    _pygc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    gc = build_tree(make(), n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del gc
+    return (after - before) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = [
+        ("old dataclass layout", _OldHeap),
+        ("ms_gc", MarkSweepGC),
+        ("ms_gc_gen", GenMarkSweepGC),
+        ("rc_gc", ReferenceCountingGC),
+    ]
+    baseline = None
+    print(f"{'layout':<22} {'bytes/object':>14} {'vs old':>8}")
+    for name, make in rows:
+        per_obj = measure(make, n)
+        baseline = baseline or per_obj
+        print(f"{name:<22} {per_obj:>14,.1f} {baseline / per_obj:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
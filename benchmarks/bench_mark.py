@@ -0,0 +1,143 @@
+# mark throughput, objects/sec, for the old recursive _mark vs MarkStack,
+# and for the numpy array heap when numpy is installed
+#
+#   python benchmarks/bench_mark.py [n]
+#
+# the recursive version is kept here only as the "before" baseline
+
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "mark_sweep"))
+
+from mark_stack import MarkStack  # noqa: E402
+from ms_gc import MarkSweepGC  # noqa: E402
+
+try:
+    from ms_gc_array import ArrayMarkSweepGC  # noqa: E402
+except ImportError:
+    ArrayMarkSweepGC = None
+
+
+def recursive_mark(obj):
+    # the pre-MarkStack MarkSweepGC._mark (on today's object layout)
+    if obj is None or obj.freed:
+        return
+    if obj.marked:
+        return
+    obj.marked = True
+    for child in obj.slots:
+        recursive_mark(child)
+
+
+def build_chain(n, heap=MarkSweepGC):
+    gc = heap()
+    head = gc.alloc(0)
+    gc.add_root(head)
+    prev = head
+    for i in range(1, n):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    return gc
+
+
+def build_tree(n, heap=MarkSweepGC):
+    # binary tree with n nodes, laid out like a heap array
+    gc = heap()
+    refs = [gc.alloc(i) for i in range(n)]
+    gc.add_root(refs[0])
+    for i in range(n):
+        left, right = 2 * i + 1, 2 * i + 2
+        if left < n:
+            gc.set_field(refs[i], "left", refs[left])
+        if right < n:
+            gc.set_field(refs[i], "right", refs[right])
+    return gc
+
+
+def build_wide(n, heap=MarkSweepGC):
+    # one root with n / 100 children, each with 99 leaves
+    gc = heap()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(n // 100):
+        child = gc.alloc(i)
+        gc.set_field(root, f"c{i}", child)
+        for j in range(99):
+            gc.set_field(child, f"c{j}", gc.alloc(j))
+    return gc
+
+
+def reset(gc):
+    for obj in gc.heap.values():
+        obj.marked = False
+
+
+def time_recursive(gc):
+    reset(gc)
+    roots = [gc.heap[r] for r in gc.roots]
+    start = time.perf_counter()
+    try:
+        for root in roots:
+            recursive_mark(root)
+    except RecursionError:
+        return None
+    return time.perf_counter() - start
+
+
+def time_stack(gc):
+    reset(gc)
+    start = time.perf_counter()
+    stack = MarkStack()
+    for root_id in gc.roots:
+        stack.push(gc.heap[root_id])
+    stack.drain()
+    return time.perf_counter() - start
+
+
+def time_array(gc):
+    start = time.perf_counter()
+    gc._mark()
+    return time.perf_counter() - start
+
+
+def best_of(fn, gc, runs=3):
+    # single runs are too noisy to compare, the best of a few is stable
+    times = [fn(gc) for _ in range(runs)]
+    return None if None in times else min(times)
+
+
+def fmt(n, secs):
+    if secs is None:
+        return "RecursionError"
+    return f"{n / secs:>12,.0f} obj/s"
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    header = f"{'workload':<10} {'objects':>10}  {'recursive':>20}  {'mark stack':>20}"
+    if ArrayMarkSweepGC is not None:
+        header += f"  {'array heap':>20}"
+    print(header)
+    for name, build in (("chain", build_chain), ("tree", build_tree), ("wide", build_wide)):
+        gc = build(n)
+        size = len(gc.heap)
+        before = best_of(time_recursive, gc)
+        after = best_of(time_stack, gc)
+        line = f"{name:<10} {size:>10,}  {fmt(size, before):>20}  {fmt(size, after):>20}"
+        del gc
+
+        if ArrayMarkSweepGC is not None:
+            arr = build(n, ArrayMarkSweepGC)
+            line += f"  {fmt(size, time_array(arr)):>20}"
+            del arr
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# parallel_gc() scaling over worker processes
+#
+#   python benchmarks/bench_parallel.py [n] [workers ...]
+#
+# defaults to a 5M object random graph and 1 / 2 / 4 / 8 workers.
+# numbers only mean something with at least that many free cores.
+# rounds is how many times the parent dealt the frontier out
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "mark_sweep"))
+
+from mark_stack import MarkStack  # noqa: E402
+from ms_gc import MarkSweepGC  # noqa: E402
+import parallel_mark  # noqa: E402
+
+
+def build(n, seed=0):
+    # a wide random tree (every node hangs off an earlier one) plus one
+    # random cross edge per node, and ~10% unreachable garbage
+    rng = random.Random(seed)
+    gc = MarkSweepGC()
+    refs = [gc.alloc(None) for _ in range(n)]
+    gc.add_root(refs[0])
+    live = int(n * 0.9)
+    for i in range(1, n):
+        if i < live:
+            gc.set_field(refs[rng.randrange(i)], f"c{i % 8}", refs[i])
+        gc.set_field(refs[i], "x", refs[rng.randrange(n)])
+    return gc
+
+
+def timed_mark(gc, workers):
+    # time the export + parallel mark only, not the sweep
+    pool = parallel_mark.MarkPool(workers)
+    objs = list(gc.heap.values())
+    roots = [gc.heap[r] for r in gc.roots]
+    try:
+        pool.mark(objs[:1], roots[:0])  # fork the workers outside the timing
+        start = time.perf_counter()
+        marks = pool.mark(objs, roots)
+        return time.perf_counter() - start, sum(marks), pool.rounds
+    finally:
+        pool.close()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    counts = [int(a) for a in sys.argv[2:]] or [1, 2, 4, 8]
+
+    gc = build(n)
+    print(f"objects {n:,}, cpus {os.cpu_count()}")
+
+    # the plain single process mark, for reference, then undo its marks
+    start = time.perf_counter()
+    stack = MarkStack(gc._mark_bit)
+    for root_id in gc.roots:
+        stack.push(gc.heap[root_id])
+    stack.drain()
+    single = time.perf_counter() - start
+    for obj in gc.heap.values():
+        obj.marked = not gc._mark_bit
+    print(f"{'in-process MarkStack':<22} {single:>8.2f} s")
+
+    base = None
+    for workers in counts:
+        secs, live, rounds = timed_mark(gc, workers)
+        base = base or secs
+        print(
+            f"{f'{workers} worker(s)':<22} {secs:>8.2f} s  {base / secs:>5.2f}x  "
+            f"live={live:,}  rounds={rounds}"
+        )
+
+
+if __name__ == "__main__":
+    main()
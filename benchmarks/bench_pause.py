@@ -0,0 +1,109 @@
+# max pause: stop-the-world gc() vs incremental mark_step() slices vs
+# a concurrent (background thread) cycle
+#
+#   python benchmarks/bench_pause.py [n] [step]
+#
+# the mutator keeps rewiring random edges between slices, so the
+# write barrier is part of what gets measured
+
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "mark_sweep"))
+
+from ms_gc import ConcurrentMarkSweepGC, MarkSweepGC  # noqa: E402
+
+
+def build(n, lazy_sweep=False, seed=0, heap=MarkSweepGC):
+    # a 4-ary tree, everything reachable
+    rng = random.Random(seed)
+    gc = heap(lazy_sweep=lazy_sweep)
+    refs = [gc.alloc(i) for i in range(n)]
+    gc.add_root(refs[0])
+    for i in range(1, n):
+        gc.set_field(refs[(i - 1) // 4], f"c{(i - 1) % 4}", refs[i])
+    return gc, refs, rng
+
+
+def mutate(gc, refs, rng, k=10):
+    for _ in range(k):
+        gc.set_field(rng.choice(refs), "x", rng.choice(refs))
+
+
+def stw(n):
+    gc, refs, rng = build(n)
+    mutate(gc, refs, rng)
+    start = time.perf_counter()
+    gc.gc()
+    return time.perf_counter() - start
+
+
+def incremental(n, step, lazy_sweep):
+    gc, refs, rng = build(n, lazy_sweep)
+    pauses = []
+
+    start = time.perf_counter()
+    gc.start_cycle()
+    pauses.append(time.perf_counter() - start)
+
+    done = False
+    while not done:
+        mutate(gc, refs, rng)
+        start = time.perf_counter()
+        done = gc.mark_step(step)
+        pauses.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    gc.finish_cycle()
+    finish = time.perf_counter() - start
+    return pauses, finish
+
+
+def concurrent(n, lazy_sweep):
+    # the mutator runs on this thread while the marker runs in the background,
+    # the worst single set_field is the pause the mutator actually saw
+    gc, refs, rng = build(n, lazy_sweep, heap=ConcurrentMarkSweepGC)
+    worst = 0.0
+    ops = 0
+    start = time.perf_counter()
+    gc.start_concurrent_cycle()
+    while gc._marker is not None:
+        t = time.perf_counter()
+        gc.set_field(rng.choice(refs), "x", rng.choice(refs))
+        worst = max(worst, time.perf_counter() - t)
+        ops += 1
+    return worst, ops, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    ms = 1000
+    print(f"heap objects                  {n:>10,}")
+    print(f"stop-the-world gc()           {stw(n) * ms:>10.2f} ms")
+
+    for lazy_sweep in (False, True):
+        pauses, finish = incremental(n, step, lazy_sweep)
+        sweep = "lazy sweep" if lazy_sweep else "eager sweep"
+        print(f"incremental, {sweep}")
+        print(f"  mark_step({step}) slices    {len(pauses):>10,}")
+        print(f"  max slice                   {max(pauses) * ms:>10.2f} ms")
+        print(f"  total marking               {sum(pauses) * ms:>10.2f} ms")
+        print(f"  finish_cycle()              {finish * ms:>10.2f} ms")
+
+    for lazy_sweep in (False, True):
+        worst, ops, total = concurrent(n, lazy_sweep)
+        sweep = "lazy sweep" if lazy_sweep else "eager sweep"
+        print(f"concurrent, {sweep}")
+        print(f"  cycle wall time             {total * ms:>10.2f} ms")
+        print(f"  mutator ops during cycle    {ops:>10,}")
+        print(f"  worst mutator op            {worst * ms:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
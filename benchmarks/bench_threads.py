@@ -0,0 +1,121 @@
+# mutator contention: alloc / set_field throughput with 1..16 threads
+#
+#   python benchmarks/bench_threads.py [ops per thread] [threads ...]
+#
+# defaults to 20k ops per thread and 1 / 2 / 4 / 8 / 16 threads. every
+# collector runs twice: its ThreadSafe* version (striped locks, per-thread
+# ids and allocation buffers, see gc_common/safepoint.py) and the plain
+# collector behind one global lock, the way ConcurrentMarkSweepGC guards
+# its mutators. the threads collect together at a barrier every _BATCH ops
+#
+# REM: with the GIL both versions take turns and the numbers mostly show
+# the locking overhead. scaling only shows on a free-threaded build
+# (python3.13t), and only with that many free cores
+
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "mark_sweep"))
+sys.path.insert(0, str(ROOT / "reference_counter"))
+
+import ms_gc  # noqa: E402
+import ms_gc_gen  # noqa: E402
+import rc_gc  # noqa: E402
+
+_BATCH = 2000
+
+
+class GlobalLock:
+    # any collector, every call under one lock
+    def __init__(self, gc):
+        self._gc = gc
+        self._lock = threading.Lock()
+
+    def alloc(self, value=None):
+        with self._lock:
+            return self._gc.alloc(value)
+
+    def set_field(self, parent, name, child):
+        with self._lock:
+            self._gc.set_field(parent, name, child)
+
+    def add_root(self, ref):
+        with self._lock:
+            self._gc.add_root(ref)
+
+    def gc(self):
+        with self._lock:
+            self._gc.gc()
+
+
+COLLECTORS = {
+    "ms": (ms_gc.ThreadSafeMarkSweepGC, ms_gc.MarkSweepGC),
+    "gen": (ms_gc_gen.ThreadSafeMarkSweepGC, ms_gc_gen.MarkSweepGC),
+    "rc": (rc_gc.ThreadSafeReferenceCountingGC, rc_gc.ReferenceCountingGC),
+}
+
+
+def churn(gc, ops, k, shared, barrier):
+    # nursery style: short lived pairs under the thread's own holder, 1% of
+    # the stores go to one object all threads share (the same stripe)
+    rng = random.Random(k)
+    holder = gc.alloc(("holder", k))
+    gc.add_root(holder)
+    for i in range(ops):
+        tmp = gc.alloc(i)
+        gc.set_field(tmp, "data", gc.alloc(None))
+        if rng.random() < 0.01:
+            gc.set_field(shared, f"t{k % 8}", tmp)
+        else:
+            gc.set_field(holder, "tmp", tmp)
+        if i % _BATCH == _BATCH - 1:
+            # everything is linked, one thread collects for all of them
+            if barrier.wait() == 0:
+                gc.gc()
+            barrier.wait()
+
+
+def run(gc, threads, ops):
+    shared = gc.alloc("shared")
+    gc.add_root(shared)
+    barrier = threading.Barrier(threads)
+    workers = [
+        threading.Thread(target=churn, args=(gc, ops, k, shared, barrier))
+        for k in range(threads)
+    ]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    gc.gc()
+    return time.perf_counter() - start
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    counts = [int(a) for a in sys.argv[2:]] or [1, 2, 4, 8, 16]
+    free_threaded = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+    print(f"ops per thread {ops:,}, cpus {os.cpu_count()}, free-threaded {free_threaded}")
+    print(f"{'collector':<10}{'threads':>8}{'striped Mops/s':>16}{'global Mops/s':>15}{'scaling':>9}")
+
+    for name, (striped, plain) in COLLECTORS.items():
+        base = None
+        for threads in counts:
+            # 4 calls per op: two allocs, two stores
+            total = 4 * ops * threads
+            fine = total / run(striped(), threads, ops) / 1e6
+            coarse = total / run(GlobalLock(plain()), threads, ops) / 1e6
+            base = base or fine
+            print(f"{name:<10}{threads:>8}{fine:>16.2f}{coarse:>15.2f}{fine / base:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# reproducible gc benchmark suite: the same seeded workloads on every
+# collector, results as json, and a compare step to catch regressions
+#
+#   python -m benchmarks.gcbench run [--size N] [--json out.json] ...
+#   python -m benchmarks.gcbench compare old.json new.json [--threshold 0.1]
+#
+# see workloads.py for what is measured, runner.py for how
@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+
+from .collectors import COLLECTORS
+from .compare import compare, format_rows
+from .runner import format_table, run_suite
+from .workloads import WORKLOADS
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.gcbench")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the suite, print a table")
+    run.add_argument("--size", type=int, default=20_000, help="work per case (~allocations)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--repeat", type=int, default=3, help="timed runs per case, best kept")
+    run.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    run.add_argument("--collectors", nargs="+", choices=list(COLLECTORS), default=list(COLLECTORS))
+    run.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    run.add_argument("--json", help="also write the report here")
+
+    cmp = sub.add_parser("compare", help="compare two json reports")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.1, help="0.1 = 10%% worse")
+    cmp.add_argument("--all", action="store_true", help="also list unchanged metrics")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_suite(
+            args.workloads, args.collectors, args.size, args.seed, args.repeat, not args.no_memory
+        )
+        print(format_table(report))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(old, new, args.threshold)
+    print(format_rows(rows, only_changes=0.0 if args.all else args.threshold))
+    # non zero exit on a regression, so it can gate a ci job
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
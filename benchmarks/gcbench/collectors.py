@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(_ROOT))
+sys.path.insert(0, str(_ROOT / "mark_sweep"))
+sys.path.insert(0, str(_ROOT / "reference_counter"))
+
+import ms_gc  # noqa: E402
+import ms_gc_gen  # noqa: E402
+import ms_gc_ngen  # noqa: E402
+import rc_gc  # noqa: E402
+
+# every collector the suite knows, name -> factory
+# all of them have alloc / set_field / add_root / remove_root / stats(),
+# and gc() (for rc: the cycle collector, plain rc frees everything else as it goes)
+COLLECTORS: Dict[str, Callable[[], Any]] = {
+    "rc": rc_gc.ReferenceCountingGC,
+    "rc-deferred": lambda: rc_gc.ReferenceCountingGC(deferred=True),
+    "rc-coalesced": lambda: rc_gc.ReferenceCountingGC(coalesced=True),
+    "ms": ms_gc.MarkSweepGC,
+    "ms-lazy": lambda: ms_gc.MarkSweepGC(lazy_sweep=True),
+    "gen": ms_gc_gen.MarkSweepGC,
+    "gen-recycle": lambda: ms_gc_gen.MarkSweepGC(recycle=True),
+    "ngen": ms_gc_ngen.NGenMarkSweepGC,
+}
+
+
+def _nothing() -> None:
+    pass
+
+
+def collector_fn(gc: Any) -> Callable[[], None]:
+    # what a workload calls at its collection points
+    return getattr(gc, "gc", _nothing)
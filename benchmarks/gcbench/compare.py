@@ -0,0 +1,78 @@
+from typing import Any, Dict, List, Tuple
+
+# compare two json reports from the same suite, case by case
+#
+# a metric regresses when the new run is worse than the old one by more
+# than `threshold` (0.1 = 10%). timings on a shared machine are noisy,
+# so the default is loose; memory and heap_size are deterministic
+
+# metric -> True if higher is better
+METRICS: Dict[str, bool] = {
+    "wall_s": False,
+    "gc_s": False,
+    "alloc_per_s": True,
+    "pause_p99_us": False,
+    "pause_max_us": False,
+    "peak_bytes": False,
+    "heap_size": False,
+}
+
+
+def _key(result: Dict[str, Any]) -> Tuple[str, str, int]:
+    return result["workload"], result["collector"], result["size"]
+
+
+def compare(
+    old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1
+) -> List[Dict[str, Any]]:
+    # one row per (case, metric) present in both, worse = regression
+    before = {_key(r): r for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        o = before.get(_key(r))
+        if o is None:
+            continue
+        workload, collector, size = _key(r)
+        if "error" in r or "error" in o:
+            if r.get("error") != o.get("error"):
+                rows.append(
+                    dict(workload=workload, collector=collector, size=size,
+                         metric="error", old=o.get("error"), new=r.get("error"),
+                         change=None, regression="error" in r)
+                )
+            continue
+        for metric, higher_better in METRICS.items():
+            if metric not in r or metric not in o:
+                continue
+            a, b = o[metric], r[metric]
+            if a == 0:
+                change = 0.0 if b == 0 else float("inf")
+            else:
+                change = (b - a) / a
+            worse = -change if higher_better else change
+            rows.append(
+                dict(workload=workload, collector=collector, size=size,
+                     metric=metric, old=a, new=b, change=change,
+                     regression=worse > threshold)
+            )
+    return rows
+
+
+def format_rows(rows: List[Dict[str, Any]], only_changes: float = 0.0) -> str:
+    lines = [f"{'workload':<16}{'collector':<10}{'metric':<14}{'old':>14}{'new':>14}{'change':>10}"]
+    for row in rows:
+        change = row["change"]
+        if change is not None and abs(change) < only_changes and not row["regression"]:
+            continue
+        mark = "  REGRESSION" if row["regression"] else ""
+        if change is None:
+            lines.append(
+                f"{row['workload']:<16}{row['collector']:<10}{row['metric']:<14}"
+                f"{str(row['old']):>14}{str(row['new']):>14}{'':>10}{mark}"
+            )
+            continue
+        lines.append(
+            f"{row['workload']:<16}{row['collector']:<10}{row['metric']:<14}"
+            f"{row['old']:>14.4g}{row['new']:>14.4g}{change:>+10.1%}{mark}"
+        )
+    return "\n".join(lines)
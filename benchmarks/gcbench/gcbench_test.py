@@ -0,0 +1,65 @@
+import json
+
+from .__main__ import main
+from .collectors import COLLECTORS
+from .compare import compare, format_rows
+from .runner import format_table, run_case, run_suite
+from .workloads import WORKLOADS
+
+
+# smoke tests: every workload on every collector at a tiny size, and the
+# json -> compare path the ci gate uses. the numbers themselves are not
+# checked, only that the suite runs and the report holds together
+
+
+def test_every_case_runs():
+    report = run_suite(WORKLOADS, COLLECTORS, 300, repeat=1, memory=False, progress=False)
+    results = report["results"]
+    assert len(results) == len(WORKLOADS) * len(COLLECTORS)
+    for r in results:
+        assert "error" not in r, r
+        assert r["allocated"] == r["freed"] + r["heap_size"]
+    table = format_table(report)
+    assert len(table.splitlines()) == len(results) + 1
+
+
+def test_random_graph_leaves_nothing_behind():
+    # every node is held by an edge or a root before anything is dropped,
+    # so even plain rc (with its cycle collector) frees the whole graph
+    for collector in ("rc", "ms"):
+        r = run_case("random_graph", collector, 2000, repeat=1, memory=False)
+        assert r["heap_size"] == 0, collector
+
+
+def test_peak_memory():
+    r = run_case("linked_list", "ms", 300, repeat=1)
+    assert r["peak_bytes"] > 0
+
+
+def test_compare_flags_regressions():
+    old = run_suite(["cyclic_garbage"], ["rc", "ms"], 300, repeat=1, memory=False, progress=False)
+    assert not any(row["regression"] for row in compare(old, old))
+
+    new = json.loads(json.dumps(old))
+    new["results"][0]["heap_size"] += 100  # rc leaks more
+    new["results"][1]["error"] = "RecursionError: boom"
+    rows = compare(old, new)
+    flagged = {(row["collector"], row["metric"]) for row in rows if row["regression"]}
+    assert flagged == {("rc", "heap_size"), ("ms", "error")}
+    assert "REGRESSION" in format_rows(rows)
+
+
+def test_cli_run_and_compare(tmp_path, capsys):
+    path = str(tmp_path / "report.json")
+    args = ["--size", "200", "--repeat", "1", "--no-memory", "--json", path]
+    assert main(["run", "--workloads", "linked_list", "--collectors", "ms", *args]) == 0
+    assert main(["compare", path, path]) == 0
+
+    with open(path) as f:
+        report = json.load(f)
+    report["results"][0]["heap_size"] += 1
+    worse = str(tmp_path / "worse.json")
+    with open(worse, "w") as f:
+        json.dump(report, f)
+    assert main(["compare", path, worse]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
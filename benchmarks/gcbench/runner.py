@@ -0,0 +1,138 @@
+from random import Random
+from time import perf_counter
+from typing import Any, Dict, Iterable, List
+import gc as python_gc
+import platform
+import sys
+import tracemalloc
+
+from .collectors import COLLECTORS, collector_fn
+from .workloads import WORKLOADS
+
+# one case = one workload on one collector at one size
+#
+# timing runs: best of `repeat` (by wall time), python's own cyclic gc is
+# off so it does not land in the middle of our numbers. the pause numbers
+# come from the collector's stats() (see gc_common/gc_stats.py)
+#
+# peak memory is a separate run under tracemalloc, which slows everything
+# down several times, so it never overlaps with a timed run
+#
+# REM: rc's "gc time" is only its free cascades, single frees are part of
+# the mutator time (see rc_gc.py _decref)
+
+
+def _run_once(workload: str, collector: str, n: int, seed: int) -> Any:
+    gc = COLLECTORS[collector]()
+    try:
+        WORKLOADS[workload](gc, n, Random(seed), collector_fn(gc))
+    finally:
+        close = getattr(gc, "close", None)
+        if close is not None:
+            close()
+    return gc
+
+
+def run_case(
+    workload: str, collector: str, n: int, seed: int = 0, repeat: int = 3, memory: bool = True
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"workload": workload, "collector": collector, "size": n}
+    best = None
+    python_gc.disable()
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            gc = _run_once(workload, collector, n, seed)
+            wall = perf_counter() - start
+            if best is None or wall < best[0]:
+                best = (wall, gc.stats())
+            del gc
+    except Exception as exc:  # RecursionError on deep structures, mostly
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        return result
+    finally:
+        python_gc.enable()
+
+    wall, stats = best
+    pauses = stats.pauses
+    gc_s = pauses.total_ns / 1e9
+    mutator = max(wall - gc_s, 1e-9)
+    result.update(
+        wall_s=wall,
+        gc_s=gc_s,
+        alloc_per_s=stats.allocated / mutator,
+        allocated=stats.allocated,
+        freed=stats.freed,
+        heap_size=stats.heap_size,
+        pauses=pauses.count,
+        pause_p50_us=pauses.percentile(50) / 1e3,
+        pause_p99_us=pauses.percentile(99) / 1e3,
+        pause_max_us=pauses.max_ns / 1e3,
+    )
+
+    if memory:
+        tracemalloc.start()
+        try:
+            _run_once(workload, collector, n, seed)
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_suite(
+    workloads: Iterable[str],
+    collectors: Iterable[str],
+    n: int,
+    seed: int = 0,
+    repeat: int = 3,
+    memory: bool = True,
+    progress: bool = True,
+) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    collectors = list(collectors)
+    for workload in workloads:
+        for collector in collectors:
+            if progress:
+                print(f"  {workload:<16}{collector:<10}", end="", flush=True, file=sys.stderr)
+            result = run_case(workload, collector, n, seed, repeat, memory)
+            if progress:
+                done = result.get("error") or f"{result['wall_s'] * 1e3:.1f} ms"
+                print(done, file=sys.stderr)
+            results.append(result)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "size": n,
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    lines = [
+        f"{'workload':<16}{'collector':<10}{'wall ms':>10}{'gc ms':>10}"
+        f"{'allocs/s':>12}{'p50 us':>10}{'p99 us':>10}{'max us':>10}"
+        f"{'peak KiB':>10}{'left':>8}"
+    ]
+    for r in report["results"]:
+        head = f"{r['workload']:<16}{r['collector']:<10}"
+        if "error" in r:
+            lines.append(head + f"  {r['error']}")
+            continue
+        peak = r.get("peak_bytes")
+        peak = f"{peak / 1024:>10.0f}" if peak is not None else f"{'-':>10}"
+        lines.append(
+            head
+            + f"{r['wall_s'] * 1e3:>10.1f}{r['gc_s'] * 1e3:>10.1f}"
+            + f"{r['alloc_per_s']:>12,.0f}{r['pause_p50_us']:>10.0f}"
+            + f"{r['pause_p99_us']:>10.0f}{r['pause_max_us']:>10.0f}"
+            + peak
+            + f"{r['heap_size']:>8}"
+        )
+    return "\n".join(lines)
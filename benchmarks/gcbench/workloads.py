@@ -0,0 +1,173 @@
+from random import Random
+from typing import Any, Callable, Dict
+
+# synthetic workloads, each one is
+#
+#   fn(gc, n, rng, collect)
+#
+# n scales the work (roughly the number of allocations), rng is seeded by
+# the runner so every collector sees exactly the same program, and
+# collect() is called at the points where a program would let the
+# collector run (gc.gc())
+#
+# garbage is always made by dropping the last edge or root to it, never by
+# just forgetting an ObjectRef, so rc gets to free it too. whatever a
+# collector could not free shows up as a bigger heap_size in the results
+
+# collect() roughly every this many allocations
+_BATCH = 1000
+
+Workload = Callable[[Any, int, Random, Callable[[], None]], None]
+
+
+def linked_list(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # one long list under a root, collected while live, then dropped whole
+    # (deep: recursive marking or freeing would blow the stack here)
+    head = gc.alloc(0)
+    gc.add_root(head)
+    prev = head
+    for i in range(1, n):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+        if i % _BATCH == 0:
+            collect()
+    collect()
+    gc.remove_root(head)
+    collect()
+
+
+def _tree(gc: Any, depth: int) -> Any:
+    node = gc.alloc(depth)
+    if depth > 0:
+        gc.set_field(node, "left", _tree(gc, depth - 1))
+        gc.set_field(node, "right", _tree(gc, depth - 1))
+    return node
+
+
+def binary_trees(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # gcbench (boehm) style: one long lived tree of about n / 2 nodes, and
+    # short lived trees of growing depth, about n / 2 nodes per depth
+    depth = max(n.bit_length() - 2, 4)
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    gc.set_field(holder, "long", _tree(gc, depth))
+    collect()
+
+    allocated = 0
+    for d in range(4, depth + 1, 2):
+        for _ in range(max(2 ** (depth - d), 1)):
+            gc.set_field(holder, "tmp", _tree(gc, d))
+            allocated += 2 ** (d + 1) - 1
+            if allocated >= _BATCH:
+                collect()
+                allocated = 0
+    gc.set_field(holder, "tmp", None)
+    collect()
+
+
+def random_graph(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # n nodes, 3 random out edges each, 1% of them roots, plus every node
+    # no edge points at (~5%, it would otherwise be garbage by just being
+    # forgotten). the roots are then dropped one by one, the graph dies in
+    # irregular chunks (and partly stays for rc: random edges make plenty
+    # of cycles)
+    nodes = [gc.alloc(i) for i in range(n)]
+    first = n // 100 + 1
+    pointed = [False] * n
+    for node in nodes:
+        for k in range(3):
+            j = rng.randrange(n)
+            gc.set_field(node, f"e{k}", nodes[j])
+            pointed[j] = True
+    roots = nodes[:first] + [nodes[j] for j in range(first, n) if not pointed[j]]
+    for root in roots:
+        gc.add_root(root)
+    del nodes
+    collect()
+
+    for i, root in enumerate(roots):
+        gc.remove_root(root)
+        if i % 10 == 9:
+            collect()
+    collect()
+
+
+def cyclic_garbage(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # small rings (3 to 6 objects) hung off a root and replaced right away:
+    # every ring is garbage, and a cycle. rc leaks all of it
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    allocated = 0
+    while allocated < n:
+        size = rng.randint(3, 6)
+        ring = [gc.alloc(i) for i in range(size)]
+        for i in range(size):
+            gc.set_field(ring[i], "next", ring[(i + 1) % size])
+        gc.set_field(holder, "ring", ring[0])
+        allocated += size
+        if allocated % _BATCH < size:
+            collect()
+    gc.set_field(holder, "ring", None)
+    collect()
+
+
+def nursery_churn(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # the generational hypothesis: almost everything dies right away,
+    # 1% survives for a while in one of 64 long lived slots
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    for i in range(n // 2):
+        tmp = gc.alloc(i)
+        gc.set_field(tmp, "data", gc.alloc(None))
+        if rng.random() < 0.01:
+            gc.set_field(holder, f"keep{rng.randrange(64)}", tmp)
+        else:
+            gc.set_field(holder, "tmp", tmp)
+        if i % (_BATCH // 2) == 0:
+            collect()
+    gc.set_field(holder, "tmp", None)
+    collect()
+
+
+def lru_cache(gc: Any, n: int, rng: Random, collect: Callable[[], None]) -> None:
+    # a long lived cache of n / 10 entries (entry -> payload), constantly
+    # replaced and mutated in place: old objects keep pointing at new ones
+    size = max(n // 10, 1)
+    cache = gc.alloc("cache")
+    gc.add_root(cache)
+    entries = []
+    for k in range(size):
+        entry = gc.alloc(k)
+        gc.set_field(entry, "payload", gc.alloc(None))
+        gc.set_field(cache, f"k{k}", entry)
+        entries.append(entry)
+    collect()
+
+    allocated = 2 * size
+    while allocated < n:
+        k = rng.randrange(size)
+        if rng.random() < 0.5:
+            # replace the whole entry
+            entry = gc.alloc(k)
+            gc.set_field(entry, "payload", gc.alloc(None))
+            gc.set_field(cache, f"k{k}", entry)
+            entries[k] = entry
+            allocated += 2
+        else:
+            # update it in place, an old -> young edge once entries are old
+            gc.set_field(entries[k], "payload", gc.alloc(None))
+            allocated += 1
+        if allocated % _BATCH < 2:
+            collect()
+    collect()
+
+
+WORKLOADS: Dict[str, Workload] = {
+    "linked_list": linked_list,
+    "binary_trees": binary_trees,
+    "random_graph": random_graph,
+    "cyclic_garbage": cyclic_garbage,
+    "nursery_churn": nursery_churn,
+    "lru_cache": lru_cache,
+}
@@ -0,0 +1,8 @@
+# the parts every collector shares: stats and pause histograms (gc_stats),
+# the binary heap dump format (heap_dump), stop-the-world safepoints and
+# thread local ids (safepoint), weak refs and the finalizer queue (finalize)
+#
+# mark_sweep/ and reference_counter/ are flat script directories that
+# import this as gc_common.*, with the repo root on sys.path: pytest puts
+# it there (pyproject.toml), the benchmarks do it themselves, and a test
+# file run on its own needs PYTHONPATH=.
@@ -0,0 +1,119 @@
+from collections import deque
+from typing import Any, Callable, Deque, Iterable, Optional, Tuple
+import sys
+import threading
+
+# weak references and finalizers, shared by the collectors
+#
+#   wr = gc.weakref(ref)          wr.get() / wr() -> the ObjectRef, or None
+#                                 once the target is collected
+#   gc.finalize(ref, fn, *args)   fn(*args) after ref's object is collected
+#   gc.finalizers.run(64)         run up to 64 queued finalizers
+#   gc.finalizers.start()         ... or let a worker thread run them
+#
+# a weak ref is not an edge, marking and counting never see it. it asks
+# the collector (_get_obj) whether its target is still there, so a dead
+# target reads as gone even before the sweep got to it (lazy sweep ...)
+#
+# finalizers never run inside a pause: the collector only moves the
+# (fn, args) of every dead finalizable object onto the queue, which costs
+# a dict lookup per freed object, and only while any finalizer is
+# registered. whoever drains the queue runs them later, in batches.
+# like weakref.finalize, args must not hold the object itself (it is dead
+# by then), and an exception in one goes to sys.excepthook and does not
+# stop the others
+
+Finalizer = Tuple[Callable[..., Any], tuple]
+
+
+class WeakRef:
+    __slots__ = ("_gc", "_ref")
+
+    def __init__(self, gc: Any, ref: Any):
+        self._gc = gc
+        self._ref = ref
+
+    def get(self) -> Optional[Any]:
+        ref = self._ref
+        if ref is None:
+            return None
+        obj = self._gc._get_obj(ref)
+        if obj is None or obj.freed:
+            # cleared for good, the dead shell can go
+            self._ref = None
+            return None
+        return ref
+
+    __call__ = get
+
+    def __repr__(self):
+        ref = self.get()
+        return "WeakRef(dead)" if ref is None else f"WeakRef(#{ref._obj.id})"
+
+
+class FinalizerQueue:
+    def __init__(self):
+        self._items: Deque[Finalizer] = deque()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.ran = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, finalizers: Iterable[Finalizer]) -> None:
+        # called by the collector, inside the pause: no finalizer runs here
+        self._items.extend(finalizers)
+        if self._thread is not None:
+            self._wake.set()
+
+    def run(self, max_count: Optional[int] = None) -> int:
+        # run up to max_count queued finalizers (all for None), oldest
+        # first, returns how many ran. safe from several threads at once
+        items = self._items
+        ran = 0
+        while max_count is None or ran < max_count:
+            try:
+                fn, args = items.popleft()
+            except IndexError:
+                break
+            ran += 1
+            try:
+                fn(*args)
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+        self.ran += ran
+        return ran
+
+    def start(self, batch: int = 64) -> None:
+        # a daemon thread drains the queue whenever a collection fills it,
+        # `batch` finalizers at a time
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._work, args=(batch,), daemon=True)
+        self._thread.start()
+        if self._items:
+            self._wake.set()
+
+    def _work(self, batch: int) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopping:
+                return
+            while self.run(batch):
+                if self._stopping:
+                    return
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        # stop the worker thread, what is still queued stays queued
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
@@ -0,0 +1,171 @@
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+# collector statistics, cheap enough to leave on
+#
+# nothing is counted per allocation: the heap only changes through alloc and
+# free, so allocated = heap_size + freed, and the collectors fill those two
+# in when stats() is asked for. freed is added in bulk by the sweeps.
+# the rest is per collection: a couple of perf_counter_ns() calls per phase
+# and one histogram update per pause
+#
+#   s = gc.stats()
+#   s.allocated, s.freed, s.heap_size, s.collections["minor"]
+#   s.phase_ns["mark"], s.pauses.percentile(99), s.pauses.max_ns
+#   s.callbacks.append(lambda kind, pause_ns, phases: ...)
+
+# hdr style buckets: every power of two range is split into 2**_SUB_BITS
+# linear buckets, so a bucket is at most 1/16 (~6%) wide
+_SUB_BITS = 4
+
+
+class PauseHistogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        # keys grow with the value: (shift, top bits) packed in one int
+        shift = ns.bit_length() - _SUB_BITS - 1
+        key = (shift << (_SUB_BITS + 1)) | (ns >> shift) if shift > 0 else ns
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p: float) -> int:
+        # upper end of the bucket holding the p-th percentile, in ns
+        if not self.count:
+            return 0
+        want = p / 100 * self.count
+        seen = 0
+        mask = (1 << (_SUB_BITS + 1)) - 1
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= want:
+                shift = key >> (_SUB_BITS + 1)
+                top = key & mask
+                return min(((top + 1) << shift) - 1, self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "count": self.count,
+            "p50_ns": self.percentile(50),
+            "p99_ns": self.percentile(99),
+            "max_ns": self.max_ns,
+        }
+
+
+class _Pause:
+    __slots__ = ("stats", "kind", "start")
+
+    def __init__(self, stats: "GCStats", kind: str):
+        self.stats = stats
+        self.kind = kind
+
+    def __enter__(self) -> None:
+        stats = self.stats
+        stats.in_pause = True
+        stats._phases = {}
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc) -> None:
+        ns = perf_counter_ns() - self.start
+        stats = self.stats
+        stats.in_pause = False
+        stats._record(self.kind, ns)
+
+
+class _Phase:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats: "GCStats", name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc) -> None:
+        ns = perf_counter_ns() - self.start
+        stats = self.stats
+        stats.phase_ns[self.name] = stats.phase_ns.get(self.name, 0) + ns
+        stats._phases[self.name] = stats._phases.get(self.name, 0) + ns
+
+
+class _Nested:
+    # a pause inside a pause (gc() -> start_cycle() -> ...) is part of the
+    # outer one: counted in collections, but not timed again
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NESTED = _Nested()
+
+
+class GCStats:
+    def __init__(self):
+        self.allocated = 0
+        self.freed = 0
+        self.heap_size = 0
+        # kind ("gc", "minor", "full", "sweep_step" ...) -> how many ran,
+        # nested ones included
+        self.collections: Dict[str, int] = {}
+        # phase ("mark", "sweep", "copy", "remembered" ...) -> total ns
+        self.phase_ns: Dict[str, int] = {}
+        self.pauses = PauseHistogram()
+        # called after every pause as fn(kind, pause_ns, phases)
+        self.callbacks: List[Callable[[str, int, Dict[str, int]], Any]] = []
+        self.in_pause = False
+        self._phases: Dict[str, int] = {}
+
+    def pause(self, kind: str):
+        # with stats.pause("gc"): ... one stop-the-world pause
+        self.collections[kind] = self.collections.get(kind, 0) + 1
+        return _NESTED if self.in_pause else _Pause(self, kind)
+
+    def phase(self, name: str) -> _Phase:
+        # with stats.phase("mark"): ... inside a pause
+        return _Phase(self, name)
+
+    def _record(self, kind: str, ns: int) -> None:
+        self.pauses.record(ns)
+        if self.callbacks:
+            phases = self._phases
+            for fn in self.callbacks:
+                fn(kind, ns, phases)
+
+    def add_pause(self, kind: str, ns: int, phase: Optional[str] = None) -> None:
+        # a pause timed by the caller (all of it in `phase`), for frequent
+        # tiny pauses (lazy sweep steps, rc free cascades) where two context
+        # managers would cost more than the pause itself
+        self.collections[kind] = self.collections.get(kind, 0) + 1
+        if phase is not None:
+            self.phase_ns[phase] = self.phase_ns.get(phase, 0) + ns
+        if self.in_pause:
+            # inside a bigger pause, it only adds to that one's phases
+            if phase is not None:
+                self._phases[phase] = self._phases.get(phase, 0) + ns
+            return
+        self._phases = {} if phase is None else {phase: ns}
+        self._record(kind, ns)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "allocated": self.allocated,
+            "freed": self.freed,
+            "heap_size": self.heap_size,
+            "collections": dict(self.collections),
+            "phase_ns": dict(self.phase_ns),
+            "pauses": self.pauses.summary(),
+        }
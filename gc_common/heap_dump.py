@@ -0,0 +1,131 @@
+from mmap import ACCESS_READ, mmap
+from typing import Any, Iterable, Iterator, List, NamedTuple, Tuple
+import pickle
+import struct
+
+# binary heap dump, written one object at a time: dumping never holds more
+# than one record in memory, unlike heap_snapshot() which sorts the whole
+# heap and joins one giant string of reprs
+#
+# layout, little endian:
+#   header   b"GCDUMP\x01\x00", u32 root count, root ids (i64 each)
+#   records, each starting with a tag byte:
+#     b"N"   field name: u32 length + utf8, gets the next name index
+#     b"O"   object: i64 id, u8 generation, u8 age, i64 refcount,
+#            u32 edge count, u32 value length,
+#            then the edges (u32 name index, i64 child id each)
+#            and the pickled value
+#     b"E"   end of dump
+#
+# a field name is written once, before the first object that uses it
+
+MAGIC = b"GCDUMP\x01\x00"
+
+_U32 = struct.Struct("<I")
+_OBJ = struct.Struct("<qBBqII")
+_EDGE = struct.Struct("<Iq")
+
+
+class HeapRecord(NamedTuple):
+    id: int
+    value: Any
+    generation: int = 0
+    age: int = 0
+    refcount: int = 0
+    # (field name, child id), None fields left out
+    edges: List[Tuple[str, int]] = []
+
+
+def write_dump(path: str, roots: Iterable[int], records: Iterable[HeapRecord]) -> int:
+    # returns the number of objects written
+    names = {}
+    count = 0
+    dumps = pickle.dumps
+    pack_obj = _OBJ.pack
+    pack_edge = _EDGE.pack
+    with open(path, "wb") as f:
+        write = f.write
+        roots = list(roots)
+        write(MAGIC)
+        write(_U32.pack(len(roots)))
+        write(struct.pack(f"<{len(roots)}q", *roots))
+
+        for oid, value, gen, age, rc, edges in records:
+            parts = []
+            for name, child in edges:
+                i = names.get(name)
+                if i is None:
+                    i = names[name] = len(names)
+                    raw = name.encode()
+                    write(b"N" + _U32.pack(len(raw)) + raw)
+                parts.append(pack_edge(i, child))
+
+            value = dumps(value, pickle.HIGHEST_PROTOCOL)
+            write(b"O" + pack_obj(oid, gen, age, rc, len(edges), len(value)))
+            if parts:
+                write(b"".join(parts))
+            write(value)
+            count += 1
+
+        write(b"E")
+    return count
+
+
+class HeapDump:
+    # reads a dump back through mmap, records are decoded one at a time
+    # as they are iterated, the file is never read in one piece
+    #
+    #   with HeapDump(path) as dump:
+    #       dump.roots
+    #       for rec in dump: ...
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a heap dump.")
+
+        pos = len(MAGIC)
+        (n,) = _U32.unpack_from(self._map, pos)
+        pos += _U32.size
+        self.roots: List[int] = list(struct.unpack_from(f"<{n}q", self._map, pos))
+        self._start = pos + 8 * n
+
+    def __iter__(self) -> Iterator[HeapRecord]:
+        buf = self._map
+        pos = self._start
+        names: List[str] = []
+        while True:
+            tag = buf[pos : pos + 1]
+            pos += 1
+            if tag == b"O":
+                oid, gen, age, rc, n_edges, n_value = _OBJ.unpack_from(buf, pos)
+                pos += _OBJ.size
+                edges = []
+                for _ in range(n_edges):
+                    name, child = _EDGE.unpack_from(buf, pos)
+                    pos += _EDGE.size
+                    edges.append((names[name], child))
+                value = pickle.loads(buf[pos : pos + n_value])
+                pos += n_value
+                yield HeapRecord(oid, value, gen, age, rc, edges)
+            elif tag == b"N":
+                (n,) = _U32.unpack_from(buf, pos)
+                pos += _U32.size
+                names.append(buf[pos : pos + n].decode())
+                pos += n
+            elif tag == b"E":
+                return
+            else:
+                raise ValueError(f"corrupt heap dump at offset {pos - 1}.")
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "HeapDump":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,167 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# objects used to be a dataclass, each with its own __dict__ and its own
+# fields dict repeating the same keys ("left", "next", "child") over and over.
+# now the field NAMES live in a Shape (a hidden class, like V8 / PyPy maps)
+# shared by every object that got the same fields in the same order, and the
+# object itself only keeps a flat list of children, slots[i] <-> shape.names[i]
+#
+# every collector's _Obj is a HeapObject plus its own bookkeeping (mark bit,
+# generation, refcount ...) and its own repr. the set_fields_bulk helpers at
+# the bottom work on that layout too
+
+# shapes with more fields than this stop being shared: the object gets its own
+# shape that grows in place ("dictionary mode"), otherwise every extra field
+# would create yet another shape with yet another index dict
+MAX_SHARED_FIELDS = 32
+
+
+class Shape:
+    __slots__ = ("names", "index", "transitions")
+
+    def __init__(self, names: List[str], shared: bool = True):
+        self.names = names
+        self.index: Dict[str, int] = {n: i for i, n in enumerate(names)}
+        # field name -> next shape, None for an unshared shape
+        self.transitions: Optional[Dict[str, "Shape"]] = {} if shared else None
+
+    def add(self, name: str) -> "Shape":
+        if self.transitions is None:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            return self
+
+        nxt = self.transitions.get(name)
+        if nxt is None:
+            names = self.names + [name]
+            if len(names) > MAX_SHARED_FIELDS:
+                return Shape(names, shared=False)
+            nxt = Shape(names)
+            self.transitions[name] = nxt
+        return nxt
+
+
+EMPTY_SHAPE = Shape([])
+NO_SLOTS = ()  # shared by objects that never had a field
+
+
+def as_list(items: Iterable[Any]) -> List[Any]:
+    # numpy arrays (anything with tolist()) become lists of plain python
+    # ints / strs / values, without importing numpy here
+    tolist = getattr(items, "tolist", None)
+    return tolist() if tolist is not None else list(items)
+
+
+class HeapObject:
+    # subclasses set every slot in their own __init__, no super() call on
+    # the alloc path. ref_type is the collector's ObjectRef, for fields
+    __slots__ = ("id", "value", "shape", "slots", "freed")
+    ref_type: Any = None
+
+    def get(self, name: str) -> Optional["HeapObject"]:
+        i = self.shape.index.get(name)
+        return None if i is None else self.slots[i]
+
+    def put(self, name: str, child: Optional["HeapObject"]) -> None:
+        # deleting a field keeps its slot (set to None), so the shape stays shared
+        i = self.shape.index.get(name)
+        if i is not None:
+            self.slots[i] = child
+        elif child is not None:
+            self.shape = self.shape.add(name)
+            if self.slots:
+                self.slots.append(child)
+            else:
+                self.slots = [child]
+
+    def clear(self) -> None:
+        self.shape = EMPTY_SHAPE
+        self.slots = NO_SLOTS
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        # old style name -> ObjectRef view, built on demand (debugging only)
+        ref = self.ref_type
+        return {n: ref(c) for n, c in zip(self.shape.names, self.slots) if c is not None}
+
+    def field_list(self) -> List[str]:
+        # ["name -> #id", ...] for the reprs and snapshots
+        return [
+            f"{n} -> #{c.id}" for n, c in zip(self.shape.names, self.slots) if c is not None
+        ]
+
+
+# set_fields_bulk, the parts every collector does the same way
+
+
+def resolve_many(
+    items: Iterable[Any],
+    find: Callable[[Any], Optional[HeapObject]],
+    get_obj: Callable[[Any], Optional[HeapObject]],
+    ref_type: type,
+    parents: bool = False,
+    find_more: Optional[Callable[[Any], Optional[HeapObject]]] = None,
+) -> List[Optional[HeapObject]]:
+    # ObjectRefs, ids (0 = None) or None, as set_fields_bulk takes them.
+    # find is id -> object for the fast path, find_more where else an id may
+    # live (the old generation), get_obj the collector's ObjectRef check
+    items = as_list(items)
+    # ids in one go (all() is a cheap "no None in there"), then fix up
+    # whatever find() did not know
+    objs = list(map(find, items))
+    if all(objs):
+        return objs
+    for i, obj in enumerate(objs):
+        if obj is None:
+            item = items[i]
+            if isinstance(item, ref_type):
+                obj = objs[i] = get_obj(item)
+                if not parents or not obj.freed:
+                    continue
+            elif item is None or item == 0:
+                if not parents:
+                    continue
+            else:
+                if find_more is not None:
+                    obj = objs[i] = find_more(item)
+                    if obj is not None:
+                        continue
+                raise RuntimeError(f"no object with id {item}.")
+            raise RuntimeError("setting field on freed or non existent parent.")
+    return objs
+
+
+def bulk_edges(
+    parents: Iterable[Any],
+    names: Union[str, Iterable[str]],
+    children: Iterable[Any],
+    resolve: Callable[..., List[Optional[HeapObject]]],
+) -> Tuple[List[HeapObject], Sequence[str], List[Optional[HeapObject]]]:
+    # checked before anything is written: a bad batch changes nothing
+    parents = resolve(parents, parents=True)
+    children = resolve(children)
+    names = [names] * len(parents) if isinstance(names, str) else as_list(names)
+    if not len(parents) == len(names) == len(children):
+        raise ValueError("parents, names and children differ in length.")
+    return parents, names, children
+
+
+def put_many(
+    parents: List[HeapObject], names: Sequence[str], children: List[Optional[HeapObject]]
+) -> None:
+    # put() for every edge, inlined down to the shape transition for a new field
+    for parent, name, child in zip(parents, names, children):
+        shape = parent.shape
+        i = shape.index.get(name)
+        if i is not None:
+            parent.slots[i] = child
+        elif child is not None:
+            nxt = shape.transitions.get(name) if shape.transitions is not None else None
+            if nxt is None:
+                parent.put(name, child)
+            else:
+                parent.shape = nxt
+                if parent.slots:
+                    parent.slots.append(child)
+                else:
+                    parent.slots = [child]
@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+import threading
+import time
+
+# the pieces the thread-safe collectors (ThreadSafe*GC) are made of
+#
+# Safepoint: stop-the-world without a global mutator lock. every mutator
+# operation (alloc, set_field, ...) runs between enter() and leave(), which
+# is one counter on a per-thread record and one read of a shared flag, so
+# mutators never wait on each other here. stop_world() raises the flag and
+# waits until no other thread is inside an operation, a thread that finds
+# the flag up on enter() parks until resume_world()
+#
+# the per-thread record also holds the thread's allocation buffer: new
+# objects go there (id -> obj) instead of into the shared heap dict, and
+# the collector moves every buffer into the heap once the world is stopped
+#
+# ThreadIds: object ids handed out in per-thread chunks, the shared lock is
+# taken once per _ID_CHUNK ids
+#
+# stripes(): a fixed set of locks, an object is covered by
+# locks[obj.id & STRIPE_MASK]. field writes lock their parent's stripe,
+# two threads only contend when they write objects on the same stripe
+#
+# REM: the flag handshake relies on the interpreter not reordering plain
+# attribute stores and loads (cpython does not, with or without the GIL):
+# a mutator sets its depth and then reads the flag, the collector sets the
+# flag and then reads the depths, so at least one of them sees the other
+
+_ID_CHUNK = 1024
+_STRIPES = 64
+STRIPE_MASK = _STRIPES - 1
+
+
+class _Mutator:
+    __slots__ = ("depth", "allocated")
+
+    def __init__(self):
+        # > 0 while the thread is inside an operation (nested ones count)
+        self.depth = 0
+        self.allocated: Dict[int, Any] = {}
+
+
+class Safepoint:
+    def __init__(self):
+        self._local = threading.local()
+        self._mutators: List[_Mutator] = []
+        self._register = threading.Lock()
+        # one stop-the-world at a time, the thread holding it can nest
+        # more (gc() -> minor_gc() ...)
+        self._collector = threading.Lock()
+        self._stopper = None
+        self._stops = 0
+        self._stopped = False
+        self._resume = threading.Event()
+        self._resume.set()
+
+    def mutator(self) -> _Mutator:
+        # this thread's record, registered on first use
+        try:
+            return self._local.mutator
+        except AttributeError:
+            m = self._local.mutator = _Mutator()
+            with self._register:
+                self._mutators.append(m)
+            return m
+
+    def enter(self) -> _Mutator:
+        # start a mutator operation, pair with leave(m) in a finally
+        m = self.mutator()
+        if m.depth:
+            # nested, or the thread that stopped the world: already counted
+            m.depth += 1
+            return m
+        while True:
+            m.depth = 1
+            if not self._stopped:
+                return m
+            m.depth = 0
+            self._resume.wait()
+
+    @staticmethod
+    def leave(m: _Mutator) -> None:
+        m.depth -= 1
+
+    def stop_world(self) -> None:
+        me = self.mutator()
+        if self._stopper is me:
+            self._stops += 1
+            return
+        if me.depth:
+            # waiting here while inside an operation would deadlock against
+            # another thread stopping the world (it waits for us to leave)
+            raise RuntimeError("stop_world() from inside a mutator operation.")
+        self._collector.acquire()
+        self._stopper = me
+        self._stops = 1
+        me.depth = 1  # our own operations from here on just nest
+        self._resume.clear()
+        self._stopped = True
+        for m in list(self._mutators):
+            # operations are short, yield until each thread is out of its own
+            while m.depth and m is not me:
+                time.sleep(0)
+
+    def resume_world(self) -> None:
+        self._stops -= 1
+        if self._stops:
+            return
+        self._stopper.depth = 0
+        self._stopper = None
+        self._stopped = False
+        self._resume.set()
+        self._collector.release()
+
+    @contextmanager
+    def stopped(self) -> Iterator[None]:
+        # with safepoint.stopped(): ... only this thread runs collector code
+        self.stop_world()
+        try:
+            yield
+        finally:
+            self.resume_world()
+
+    def flush(self, heap: Dict[int, Any]) -> None:
+        # move every thread's allocation buffer into `heap`, world stopped
+        for m in list(self._mutators):
+            if m.allocated:
+                heap.update(m.allocated)
+                m.allocated.clear()
+
+
+class ThreadIds:
+    # drop-in for itertools.count(start): next(ids)
+    def __init__(self, start: int = 1, chunk: int = _ID_CHUNK):
+        self._top = start
+        self._chunk = chunk
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __iter__(self) -> "ThreadIds":
+        return self
+
+    def __next__(self) -> int:
+        local = self._local
+        try:
+            oid = local.next
+            if oid < local.end:
+                local.next = oid + 1
+                return oid
+        except AttributeError:
+            pass
+        first = self.take(self._chunk)
+        local.next = first + 1
+        local.end = first + self._chunk
+        return first
+
+    def take(self, n: int) -> int:
+        # reserve n consecutive ids, returns the first one
+        with self._lock:
+            first = self._top
+            self._top += n
+        return first
+
+
+def stripes() -> List[threading.Lock]:
+    return [threading.Lock() for _ in range(_STRIPES)]
@@ -0,0 +1,141 @@
+from typing import Any, Dict, Optional
+
+# when does ms_gc_gen.MarkSweepGC collect?
+#
+# the collector asks its policy three things:
+#   young_limit          alloc() runs gc() once this many objects were
+#                        allocated since the last minor gc
+#   want_full(gc)        asked by gc() after every minor gc
+#   after_minor / after_full
+#                        what the last collection saw, so the policy can
+#                        move its thresholds
+#   after_pause(gc, kind, pause_ns, phases)
+#                        how long every stop-the-world pause took, the same
+#                        numbers gc.stats().callbacks get
+#
+# the base class is the old behaviour: nothing happens on alloc, gc() does
+# a full gc every 8th minor gc
+
+
+class GCPolicy:
+    young_limit: float = float("inf")
+
+    def __init__(self, full_every: int = 8):
+        self.full_every = full_every
+
+    def want_full(self, gc: Any) -> bool:
+        return gc._minor_gc_count % self.full_every == 0
+
+    def after_minor(self, gc: Any, scanned: int, survived: int) -> None:
+        # scanned = size of the nursery that was collected,
+        # survived = how many of those were copied or promoted
+        pass
+
+    def after_full(self, gc: Any) -> None:
+        pass
+
+    def after_pause(self, gc: Any, kind: str, pause_ns: int, phases: Dict[str, int]) -> None:
+        pass
+
+
+class ThresholdPolicy(GCPolicy):
+    # cpython style: a minor gc every `nursery` allocations, a full gc once
+    # the old generation grew by `full_growth` (25% -> 0.25) since the last one
+    #
+    # adaptive: a nursery where most objects survive is collected too early,
+    # the copying is wasted on objects that would have died a bit later, so
+    # it is doubled. a nursery where almost everything dies is cheap but
+    # holds memory for nothing, so it is halved again
+    # the full trigger adapts the same way: a full gc that found almost all
+    # of old still alive was too early, full_growth doubles (up to
+    # max_full_growth). one that freed most of old was late, full_growth
+    # halves again, never below the configured value
+    # max_pause_ms: a minor pause over it halves the nursery and caps it
+    # there, pauses well under it (a quarter) let the cap grow back
+    # memory tight -> small nursery, small growth; throughput -> the opposite
+
+    def __init__(
+        self,
+        nursery: int = 700,
+        full_growth: float = 0.25,
+        min_old: int = 1000,
+        adaptive: bool = True,
+        min_nursery: int = 100,
+        max_nursery: int = 100_000,
+        max_full_growth: float = 4.0,
+        max_pause_ms: Optional[float] = None,
+    ):
+        self.young_limit = nursery
+        self.full_growth = full_growth
+        self.min_full_growth = full_growth
+        self.max_full_growth = max_full_growth
+        # no full gc before old holds this many objects (startup)
+        self.min_old = min_old
+        self.adaptive = adaptive
+        self.min_nursery = min_nursery
+        self.max_nursery = max_nursery
+        self.max_pause_ms = max_pause_ms
+        self._nursery_cap = max_nursery  # max_nursery, or lower after slow pauses
+        self._old_live = 0  # len(old) after the last full gc
+        self._old_seen = 0  # len(old) after the last minor gc
+
+    def want_full(self, gc: Any) -> bool:
+        grown = len(gc.old) - self._old_live
+        return grown > self.full_growth * max(self._old_live, self.min_old)
+
+    def after_minor(self, gc: Any, scanned: int, survived: int) -> None:
+        # old only grows at minor gcs, so this is its size before a full gc
+        self._old_seen = len(gc.old)
+        if not self.adaptive or scanned == 0:
+            return
+        rate = survived / scanned
+        if rate > 0.5:
+            self.young_limit = min(self.young_limit * 2, self._nursery_cap)
+        elif rate < 0.1:
+            self.young_limit = max(self.young_limit // 2, self.min_nursery)
+
+    def after_full(self, gc: Any) -> None:
+        live = len(gc.old)
+        before, self._old_live = self._old_seen, live
+        self._old_seen = live
+        # REM: before is 0 for a full gc ahead of any minor gc (load(), a
+        # bare full_gc()), nothing to learn from that one
+        if not self.adaptive or before < self.min_old:
+            return
+        freed = 1 - live / before
+        if freed < 0.1:
+            self.full_growth = min(self.full_growth * 2, self.max_full_growth)
+        elif freed > 0.5:
+            self.full_growth = max(self.full_growth / 2, self.min_full_growth)
+
+    def after_pause(self, gc: Any, kind: str, pause_ns: int, phases: Dict[str, int]) -> None:
+        # only pauses that were a minor gc and nothing else, a full gc in
+        # the same pause says nothing about the nursery size
+        if self.max_pause_ms is None or kind not in ("minor", "gc") or "mark" in phases:
+            return
+        limit = self.max_pause_ms * 1_000_000
+        if pause_ns > limit:
+            self.young_limit = max(self.young_limit // 2, self.min_nursery)
+            self._nursery_cap = self.young_limit
+        elif pause_ns < limit / 4 and self._nursery_cap < self.max_nursery:
+            self._nursery_cap = min(self._nursery_cap * 2, self.max_nursery)
+
+
+class GoalPolicy(ThresholdPolicy):
+    # go style GOGC: after a full gc the old generation may grow to
+    # live * (1 + gogc / 100) before the next one, gogc=100 -> twice the live size
+    # the goal follows the live size every full gc measures, gogc itself is
+    # the user's memory/cpu trade and stays put (full_growth is not used)
+    # the nursery works (and adapts, max_pause_ms too) like ThresholdPolicy
+
+    def __init__(self, gogc: int = 100, min_old: int = 1000, **kwargs: Any):
+        super().__init__(min_old=min_old, **kwargs)
+        self.gogc = gogc
+        self.goal = min_old
+
+    def want_full(self, gc: Any) -> bool:
+        return len(gc.old) >= self.goal
+
+    def after_full(self, gc: Any) -> None:
+        super().after_full(gc)
+        self.goal = max(self.min_old, int(self._old_live * (1 + self.gogc / 100)))
@@ -0,0 +1,44 @@
+from time import perf_counter
+from typing import Callable, Optional, TypeVar
+import asyncio
+
+# how much work goes in one slice of collect_async(), between two awaits
+#
+# a slice is one mark_step / sweep step of `budget` objects. with max_lag
+# (seconds) every slice is timed and the budget for the next one resized,
+# aiming at half the bound: objects cost very different amounts (a node
+# with a thousand fields vs a leaf), so a fixed count cannot promise a lag
+#
+#   slices = Slices(1024, max_lag=0.005)
+#   done = slices.run(gc.mark_step)
+#   await slices.pause()
+
+T = TypeVar("T")
+
+
+class Slices:
+    def __init__(self, budget: int = 1024, max_lag: Optional[float] = None):
+        if budget < 1:
+            raise ValueError("slice budget must be at least 1.")
+        self.budget = budget
+        self.max_lag = max_lag
+        self.count = 0
+        self.longest = 0.0  # seconds, the longest slice so far
+
+    def run(self, step: Callable[[int], T]) -> T:
+        start = perf_counter()
+        result = step(self.budget)
+        took = perf_counter() - start
+        self.count += 1
+        if took > self.longest:
+            self.longest = took
+        if self.max_lag is not None:
+            # never more than double at once, one cheap slice of leaves says
+            # little about the next one
+            want = self.budget * self.max_lag / 2 / max(took, 1e-9)
+            self.budget = max(1, min(int(want), 2 * self.budget))
+        return result
+
+    async def pause(self) -> None:
+        # let the other tasks run
+        await asyncio.sleep(0)
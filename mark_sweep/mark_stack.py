@@ -0,0 +1,176 @@
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, List, Optional
+import threading
+
+# drain() scans this many objects per pass over the list, then cuts off the
+# scanned ones
+_CHUNK = 1 << 16
+
+
+class MarkStack:
+    # worklist driven marking, shared by ms_gc and ms_gc_gen (full gc)
+    # the old _mark recursed once per edge, so a long linked list blew
+    # past the interpreter recursion limit (RecursionError) and every edge
+    # paid for a python call frame
+
+    # here the "recursion" lives in an explicit list, scanned first in first
+    # out: drain() runs a plain for loop over the list while it appends the
+    # children to it (a list iterator sees what is appended), so there is no
+    # pop() per object and no bounds check, only the loop itself. breadth
+    # first also visits a tree in allocation order, which is kinder to the
+    # cache than the lifo order was
+    # objects are marked when they are PUSHED, not when scanned, so each
+    # object enters the list at most once. _head is where the gray part
+    # starts, the scanned part before it is cut off every _CHUNK objects, so
+    # the list stays at (marked but not scanned) + at most _CHUNK
+
+    # obj.marked is not "True means marked": the collector owns a mark_bit
+    # that flips every full cycle, and an object is marked when
+    # obj.marked == mark_bit. survivors of the last cycle hold the old bit,
+    # so they read as white again without anyone resetting them
+
+    def __init__(self, mark_bit: bool = True):
+        self.mark_bit = mark_bit
+        self._queue: List[Any] = []
+        self._head = 0
+
+    def __len__(self) -> int:
+        return len(self._queue) - self._head
+
+    def push(self, obj: Any) -> bool:
+        # shade a single object (root, remembered child ...)
+        # returns True if the object was white and is now on the stack
+        if obj is None or obj.freed or obj.marked is self.mark_bit:
+            return False
+        obj.marked = self.mark_bit
+        self._queue.append(obj)
+        return True
+
+    def drain(self, budget: Optional[int] = None) -> int:
+        # scan gray objects and push their unmarked children until none is
+        # left (or `budget` objects were scanned, for incremental marking)
+        # returns the number of objects scanned, handy for benchmarks
+
+        # in tri-color terms: white = not marked, gray = marked and not
+        # scanned yet (at or after _head), black = scanned
+
+        # REM: tried collecting children in a batch and extend()-ing once per
+        # object (prefetch style), it was slower on chains and trees than a
+        # plain append, the extra list per object costs more than it saves
+        if budget is not None:
+            return self._drain_some(budget)
+        queue = self._queue
+        add = queue.append
+        bit = self.mark_bit
+        scanned = 0
+        while True:
+            head = self._head
+            for obj in islice(queue, head, head + _CHUNK):
+                for child in obj.slots:
+                    if child is not None and child.marked is not bit and not child.freed:
+                        child.marked = bit
+                        add(child)
+            # the loop stops at _CHUNK objects or at the end of the list,
+            # whatever came first
+            done = min(_CHUNK, len(queue) - head)
+            scanned += done
+            if self._cut(head + done):
+                return scanned
+
+    def _drain_some(self, budget: int) -> int:
+        # drain() with a budget: indexed, islice would skip the scanned head
+        # again on every (small) step
+        queue = self._queue
+        add = queue.append
+        bit = self.mark_bit
+        head = start = self._head
+        end = head + budget
+        while head != end and head < len(queue):
+            obj = queue[head]
+            head += 1
+            for child in obj.slots:
+                if child is not None and child.marked is not bit and not child.freed:
+                    child.marked = bit
+                    add(child)
+        self._cut(head)
+        return head - start
+
+    def _cut(self, head: int) -> bool:
+        # forget the scanned objects before head, True once nothing is gray
+        queue = self._queue
+        if head == len(queue):
+            queue.clear()
+            self._head = 0
+            return True
+        if head >= _CHUNK:
+            del queue[:head]
+            head = 0
+        self._head = head
+        return False
+
+
+class ConcurrentMarker:
+    # runs a MarkStack on a background thread while mutators keep going
+    #
+    # snapshot-at-the-beginning: everything reachable when the cycle starts
+    # survives it. the collector's write barrier calls shade() with the value
+    # a store is about to OVERWRITE, so the marker still sees the snapshot
+    # graph even if the mutator cuts edges behind its back
+    #
+    # the barrier also shades the NEW value (this is go's hybrid barrier):
+    # here the mutator's own ObjectRefs are not roots and never get scanned,
+    # so an object that was only held by the program when the cycle started
+    # would otherwise be freed right after being linked in
+    #
+    # shade() only appends to a deque (thread safe, no lock), the marker
+    # thread is the only one touching the stack. once both are empty it takes
+    # the world lock (every mutator op holds it) for a short remark: drain
+    # what came in meanwhile, then call on_done() to sweep
+
+    def __init__(
+        self,
+        stack: MarkStack,
+        world: Any,
+        on_done: Callable[[], None],
+        step: int = 256,
+    ):
+        self.stack = stack
+        self.world = world
+        self.on_done = on_done
+        self.step = step
+        self._satb: Deque[Any] = deque()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def shade(self, obj: Any) -> None:
+        if obj is not None:
+            self._satb.append(obj)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _pull(self) -> None:
+        satb = self._satb
+        push = self.stack.push
+        while satb:
+            push(satb.popleft())
+
+    def _run(self) -> None:
+        stack = self.stack
+        while True:
+            self._pull()
+            if not stack:
+                break
+            stack.drain(self.step)
+
+        with self.world:
+            # remark: mutators are stopped, nothing new can be shaded
+            self._pull()
+            while stack:
+                stack.drain()
+                self._pull()
+            self.on_done()
@@ -1,37 +1,55 @@
-from dataclasses import dataclass, field
-from typing import Dict, Optional, Any, Set
+from contextlib import contextmanager
+from time import perf_counter_ns
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Sequence, Set, Tuple, Union
 import itertools
+import threading
 
+from gc_common.finalize import FinalizerQueue, WeakRef
+from gc_common.gc_stats import GCStats
+from gc_common.heap_dump import HeapDump, HeapRecord, write_dump
+from gc_common.layout import (
+    EMPTY_SHAPE,
+    NO_SLOTS,
+    HeapObject,
+    as_list,
+    bulk_edges,
+    put_many,
+    resolve_many,
+)
+from gc_common.safepoint import STRIPE_MASK, Safepoint, ThreadIds, stripes
+from gc_slices import Slices
+from mark_stack import ConcurrentMarker, MarkStack
+from parallel_mark import MarkPool
 
-@dataclass
-class _Obj:
-    id: int
-    value: Any = None
-    # REM: fields has a type hint; a dict mapping str -> "ObjectRef"
-    # the objectref is quoted because its is defined later in the  file < forward ref >
-    # the alt method might be to use annotation with __future__ [TODO]
 
-    # field(default_factory=dict) ensures that EACH _Obj GETS ITS OWN DICT
-    # using = {} would have shared across all instances
-    fields: Dict[str, "ObjectRef"] = field(default_factory=dict)
-    marked: bool = False
-    freed: bool = False
+class _Obj(HeapObject):
+    # fields as shape + slots, shared by all collectors (see gc_common/layout.py)
+    __slots__ = ("marked",)
 
-    def __repr__(self):
+    def __init__(self, id: int, value: Any = None):
+        self.id = id
+        self.value = value
+        self.shape = EMPTY_SHAPE
+        self.slots = NO_SLOTS  # list of child _Obj (or None), once set
+        self.marked = False
+        self.freed = False
 
-        if self.fields:
-            flds = [f"{k} -> #{v._obj.id}" for k, v in self.fields.items()]
-            fstr = "[" + ", ".join(flds) + "]"
-        else:
-            fstr = "[]"
+    def describe(self, marked: bool) -> str:
+        # the raw mark bit only means something next to the collector's
+        # current mark_bit, so the collector passes in the real answer
+        flds = self.field_list()
+        fstr = "[" + ", ".join(flds) + "]" if flds else "[]"
 
-        return f"_Obj #{self.id} (val={self.value!r}, marked={self.marked}, freed={self.freed}, fields={fstr})"
-        # flds = [f"{k} -> #{v._obj.id}" for k, v in self.fields.items()]
-        # return f"_Obj #{self.id} (val={self.value!r}, marked={self.marked})"
+        return f"_Obj #{self.id} (val={self.value!r}, marked={marked}, freed={self.freed}, fields={fstr})"
+
+    def __repr__(self):
+        return self.describe(self.marked)
 
 
 class ObjectRef:
     # techincally a wrapper class, with a repr
+    __slots__ = ("_obj",)
+
     def __init__(self, _obj: _Obj):
         self._obj = _obj
 
@@ -40,25 +58,78 @@ class ObjectRef:
         return f"ObjectRef(#{self._obj.id}), val={self._obj.value!r}"
 
 
+_Obj.ref_type = ObjectRef  # for _Obj.fields
+
+
 class MarkSweepGC:
-    def __init__(self):
+    def __init__(self, lazy_sweep: bool = False, sweep_budget: int = 64):
         self._next_id = itertools.count(1)
         self.heap: Dict[int, _Obj] = {}
         self.roots: Set[int] = set()
+        # obj.marked == _mark_bit means marked, flipped after every sweep
+        self._mark_bit = True
+
+        # lazy sweep: gc() only marks, the sweep is done sweep_budget objects
+        # at a time from alloc() (or sweep_step()), so the pause is just the mark
+        self.lazy_sweep = lazy_sweep
+        self.sweep_budget = sweep_budget
+        # ids still to be swept + how far we got, None when no sweep is pending
+        self._sweep_ids: Optional[List[int]] = None
+        self._sweep_pos = 0
+
+        # incremental marking: the gray objects of the cycle in progress,
+        # None when no cycle is running (see start_cycle / mark_step / finish_cycle)
+        self._cycle: Optional[MarkStack] = None
+
+        # worker processes for parallel_gc(), made on first use
+        self._mark_pool: Optional[MarkPool] = None
+
+        # finalize(): obj -> its (fn, args), queued when it is freed
+        # (see gc_common/finalize.py), and run from the queue, never in a pause
+        self._finalizable: Dict[_Obj, List[Tuple[Any, tuple]]] = {}
+        self.finalizers = FinalizerQueue()
+
+        self._stats = GCStats()
+
+    def stats(self) -> GCStats:
+        # counters, phase timings and pauses so far (see gc_common/gc_stats.py)
+        stats = self._stats
+        stats.heap_size = len(self.heap)
+        stats.allocated = stats.heap_size + stats.freed
+        return stats
 
     def alloc(self, value: Optional[Any] = None) -> ObjectRef:
         # we increment the counter
         # build an obj, and put it in our heap
         # we wrap the obj ins a objref, and return back
+        if self._sweep_ids is not None:
+            self.sweep_step(self.sweep_budget)
+
         oid = next(self._next_id)
         obj = _Obj(id=oid, value=value)
+        if self._sweep_ids is None and self._cycle is None:
+            obj.marked = not self._mark_bit  # white
+        else:
+            # black, the pending sweep must skip it, and a running mark
+            # must not free it just because nothing pointed to it yet
+            obj.marked = self._mark_bit
         self.heap[oid] = obj
         return ObjectRef(obj)
 
     def _get_obj(self, obj_ref: Optional[ObjectRef]) -> Optional[_Obj]:
         if obj_ref is None:
             return None
-        return obj_ref._obj
+        obj = obj_ref._obj
+        if (
+            self._sweep_ids is not None
+            and obj.marked is not self._mark_bit
+            and not obj.freed
+        ):
+            # unmarked but not swept yet, it is garbage already: free it now
+            # so callers see exactly what an eager sweep would have left
+            self._free_obj(obj)
+            self._stats.freed += 1
+        return obj
 
     def set_field(
         self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
@@ -67,11 +138,67 @@ class MarkSweepGC:
         if parent is None or parent.freed:
             raise RuntimeError("setting field on freed or non existent parent.")
 
-        if child_ref is None:
-            if field_name in parent.fields:
-                del parent.fields[field_name]
+        child = self._get_obj(child_ref)
+        parent.put(field_name, child)
+
+        if self._cycle is not None:
+            # dijkstra write barrier: a black parent must never point to a
+            # white child, so the child is shaded gray right here
+            self._cycle.push(child)
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        # alloc() for a whole sequence (or numpy array) of values: one id
+        # range, one heap update, and the lazy sweep owed for all of them.
+        # ids are consecutive, refs[i] gets first id + i
+        values = as_list(values)
+        if not values:
+            return []
+        if self._sweep_ids is not None:
+            self.sweep_step(self.sweep_budget * len(values))
+
+        first = next(self._next_id)
+        ids = range(first, first + len(values))
+        self._next_id = itertools.count(first + len(values))
+        objs = list(map(_Obj, ids, values))
+        if self._sweep_ids is None and self._cycle is None:
+            marked = not self._mark_bit  # white
         else:
-            parent.fields[field_name] = child_ref
+            marked = self._mark_bit  # black, see alloc()
+        for obj in objs:
+            obj.marked = marked
+        self.heap.update(zip(ids, objs))
+        return list(map(ObjectRef, objs))
+
+    def _resolve_many(self, items: Iterable[Any], parents: bool = False) -> List[Optional[_Obj]]:
+        return resolve_many(items, self.heap.get, self._get_obj, ObjectRef, parents)
+
+    def _bulk_edges(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> Tuple[List[_Obj], Sequence[str], List[Optional[_Obj]]]:
+        # checked before anything is written: a bad batch changes nothing
+        if self._sweep_ids is not None:
+            # ids skip _get_obj, so no unswept garbage may be left behind
+            self._finish_sweep()
+        return bulk_edges(parents, names, children, self._resolve_many)
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        # set_field() for many edges: parents[i].names[i] = children[i]
+        # parents / children are ObjectRefs or object ids (lists or numpy
+        # arrays, a child None / 0 clears the field), names is one field
+        # name for every edge or one per edge. edges apply in order, and the
+        # write barrier runs once over the batch
+        self._set_edges(*self._bulk_edges(parents, names, children))
+
+    def _set_edges(
+        self, parents: List[_Obj], names: Sequence[str], children: List[Optional[_Obj]]
+    ) -> None:
+        put_many(parents, names, children)
+        if self._cycle is not None:
+            push = self._cycle.push
+            for child in children:
+                push(child)
 
     def add_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -80,6 +207,9 @@ class MarkSweepGC:
         if obj.id in self.roots:
             return
         self.roots.add(obj.id)
+        if self._cycle is not None:
+            # the roots were scanned at start_cycle, a new one is shaded now
+            self._cycle.push(obj)
 
     def remove_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -87,29 +217,75 @@ class MarkSweepGC:
             return
         self.roots.discard(obj.id)
 
-    def _mark(self, obj: Optional[_Obj]) -> None:
-        if obj is None or obj.freed:
-            return
+    def weakref(self, obj_ref: ObjectRef) -> WeakRef:
+        # a reference that does not keep its target alive (see gc_common/finalize.py)
+        return WeakRef(self, obj_ref)
 
-        if obj.marked:
-            return
+    def finalize(self, obj_ref: ObjectRef, fn: Any, *args: Any) -> None:
+        # fn(*args) goes on self.finalizers once the object is freed
+        obj = self._get_obj(obj_ref)
+        if obj is None or obj.freed:
+            raise RuntimeError("finalize() on a freed or non existent object.")
+        self._finalizable.setdefault(obj, []).append((fn, args))
 
-        obj.marked = True
-        for child_ref in obj.fields.values():
-            child = self._get_obj(child_ref)
-            self._mark(child)
+    def _mark(self, obj: Optional[_Obj]) -> None:
+        # no recursion here anymore, see mark_stack.py
+        stack = MarkStack(self._mark_bit)
+        stack.push(obj)
+        stack.drain()
 
     def _sweep(self) -> None:
-        to_free = []
+        # survivors are only read, never written: instead of resetting every
+        # mark we flip what "marked" means once the sweep is done
+        # the heap is walked in place, only the garbage gets collected into a list
+        bit = self._mark_bit
+        to_free = [obj for obj in self.heap.values() if obj.marked is not bit]
 
-        for oid, obj in list(self.heap.items()):
-            if obj.marked:
-                obj.marked = False
-            else:
-                to_free.append(oid)
+        for obj in to_free:
+            self._free_obj(obj)
+        self._stats.freed += len(to_free)
+
+        self._mark_bit = not bit
 
-        for oid in to_free:
-            self._free(oid)
+    def sweep_step(self, budget: int) -> int:
+        # sweep up to `budget` objects of the pending lazy sweep
+        # returns how many were freed
+        ids = self._sweep_ids
+        if ids is None:
+            return 0
+
+        # runs from alloc(), timed by hand: cheaper than stats.pause()
+        start = perf_counter_ns()
+        bit = self._mark_bit
+        end = min(self._sweep_pos + budget, len(ids))
+        freed = 0
+        for i in range(self._sweep_pos, end):
+            obj = self.heap.get(ids[i])
+            if obj is not None and obj.marked is not bit:
+                self._free_obj(obj)
+                freed += 1
+        self._sweep_pos = end
+        self._stats.freed += freed
+        self._stats.add_pause("sweep_step", perf_counter_ns() - start, "sweep")
+
+        if end == len(ids):
+            self._sweep_ids = None
+            self._sweep_pos = 0
+            self._mark_bit = not bit
+        return freed
+
+    def _finish_sweep(self) -> None:
+        if self._sweep_ids is not None:
+            self.sweep_step(len(self._sweep_ids))
+
+    def _free_obj(self, obj: _Obj) -> None:
+        obj.freed = True
+        obj.clear()
+        del self.heap[obj.id]
+        if self._finalizable:
+            fns = self._finalizable.pop(obj, None)
+            if fns is not None:
+                self.finalizers.put(fns)
 
     def _free(self, oid: int) -> None:
         obj = self.heap.get(oid)
@@ -117,22 +293,474 @@ class MarkSweepGC:
             return
         if obj.freed:
             return
+        self._free_obj(obj)
 
-        obj.freed = True
-        obj.fields.clear()
-        del self.heap[oid]
+    def start_cycle(self) -> None:
+        # shade the roots, the rest of the marking happens in mark_step()
+        # one shared stack for every root, so objects reachable from
+        # several roots are only scanned once
+        if self._cycle is not None:
+            return
+        stats = self._stats
+        with stats.pause("cycle_start"):
+            self._finish_sweep()
+            with stats.phase("mark"):
+                stack = MarkStack(self._mark_bit)
+                for root_id in self.roots:
+                    stack.push(self.heap.get(root_id))
+                self._cycle = stack
+
+    def mark_step(self, max_objects: int) -> bool:
+        # scan at most max_objects gray objects, the mutator may run between
+        # steps. returns True once there is nothing gray left
+        if self._cycle is None:
+            return True
+        stats = self._stats
+        with stats.pause("mark_step"), stats.phase("mark"):
+            self._cycle.drain(max_objects)
+        return not self._cycle
+
+    def finish_cycle(self) -> None:
+        # mark whatever is still gray, then sweep (or queue the lazy sweep)
+        if self._cycle is None:
+            return
+        stats = self._stats
+        with stats.pause("cycle_finish"):
+            with stats.phase("mark"):
+                self._cycle.drain()
+                self._cycle = None
+            with stats.phase("sweep"):
+                self._sweep_or_defer()
+
+    def _sweep_or_defer(self) -> None:
+        if self.lazy_sweep:
+            # the id list is made at C speed, the per object work is what we defer
+            self._sweep_ids = list(self.heap)
+            self._sweep_pos = 0
+        else:
+            self._sweep()
 
     def gc(self) -> None:
-        for root_id in list(self.roots):
-            obj = self.heap.get(root_id)
+        # stop the world: a whole cycle in one go. a running incremental
+        # cycle is finished first, then a fresh one runs: the old one keeps
+        # whatever was allocated or unlinked since it started
+        with self._stats.pause("gc"):
+            self.finish_cycle()
+            self.start_cycle()
+            self.finish_cycle()
+
+    async def collect_async(self, slice_budget: int = 1024, max_lag: Optional[float] = None) -> None:
+        # gc() for asyncio programs: the incremental cycle (start_cycle,
+        # mark_step ...) and then a lazy sweep, in slices of slice_budget
+        # objects with an await between two. other tasks may alloc and
+        # set_field in between, the write barrier and allocating black keep
+        # the cycle correct, as with mark_step() called by hand. with
+        # max_lag (seconds) the slices are resized to stay under it (see
+        # gc_slices.py). a gc() from another task finishes the cycle for it
+        # REM: two steps are not sliced, so max_lag does not cover them:
+        # start_cycle() shades every root at once, and the sweep starts with
+        # a copy of the heap's ids (list(heap), at C speed, ~2ms per 100k)
+        slices = Slices(slice_budget, max_lag)
+        while self._sweep_ids is not None:
+            # the sweep of an earlier cycle, start_cycle() would finish it in one go
+            slices.run(self.sweep_step)
+            await slices.pause()
+
+        slices.run(lambda budget: self.start_cycle())
+        await slices.pause()
+        while not slices.run(self.mark_step):
+            await slices.pause()
+
+        if self._cycle is not None:
+            # right after the last step, nothing has been shaded since
+            self._finish_mark()
+        while self._sweep_ids is not None:
+            await slices.pause()
+            slices.run(self.sweep_step)
 
-            if obj is not None:
-                self._mark(obj)
+    def _finish_mark(self) -> None:
+        # finish_cycle(), but the sweep is always left to sweep_step()
+        stats = self._stats
+        with stats.pause("cycle_finish"):
+            with stats.phase("mark"):
+                self._cycle.drain()
+                self._cycle = None
+            self._sweep_ids = list(self.heap)
+            self._sweep_pos = 0
 
-        self._sweep()
+    def parallel_gc(self, workers: int = 4) -> None:
+        # stop the world, but marking is spread over worker processes
+        # (see parallel_mark.py), always followed by an eager sweep
+        self.finish_cycle()
+        self._finish_sweep()
+        if self._mark_pool is None or self._mark_pool.workers != workers:
+            self.close()
+            self._mark_pool = MarkPool(workers)
+
+        stats = self._stats
+        with stats.pause("parallel_gc"):
+            with stats.phase("mark"):
+                objs = list(self.heap.values())
+                roots = [self.heap[r] for r in self.roots if r in self.heap]
+                marks = self._mark_pool.mark(objs, roots)
+
+            # sweep straight off the bitmap: survivors keep their (white) mark
+            # bit untouched, so there is nothing to flip afterwards
+            with stats.phase("sweep"):
+                freed = 0
+                for obj, marked in zip(objs, marks):
+                    if not marked:
+                        self._free_obj(obj)
+                        freed += 1
+                stats.freed += freed
+
+    def close(self) -> None:
+        # stop the parallel_gc() worker processes and the finalizer
+        # thread, if any
+        if self._mark_pool is not None:
+            self._mark_pool.close()
+            self._mark_pool = None
+        self.finalizers.stop()
 
     def heap_snapshot(self) -> str:
-        lines = [f"HEAP size={len(self.heap)}, ROOTS={sorted(list(self.roots))}"]
-        for oid in sorted(self.heap):
-            lines.append(repr(self.heap[oid]))
+        bit = self._mark_bit
+        if self._sweep_ids is None:
+            oids = sorted(self.heap)
+        else:
+            # leave out what the pending sweep will free, and don't show the
+            # marks of a sweep in progress (they are flipped once it ends)
+            oids = sorted(o.id for o in self.heap.values() if o.marked is bit)
+            bit = not bit
+
+        lines = [f"HEAP size={len(oids)}, ROOTS={sorted(list(self.roots))}"]
+        for oid in oids:
+            obj = self.heap[oid]
+            lines.append(obj.describe(obj.marked is bit))
         return "\n".join(lines)
+
+    def iter_records(self) -> Iterator[HeapRecord]:
+        # streaming alternative to heap_snapshot(), heap order, nothing sorted
+        # and nothing kept: one record per live object
+        pending = self._sweep_ids is not None
+        bit = self._mark_bit
+        for obj in self.heap.values():
+            if pending and obj.marked is not bit:
+                continue  # the pending sweep frees it
+            edges = [(n, c.id) for n, c in zip(obj.shape.names, obj.slots) if c is not None]
+            yield HeapRecord(obj.id, obj.value, edges=edges)
+
+    def dump(self, path: str) -> int:
+        # binary heap dump (see gc_common/heap_dump.py), returns the number of objects
+        return write_dump(path, self.roots, self.iter_records())
+
+    @classmethod
+    def load(cls, path: str) -> "MarkSweepGC":
+        # a fresh collector holding the dumped heap, all objects white
+        gc = cls()
+        heap = gc.heap
+        white = not gc._mark_bit
+        links = []
+        with HeapDump(path) as dump:
+            for rec in dump:
+                obj = _Obj(rec.id, rec.value)
+                obj.marked = white
+                heap[rec.id] = obj
+                if rec.edges:
+                    links.append((obj, rec.edges))
+            gc.roots = set(dump.roots)
+
+        # children can come after their parents in the dump, link at the end
+        for obj, edges in links:
+            for name, child in edges:
+                obj.put(name, heap[child])
+        gc._next_id = itertools.count(max(heap, default=0) + 1)
+        return gc
+
+
+class ConcurrentMarkSweepGC(MarkSweepGC):
+    # same collector, but gc() marks on a background thread (see
+    # ConcurrentMarker) while other threads keep calling alloc / set_field
+    # the mutator only stops for the root snapshot and the final remark + sweep
+    #
+    # REM: with the GIL the marker and the mutators take turns rather than
+    # truly running in parallel, it is the PAUSES that get short, not the work
+
+    def __init__(
+        self, lazy_sweep: bool = False, sweep_budget: int = 64, step: int = 256
+    ):
+        super().__init__(lazy_sweep, sweep_budget)
+        self.step = step
+        # every mutator op holds this, the collector takes it to stop the world
+        self._world = threading.RLock()
+        self._marker: Optional[ConcurrentMarker] = None
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        with self._world:
+            ref = super().alloc(value)
+            if self._marker is not None:
+                ref._obj.marked = self._mark_bit  # allocate black
+            return ref
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        with self._world:
+            marker = self._marker
+            if marker is not None:
+                parent = self._get_obj(parent_ref)
+                if parent is not None and not parent.freed:
+                    # SATB: log the value about to be overwritten (+ the new one)
+                    marker.shade(parent.get(field_name))
+                    marker.shade(self._get_obj(child_ref))
+            super().set_field(parent_ref, field_name, child_ref)
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        with self._world:
+            refs = super().alloc_many(values)
+            if self._marker is not None:
+                bit = self._mark_bit
+                for ref in refs:
+                    ref._obj.marked = bit  # allocate black
+            return refs
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        with self._world:
+            parents, names, children = self._bulk_edges(parents, names, children)
+            marker = self._marker
+            if marker is not None:
+                # SATB for the whole batch, before any of it is written
+                for parent, name, child in zip(parents, names, children):
+                    marker.shade(parent.get(name))
+                    marker.shade(child)
+            self._set_edges(parents, names, children)
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        with self._world:
+            super().add_root(obj_ref)
+            if self._marker is not None:
+                self._marker.shade(self._get_obj(obj_ref))
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        with self._world:
+            super().remove_root(obj_ref)
+
+    def start_concurrent_cycle(self) -> None:
+        # short pause: snapshot the roots and hand off to the marker thread
+        with self._world:
+            if self._marker is not None or self._cycle is not None:
+                return
+            stats = self._stats
+            with stats.pause("cycle_start"):
+                self._finish_sweep()
+                with stats.phase("mark"):
+                    stack = MarkStack(self._mark_bit)
+                    for root_id in self.roots:
+                        stack.push(self.heap.get(root_id))
+            self._marker = ConcurrentMarker(
+                stack, self._world, self._remark_done, self.step
+            )
+            self._marker.start()
+
+    def _remark_done(self) -> None:
+        # called by the marker thread, world already stopped
+        # REM: the remark drain just before this is not timed, only the sweep
+        self._marker = None
+        stats = self._stats
+        with stats.pause("remark"), stats.phase("sweep"):
+            self._sweep_or_defer()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # block until the running cycle (if any) is swept, True when done
+        marker = self._marker
+        if marker is None:
+            return True
+        return marker.join(timeout)
+
+    def gc(self) -> None:
+        # a whole collection from here: an incremental cycle already running
+        # (start_cycle) is finished first, a concurrent one waited for, as
+        # either may have started before the garbage we want gone was made
+        with self._world:
+            self.finish_cycle()
+        self.wait()
+        self.start_concurrent_cycle()
+        self.wait()
+
+    def heap_snapshot(self) -> str:
+        with self._world:
+            return super().heap_snapshot()
+
+    def dump(self, path: str) -> int:
+        with self._world:
+            return super().dump(path)
+
+    def stats(self) -> GCStats:
+        with self._world:
+            return super().stats()
+
+
+class ThreadSafeMarkSweepGC(MarkSweepGC):
+    # same collector, safe to call from several mutator threads at once,
+    # without one lock around every operation (see gc_common/safepoint.py):
+    #   alloc      ids from a per-thread chunk, the object goes in the
+    #              thread's own allocation buffer, not the shared heap
+    #   set_field  locks the parent's stripe only
+    #   gc & co    stop the world at a safepoint, move the allocation
+    #              buffers into the heap, then run as usual
+    # set_fields_bulk looks objects up by id, so it stops the world too.
+    # the incremental cycle and collect_async() work: each step / slice is a
+    # stop, the world runs again at every await. no lazy_sweep flag, the
+    # sweep of collect_async() is the only lazy one (see _get_obj)
+    #
+    # REM: under the GIL the threads still take turns, this is about being
+    # correct. on a free-threaded build (3.13t) they do not share anything
+    # on the alloc / set_field path unless they write the same stripe
+
+    def __init__(self):
+        super().__init__()
+        self._safepoint = Safepoint()
+        self._next_id = ThreadIds()
+        self._stripes = stripes()
+        # _get_obj frees unswept garbage from the mutator threads
+        self._free_lock = threading.Lock()
+
+    @contextmanager
+    def _stopped(self) -> Iterator[None]:
+        with self._safepoint.stopped():
+            self._safepoint.flush(self.heap)
+            yield
+
+    def _get_obj(self, obj_ref: Optional[ObjectRef]) -> Optional[_Obj]:
+        if obj_ref is None:
+            return None
+        obj = obj_ref._obj
+        if self._sweep_ids is not None and obj.marked is not self._mark_bit and not obj.freed:
+            # see MarkSweepGC._get_obj. the sweep itself only runs with the
+            # world stopped, so this lock is just between mutators
+            with self._free_lock:
+                if not obj.freed:
+                    self._free_obj(obj)
+                    self._stats.freed += 1
+        return obj
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        m = self._safepoint.enter()
+        try:
+            oid = next(self._next_id)
+            obj = _Obj(id=oid, value=value)
+            # black while a cycle or a sweep runs, see MarkSweepGC.alloc
+            if self._sweep_ids is None and self._cycle is None:
+                obj.marked = not self._mark_bit
+            else:
+                obj.marked = self._mark_bit
+            m.allocated[oid] = obj
+            return ObjectRef(obj)
+        finally:
+            m.depth -= 1
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        values = as_list(values)
+        if not values:
+            return []
+        m = self._safepoint.enter()
+        try:
+            first = self._next_id.take(len(values))
+            ids = range(first, first + len(values))
+            objs = list(map(_Obj, ids, values))
+            if self._sweep_ids is None and self._cycle is None:
+                marked = not self._mark_bit
+            else:
+                marked = self._mark_bit
+            for obj in objs:
+                obj.marked = marked
+            m.allocated.update(zip(ids, objs))
+            return list(map(ObjectRef, objs))
+        finally:
+            m.depth -= 1
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        m = self._safepoint.enter()
+        try:
+            parent = self._get_obj(parent_ref)
+            if parent is None or parent.freed:
+                raise RuntimeError("setting field on freed or non existent parent.")
+            child = self._get_obj(child_ref)
+            with self._stripes[parent.id & STRIPE_MASK]:
+                parent.put(field_name, child)
+            cycle = self._cycle
+            if cycle is not None:
+                # two threads can both push the same child, it gets scanned
+                # twice, which changes nothing
+                cycle.push(child)
+        finally:
+            m.depth -= 1
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        with self._stopped():
+            super().set_fields_bulk(parents, names, children)
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            super().add_root(obj_ref)
+        finally:
+            m.depth -= 1
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            super().remove_root(obj_ref)
+        finally:
+            m.depth -= 1
+
+    def start_cycle(self) -> None:
+        with self._stopped():
+            super().start_cycle()
+
+    def mark_step(self, max_objects: int) -> bool:
+        with self._stopped():
+            return super().mark_step(max_objects)
+
+    def finish_cycle(self) -> None:
+        with self._stopped():
+            super().finish_cycle()
+
+    def gc(self) -> None:
+        with self._stopped():
+            super().gc()
+
+    def parallel_gc(self, workers: int = 4) -> None:
+        with self._stopped():
+            super().parallel_gc(workers)
+
+    def sweep_step(self, budget: int) -> int:
+        with self._stopped():
+            return super().sweep_step(budget)
+
+    def _finish_mark(self) -> None:
+        with self._stopped():
+            super()._finish_mark()
+
+    def heap_snapshot(self) -> str:
+        with self._stopped():
+            return super().heap_snapshot()
+
+    def dump(self, path: str) -> int:
+        with self._stopped():
+            return super().dump(path)
+
+    def stats(self) -> GCStats:
+        with self._stopped():
+            return super().stats()
+
+    @classmethod
+    def load(cls, path: str) -> "ThreadSafeMarkSweepGC":
+        gc = super().load(path)
+        gc._next_id = ThreadIds(max(gc.heap, default=0) + 1)
+        return gc
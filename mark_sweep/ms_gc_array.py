@@ -0,0 +1,342 @@
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Set
+import itertools
+
+import numpy as np
+
+# struct-of-arrays version of ms_gc.MarkSweepGC, with its core api only:
+# alloc, set_field, add_root, remove_root, gc, heap_snapshot and a read only
+# heap. none of lazy sweep, incremental / parallel marking, stats, dumps,
+# the bulk calls or finalizers (the tests over HEAPS cover what is shared)
+#
+# instead of one _Obj per object, every object is a SLOT (an index) into
+# a handful of numpy arrays:
+#   _ids[slot]    object id (0 = empty slot)
+#   _alive[slot]  slot holds a live object
+#   _marks[slot]  mark bit
+#   _gen, _age    generation / age, same meaning as in ms_gc_gen
+#   _values       numpy object array with the user values
+#
+# edges are kept as three growable arrays (src slot, field name id, dst slot),
+# set_field overwrites in place or appends. at gc time they are turned into
+# a CSR adjacency (offsets + targets) and marking is a frontier bfs over it,
+# sweeping is a boolean mask.
+
+# below this many objects in the frontier, a numpy round costs more than it
+# does work, so marking falls back to a plain stack for a while (chains)
+_NARROW_FRONTIER = 64
+_SCALAR_STEPS = 4096
+
+# an edge key is (src slot << _NAME_BITS) | name id, in one int64: room for
+# 2^32 interned field names and 2^31 slots
+_NAME_BITS = 32
+_MAX_NAMES = 1 << _NAME_BITS
+
+
+class ObjectRef:
+    # a slot plus the id that lived there when the ref was made,
+    # slots get reused so the id tells stale refs apart
+    __slots__ = ("_gc", "_slot", "_id")
+
+    def __init__(self, gc: "ArrayMarkSweepGC", slot: int, oid: int):
+        self._gc = gc
+        self._slot = slot
+        self._id = oid
+
+    @property
+    def freed(self) -> bool:
+        return int(self._gc._ids[self._slot]) != self._id
+
+    def __repr__(self):
+        val = None if self.freed else self._gc._values[self._slot]
+        return f"ObjectRef(#{self._id}), val={val!r}"
+
+
+class _HeapView(Mapping):
+    # read only id -> ObjectRef view, so len(gc.heap) / oid in gc.heap
+    # work the same as with the dict heap
+    # REM: lookups by id scan the id array, fine for debugging, not for loops
+    def __init__(self, gc: "ArrayMarkSweepGC"):
+        self._gc = gc
+
+    def __len__(self) -> int:
+        return self._gc._live
+
+    def __iter__(self):
+        gc = self._gc
+        return iter(gc._ids[: gc._top][gc._alive[: gc._top]].tolist())
+
+    def __getitem__(self, oid: int) -> ObjectRef:
+        gc = self._gc
+        hits = np.flatnonzero(gc._ids[: gc._top] == oid)
+        if hits.size == 0:
+            raise KeyError(oid)
+        return ObjectRef(gc, int(hits[0]), oid)
+
+
+class ArrayMarkSweepGC:
+    def __init__(self, capacity: int = 1024):
+        self._next_id = itertools.count(1)
+        self.roots: Set[int] = set()
+        # root id -> slot, only roots need a reverse lookup
+        self._root_slots: Dict[int, int] = {}
+
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=np.bool_)
+        # bytearray backed, so the scalar fallback can index it cheaply
+        self._mark_buf = bytearray(capacity)
+        self._marks = np.frombuffer(self._mark_buf, dtype=np.uint8)
+        self._gen = np.zeros(capacity, dtype=np.uint8)
+        self._age = np.zeros(capacity, dtype=np.uint8)
+        self._values = np.empty(capacity, dtype=object)
+        self._top = 0  # slots [0, _top) have been used at least once
+        self._live = 0
+        self._free_slots: List[int] = []
+
+        # field names are interned to small ints
+        self._names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+
+        self._edge_src = np.zeros(capacity, dtype=np.int64)
+        self._edge_name = np.zeros(capacity, dtype=np.int64)
+        self._edge_dst = np.zeros(capacity, dtype=np.int64)  # -1 = deleted
+        self._edges = 0
+        # (src slot, name id) packed into one int -> edge index
+        self._edge_index: Dict[int, int] = {}
+
+        self.heap = _HeapView(self)
+
+    def _grow_slots(self) -> None:
+        cap = len(self._ids) * 2
+        self._ids = np.resize(self._ids, cap)
+        self._ids[self._top :] = 0
+        self._alive = np.resize(self._alive, cap)
+        self._alive[self._top :] = False
+        self._marks = None  # release the numpy view before resizing the buffer
+        self._mark_buf.extend(bytes(cap - len(self._mark_buf)))
+        self._marks = np.frombuffer(self._mark_buf, dtype=np.uint8)
+        self._gen = np.resize(self._gen, cap)
+        self._age = np.resize(self._age, cap)
+        values = np.empty(cap, dtype=object)
+        values[: self._top] = self._values[: self._top]
+        self._values = values
+
+    def _grow_edges(self) -> None:
+        cap = len(self._edge_src) * 2
+        self._edge_src = np.resize(self._edge_src, cap)
+        self._edge_name = np.resize(self._edge_name, cap)
+        self._edge_dst = np.resize(self._edge_dst, cap)
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        oid = next(self._next_id)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            if self._top == len(self._ids):
+                self._grow_slots()
+            slot = self._top
+            self._top += 1
+
+        self._ids[slot] = oid
+        self._alive[slot] = True
+        self._mark_buf[slot] = 0
+        self._gen[slot] = 0
+        self._age[slot] = 0
+        self._values[slot] = value
+        self._live += 1
+        return ObjectRef(self, slot, oid)
+
+    def _get_slot(self, obj_ref: Optional[ObjectRef]) -> Optional[int]:
+        # None for a missing or stale ref
+        if obj_ref is None or obj_ref.freed:
+            return None
+        return obj_ref._slot
+
+    def _edge_key(self, slot: int, field_name: str) -> int:
+        name_id = self._name_ids.get(field_name)
+        if name_id is None:
+            name_id = len(self._names)
+            if name_id == _MAX_NAMES:
+                # one more would share its key bits with the next slot's
+                raise RuntimeError(f"more than {_MAX_NAMES} field names.")
+            self._names.append(field_name)
+            self._name_ids[field_name] = name_id
+        return (slot << _NAME_BITS) | name_id
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        parent = self._get_slot(parent_ref)
+        if parent is None:
+            raise RuntimeError("setting field on freed or non existent parent.")
+
+        key = self._edge_key(parent, field_name)
+        edge = self._edge_index.get(key)
+
+        if child_ref is None:
+            if edge is not None:
+                self._edge_dst[edge] = -1
+                del self._edge_index[key]
+            return
+
+        child = self._get_slot(child_ref)
+        if child is None:
+            # a freed slot may already belong to someone else
+            raise RuntimeError("setting field to a freed child.")
+
+        if edge is not None:
+            self._edge_dst[edge] = child
+            return
+
+        if self._edges == len(self._edge_src):
+            self._grow_edges()
+        edge = self._edges
+        self._edge_src[edge] = parent
+        self._edge_name[edge] = key & (_MAX_NAMES - 1)
+        self._edge_dst[edge] = child
+        self._edge_index[key] = edge
+        self._edges += 1
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        slot = self._get_slot(obj_ref)
+        if slot is None:
+            return
+        self.roots.add(obj_ref._id)
+        self._root_slots[obj_ref._id] = slot
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        if self._get_slot(obj_ref) is None:
+            return
+        self.roots.discard(obj_ref._id)
+        self._root_slots.pop(obj_ref._id, None)
+
+    def _csr(self):
+        # edges -> (offsets, targets), live edges only
+        m = self._edges
+        dst = self._edge_dst[:m]
+        keep = dst >= 0
+        src = self._edge_src[:m][keep]
+        dst = dst[keep]
+
+        order = np.argsort(src, kind="stable")
+        targets = dst[order]
+        counts = np.bincount(src, minlength=self._top)
+        offsets = np.zeros(self._top + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, targets
+
+    def _mark(self) -> int:
+        top = self._top
+        marks = self._marks[:top]
+        marks[:] = 0
+        if not self._root_slots:
+            return 0
+
+        offsets, targets = self._csr()
+        frontier = np.unique(np.fromiter(self._root_slots.values(), dtype=np.int64))
+        marks[frontier] = 1
+        marked = int(frontier.size)
+        lists = None
+        # scratch for dropping duplicate children without np.unique (a hash
+        # per round was most of the mark time): every child writes its
+        # position, only the last writer of each slot is kept
+        owner = np.empty(top, dtype=np.int64)
+
+        while frontier.size:
+            if frontier.size < _NARROW_FRONTIER:
+                # deep and narrow (a linked list): one numpy round per level
+                # would be way slower than just walking it
+                if lists is None:
+                    lists = (offsets.tolist(), targets.tolist())
+                frontier, n = self._mark_scalar(frontier.tolist(), *lists)
+                marked += n
+                continue
+
+            starts = offsets[frontier]
+            counts = offsets[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # gather every child of every frontier object in one go
+            base = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            children = targets[base + np.arange(total)]
+            children = children[marks[children] == 0]
+            pos = np.arange(children.size)
+            owner[children] = pos
+            children = children[owner[children] == pos]
+            marks[children] = 1
+            marked += int(children.size)
+            frontier = children
+
+        return marked
+
+    def _mark_scalar(self, queue, offsets, targets):
+        # fifo, not lifo: on a tree the queue widens and the next round
+        # goes back to numpy, on a chain it stays at one object
+        marks = self._mark_buf
+        push = queue.append
+        marked = 0
+        head = 0
+        while head < len(queue) and head < _SCALAR_STEPS:
+            slot = queue[head]
+            head += 1
+            for i in range(offsets[slot], offsets[slot + 1]):
+                child = targets[i]
+                if not marks[child]:
+                    marks[child] = 1
+                    marked += 1
+                    push(child)
+        return np.array(queue[head:], dtype=np.int64), marked
+
+    def _sweep(self) -> None:
+        top = self._top
+        dead = np.flatnonzero(self._alive[:top] & (self._marks[:top] == 0))
+        self._marks[:top] = 0
+        if dead.size == 0:
+            return
+
+        self._alive[dead] = False
+        self._ids[dead] = 0
+        self._values[dead] = None
+        self._live -= int(dead.size)
+        self._free_slots.extend(dead.tolist())
+
+        # drop the outgoing edges of dead objects and compact the edge arrays
+        m = self._edges
+        keep = self._alive[self._edge_src[:m]] & (self._edge_dst[:m] >= 0)
+        n = int(keep.sum())
+        if n == m:
+            return
+        self._edge_src[:n] = self._edge_src[:m][keep]
+        self._edge_name[:n] = self._edge_name[:m][keep]
+        self._edge_dst[:n] = self._edge_dst[:m][keep]
+        self._edges = n
+        keys = (self._edge_src[:n] << _NAME_BITS) | self._edge_name[:n]
+        self._edge_index = dict(zip(keys.tolist(), range(n)))
+
+    def gc(self) -> None:
+        self._mark()
+        self._sweep()
+
+    def _fields_of(self, slot: int) -> List[str]:
+        m = self._edges
+        idx = np.flatnonzero(
+            (self._edge_src[:m] == slot) & (self._edge_dst[:m] >= 0)
+        ).tolist()
+        return [
+            f"{self._names[self._edge_name[i]]} -> #{self._ids[self._edge_dst[i]]}"
+            for i in idx
+        ]
+
+    def heap_snapshot(self) -> str:
+        lines = [f"HEAP size={self._live}, ROOTS={sorted(list(self.roots))}"]
+        top = self._top
+        slots = np.flatnonzero(self._alive[:top])
+        for slot in slots[np.argsort(self._ids[slots])].tolist():
+            flds = self._fields_of(slot)
+            fstr = "[" + ", ".join(flds) + "]" if flds else "[]"
+            lines.append(
+                f"_Obj #{self._ids[slot]} (val={self._values[slot]!r}, "
+                f"marked={bool(self._marks[slot])}, freed=False, fields={fstr})"
+            )
+        return "\n".join(lines)
@@ -1,75 +1,220 @@
-from dataclasses import dataclass, field
-from typing import Dict, Optional, Any, Set
+from contextlib import contextmanager
+from time import perf_counter_ns
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Sequence, Set, Tuple, Union
 import itertools
+import threading
 
+from gc_common.finalize import FinalizerQueue, WeakRef
+from gc_common.gc_stats import GCStats
+from gc_common.heap_dump import HeapDump, HeapRecord, write_dump
+from gc_common.layout import (
+    EMPTY_SHAPE,
+    NO_SLOTS,
+    HeapObject,
+    as_list,
+    bulk_edges,
+    put_many,
+    resolve_many,
+)
+from gc_common.safepoint import STRIPE_MASK, Safepoint, ThreadIds, stripes
+from gc_policy import GCPolicy
+from gc_slices import Slices
+from mark_stack import ConcurrentMarker, MarkStack
+from parallel_mark import MarkPool
 
-@dataclass
-class _Obj:
-    id: int
-    value: Any = None
-    # REM: fields has a type hint; a dict mapping str -> "ObjectRef"
-    # the objectref is quoted because it is defined later in the  file < forward ref >
-    # the alt method might be to use annotation with __future__ [TODO]
 
-    # field(default_factory=dict) ensures that EACH _Obj GETS ITS OWN DICT
-    # using = {} would have shared across all instances
-    fields: Dict[str, "ObjectRef"] = field(default_factory=dict)
-    marked: bool = False
-    freed: bool = False
+# with auto_compact, a full gc compacts the ids once the highest live id is
+# this many times the number of live objects
+_COMPACT_SPARSENESS = 2
 
-    generation: int = 0
-    age: int = 0
+# recycle mode ids: the low bits are the slot (which shell), the bits above
+# count how many times the shell has been reused. a reused shell gets id +
+# _ID_TAG, so a stale ObjectRef no longer matches it (see _get_obj)
+_SLOT_BITS = 32
+_ID_TAG = 1 << _SLOT_BITS
 
-    def __repr__(self):
 
-        if self.fields:
-            flds = [f"{k} -> #{v._obj.id}" for k, v in self.fields.items()]
-            fstr = "[" + ", ".join(flds) + "]"
-        else:
-            fstr = "[]"
+class _Obj(HeapObject):
+    # fields as shape + slots, shared by all collectors (see gc_common/layout.py)
+    __slots__ = ("marked", "generation", "age")
+
+    def __init__(self, id: int, value: Any = None):
+        self.id = id
+        self.value = value
+        self.shape = EMPTY_SHAPE
+        self.slots = NO_SLOTS  # list of child _Obj (or None), once set
+        self.marked = False
+        self.freed = False
 
-        return f"_Obj #{self.id} (val={self.value!r}, marked={self.marked}, freed={self.freed}, fields={fstr})"
-        # flds = [f"{k} -> #{v._obj.id}" for k, v in self.fields.items()]
-        # return f"_Obj #{self.id} (val={self.value!r}, marked={self.marked})"
+        self.generation = 0
+        self.age = 0
+
+    def describe(self, marked: bool) -> str:
+        # the raw mark bit only means something next to the collector's
+        # current mark_bit, so the collector passes in the real answer
+        flds = self.field_list()
+        fstr = "[" + ", ".join(flds) + "]" if flds else "[]"
+
+        return f"_Obj #{self.id} (val={self.value!r}, marked={marked}, freed={self.freed}, fields={fstr})"
+
+    def __repr__(self):
+        return self.describe(self.marked)
 
 
 class ObjectRef:
     # techincally a wrapper class, with a repr
+    # _id is the id the object had when the ref was made, in recycle mode it
+    # tells a ref to a reused shell apart from a ref to its new object
+    __slots__ = ("_obj", "_id")
+
     def __init__(self, _obj: _Obj):
         self._obj = _obj
+        self._id = _obj.id
 
     def __repr__(self):
         # NEW: !r calls repr() instead of str()
         return f"ObjectRef(#{self._obj.id}), val={self._obj.value!r}"
 
 
+# what a stale ref (its shell was reused) resolves to: freed, like any
+# other ref to a dead object
+_STALE = _Obj(0)
+_STALE.freed = True
+
+
+_Obj.ref_type = ObjectRef  # for _Obj.fields
+
+
 class MarkSweepGC:
-    def __init__(self):
+    def __init__(
+        self, policy: Optional[GCPolicy] = None, recycle: bool = False, auto_compact: bool = False
+    ):
         self._next_id = itertools.count(1)
         # self.heap: Dict[int, _Obj] = {}
         self.roots: Set[int] = set()
 
         self.young: Dict[int, _Obj] = {}
         self.old: Dict[int, _Obj] = {}
-        self.card_table: Set[int] = set()
+        # remembered set: old parent id -> indexes of its slots that hold a
+        # young child. precise per field and kept across minor gcs, so a minor
+        # gc visits exactly the old -> young edges instead of rescanning every
+        # field of every dirty old object
+        self.remembered: Dict[int, Set[int]] = {}
         self._minor_gc_count = 0
+        # when to collect (see gc_policy.py), the default never does on its own
+        self.policy = policy if policy is not None else GCPolicy()
+        self._allocated = 0  # allocations since the last minor gc
+
+        # recycle mode: dead _Obj shells go on this free list instead of to
+        # the python allocator, and alloc() takes them back first, with the
+        # same slot in their id and the next tag. the number of shells (and
+        # slots) then stays at the peak heap size however many objects die,
+        # at the price of every scavenge visiting its dead objects
+        self._pool: Optional[List[_Obj]] = [] if recycle else None
+        # compact() renumbers every id, and ids are public (obj.id, snapshots,
+        # set_fields_bulk takes them), so a full gc only does it on its own
+        # when asked to. off in recycle mode either way
+        self.auto_compact = auto_compact
+        self._id_base = 0  # ids start above this since the last compact()
+        # obj.marked == _mark_bit means marked, flipped after every full gc
+        # (minor gc copies instead of marking, it never touches the bit)
+        self._mark_bit = True
+
+        # collect_async(): the gray objects of the full gc in progress, then
+        # the objects its sweep still has to look at. both None otherwise
+        self._cycle: Optional[MarkStack] = None
+        self._sweep_objs: Optional[List[_Obj]] = None
+        self._sweep_pos = 0
+
+        # worker processes for parallel_full_gc(), made on first use
+        self._mark_pool: Optional[MarkPool] = None
+
+        # finalize(): obj -> its (fn, args), queued when it is freed and
+        # run from the queue, never in a pause (see gc_common/finalize.py). a minor
+        # gc never looks at its dead objects, so the young finalizable
+        # ones are also kept apart and checked after every scavenge
+        self._finalizable: Dict[_Obj, List[Tuple[Any, tuple]]] = {}
+        self._young_finalizable: Dict[_Obj, None] = {}  # a set in finalize() order
+        self.finalizers = FinalizerQueue()
+
+        self._stats = GCStats()
+        # the policy hears about every pause (see gc_policy.after_pause)
+        self._stats.callbacks.append(self._after_pause)
+
+    def _after_pause(self, kind: str, pause_ns: int, phases: Dict[str, int]) -> None:
+        self.policy.after_pause(self, kind, pause_ns, phases)
+
+    def stats(self) -> GCStats:
+        # counters, phase timings and pauses so far (see gc_common/gc_stats.py)
+        stats = self._stats
+        stats.heap_size = len(self.young) + len(self.old)
+        stats.allocated = stats.heap_size + stats.freed
+        return stats
 
     def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        if self._allocated >= self.policy.young_limit:
+            self.gc()
+        return self._alloc(value)
+
+    def _alloc(self, value: Optional[Any]) -> ObjectRef:
         # we increment the counter
         # build an obj, and put it in our heap
         # we wrap the obj ins a objref, and return back
-        oid = next(self._next_id)
-        obj = _Obj(id=oid, value=value)
+        self._allocated += 1
+        pool = self._pool
+        if pool:
+            obj = pool.pop()
+            obj.id += _ID_TAG
+            obj.value = value
+            obj.freed = False
+        else:
+            obj = _Obj(id=next(self._next_id), value=value)
         # self.heap[oid] = obj
+        if self._cycle is None and self._sweep_objs is None:
+            obj.marked = not self._mark_bit  # white
+        else:
+            # black while collect_async() marks or sweeps, see ms_gc
+            obj.marked = self._mark_bit
         obj.generation = 0
         obj.age = 0
-        self.young[oid] = obj
+        self.young[obj.id] = obj
         return ObjectRef(obj)
 
+    def _recycle(self, objs: Iterable[_Obj]) -> None:
+        # dead objects, already out of young / old. shells keep their id
+        # until reused, so refs to them read as freed in the meantime
+        pool = self._pool
+        finalizable = self._finalizable
+        for obj in objs:
+            obj.freed = True
+            obj.clear()
+            if finalizable:
+                fns = finalizable.pop(obj, None)
+                if fns is not None:
+                    self.finalizers.put(fns)
+            if pool is not None:
+                obj.value = None
+                pool.append(obj)
+
     def _get_obj(self, obj_ref: Optional[ObjectRef]) -> Optional[_Obj]:
         if obj_ref is None:
             return None
-        return obj_ref._obj
+        obj = obj_ref._obj
+        if obj_ref._id != obj.id and self._pool is not None:
+            # the shell has been reused (compact() is off in recycle mode,
+            # nothing else changes an id)
+            return _STALE
+        if obj.generation == 0 and not obj.freed and self.young.get(obj.id) is not obj:
+            # left behind in a dropped from-space, flag it now
+            # (identity check: after a compaction its id may belong to a live obj)
+            obj.freed = True
+            obj.clear()
+        elif self._sweep_objs is not None and obj.marked is not self._mark_bit and not obj.freed:
+            # unmarked and not swept yet by collect_async(): garbage, free it
+            # now so callers see what a full_gc() would have left
+            self._free(obj.id)
+            self._stats.freed += 1
+        return obj
 
     def set_field(
         self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
@@ -78,16 +223,111 @@ class MarkSweepGC:
         if parent is None or parent.freed:
             raise RuntimeError("setting field on freed or non existent parent.")
 
-        if child_ref is None:
-            if field_name in parent.fields:
-                del parent.fields[field_name]
+        child = self._get_obj(child_ref)
+        parent.put(field_name, child)
+        if self._cycle is not None:
+            # collect_async() is marking: dijkstra barrier, as in ms_gc
+            self._cycle.push(child)
+        # write-barrier: remember old -> young stores, forget the slot when
+        # it is overwritten with anything else
+        if parent.generation == 1:
+            if child is not None and child.generation == 0:
+                i = parent.shape.index[field_name]
+                slots = self.remembered.get(parent.id)
+                if slots is None:
+                    self.remembered[parent.id] = {i}
+                else:
+                    slots.add(i)
+            else:
+                slots = self.remembered.get(parent.id)
+                if slots is not None:
+                    slots.discard(parent.shape.index.get(field_name))
+                    if not slots:
+                        del self.remembered[parent.id]
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        # alloc() for a whole sequence (or numpy array) of values, all young.
+        # the policy is asked once, before the batch, so a batch can go past
+        # the nursery limit. ids are consecutive, refs[i] gets first id + i
+        # (except in recycle mode, where pooled shells are used up first)
+        if self._allocated >= self.policy.young_limit:
+            self.gc()
+        return self._alloc_many(values)
+
+    def _alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        values = as_list(values)
+        if not values:
+            return []
+        if self._pool:
+            return [self._alloc(value) for value in values]
+        self._allocated += len(values)
+        first = next(self._next_id)
+        ids = range(first, first + len(values))
+        self._next_id = itertools.count(first + len(values))
+        objs = list(map(_Obj, ids, values))
+        if self._cycle is None and self._sweep_objs is None:
+            marked = not self._mark_bit  # white
         else:
-            parent.fields[field_name] = child_ref
-            # write-barrier, if old -> young, mark present in card table
-            child = self._get_obj(child_ref)
-            if child is not None:
-                if parent.generation == 1 and child.generation == 0:
-                    self.card_table.add(parent.id)
+            marked = self._mark_bit  # black, see _alloc()
+        for obj in objs:
+            obj.marked = marked
+        self.young.update(zip(ids, objs))
+        return list(map(ObjectRef, objs))
+
+    def _resolve_many(self, items: Iterable[Any], parents: bool = False) -> List[Optional[_Obj]]:
+        # young ids first, most bulk edges point at fresh objects
+        return resolve_many(
+            items, self.young.get, self._get_obj, ObjectRef, parents, self.old.get
+        )
+
+    def _bulk_edges(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> Tuple[List[_Obj], Sequence[str], List[Optional[_Obj]]]:
+        return bulk_edges(parents, names, children, self._resolve_many)
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        # set_field() for many edges: parents[i].names[i] = children[i]
+        # parents / children are ObjectRefs or object ids (lists or numpy
+        # arrays, a child None / 0 clears the field), names is one field
+        # name for every edge or one per edge. edges apply in order, and the
+        # write barrier only looks at the edges out of old objects
+        # an id taken before a compact() is refused, never resolved to
+        # whatever object has it now (compact() only hands out new ids)
+        self._set_edges(*self._bulk_edges(parents, names, children))
+
+    def _set_edges(
+        self, parents: List[_Obj], names: Sequence[str], children: List[Optional[_Obj]]
+    ) -> None:
+        put_many(parents, names, children)
+        from_old = [
+            (parent, name, child)
+            for parent, name, child in zip(parents, names, children)
+            if parent.generation == 1
+        ]
+
+        if self._cycle is not None:
+            push = self._cycle.push
+            for child in children:
+                push(child)
+
+        # write-barrier, same as set_field, in edge order
+        remembered = self.remembered
+        for parent, name, child in from_old:
+            if child is not None and child.generation == 0:
+                i = parent.shape.index[name]
+                slots = remembered.get(parent.id)
+                if slots is None:
+                    remembered[parent.id] = {i}
+                else:
+                    slots.add(i)
+            else:
+                slots = remembered.get(parent.id)
+                if slots is not None:
+                    slots.discard(parent.shape.index.get(name))
+                    if not slots:
+                        del remembered[parent.id]
 
     def add_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -96,6 +336,8 @@ class MarkSweepGC:
         # if obj.id in self.roots:
         # return
         self.roots.add(obj.id)
+        if self._cycle is not None:
+            self._cycle.push(obj)
 
     def remove_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -104,46 +346,24 @@ class MarkSweepGC:
         self.roots.discard(obj.id)
 
     def _mark(self, obj: Optional[_Obj]) -> None:
-        if obj is None or obj.freed:
-            return
-
-        if obj.marked:
-            return
-
-        obj.marked = True
-        for child_ref in obj.fields.values():
-            child = self._get_obj(child_ref)
-            self._mark(child)
-
-    def _mark_young(self, obj: Optional[_Obj]) -> None:
-        # marking starts from a young obj and only follow young -> young links
-        # NOT to traverse into old objs, keeps minorGC cheap
-        if obj is None or obj.freed:
-            return
-        if obj.marked:
-            return
-
-        if obj.generation != 0:
-            return
-
-        obj.marked = True
-        for child_ref in obj.fields.values():
-            child = self._get_obj(child_ref)
-            if child is not None and child.generation == 0:
-                self._mark_young(child)
+        stack = MarkStack(self._mark_bit)
+        stack.push(obj)
+        stack.drain()
 
     def _sweep(self) -> None:
-        to_free = []
+        # walk each generation in place (no merged copy of the heap), only
+        # the garbage is collected into a list. survivors are not written:
+        # flipping _mark_bit at the end turns them all white at once
+        bit = self._mark_bit
+        for space in (self.young, self.old):
+            to_free = [obj for obj in space.values() if obj.marked is not bit]
+            for obj in to_free:
+                del space[obj.id]
+                self.remembered.pop(obj.id, None)
+            self._recycle(to_free)
+            self._stats.freed += len(to_free)
 
-        # for oid, obj in list(self.heap.items()):
-        for oid, obj in list({**self.young, **self.old}.items()):
-            if obj.marked:
-                obj.marked = False
-            else:
-                to_free.append(oid)
-
-        for oid in to_free:
-            self._free(oid)
+        self._mark_bit = not bit
 
     def _free(self, oid: int) -> None:
         # obj = self.heap.get(oid)
@@ -152,79 +372,320 @@ class MarkSweepGC:
             if obj.freed:
                 return
 
-            obj.freed = True
-            obj.fields.clear()
             del self.young[oid]
+            self._recycle((obj,))
             return
 
         obj = self.old.get(oid)
         if obj is not None:
             if obj.freed:
                 return
-            obj.freed = True
-            obj.fields.clear()
             del self.old[oid]
+            self.remembered.pop(oid, None)
+            self._recycle((obj,))
             return
 
     def minor_gc(self):
-        for root_id in list(self.roots):
-            root_obj = self.young.get(root_id)
-            if root_obj:
-                self._mark_young(root_obj)
-            # self._mark(self.young.get(root_id))
-
-        for oid in list(self.card_table):
-            parent = self.old.get(oid)
-            if parent:
-                for child_ref in parent.fields.values():
-                    child = self._get_obj(child_ref)
-                    if child is not None and child.generation == 0:
-                        self._mark_young(child)
-
-        for oid, obj in list(self.young.items()):
-            if obj.marked:
-                obj.marked = False
-                obj.age += 1
-                if obj.age >= 2:
-                    self._promote(oid, obj)
+        with self._stats.pause("minor"):
+            self._scavenge()
+
+    def _scavenge(self) -> None:
+        # cheney style semi-space scavenge: self.young is from-space, live
+        # young objects are "copied" (moved) breadth first into a fresh
+        # to-space dict, or straight into old once they are old enough.
+        # the `scan` list is cheney's scan pointer: everything copied is
+        # appended, and scanning it copies their young children in turn.
+        # from-space is then dropped as a whole, so the cost is the
+        # survivors, the dead young objects are never even looked at
+        # (they are only flagged freed when somebody touches them, see _get_obj)
+        # except in recycle mode, where their shells go back to the pool
+        young = self.young
+        old = self.old
+        to_space: Dict[int, _Obj] = {}
+        scan: List[_Obj] = []
+        remembered = self.remembered
+        stats = self._stats
+
+        def copy(obj: _Obj) -> None:
+            obj.age += 1
+            if obj.age >= 2:
+                obj.generation = 1
+                obj.age = 0
+                old[obj.id] = obj
             else:
-                self._free_young(oid)
+                to_space[obj.id] = obj
+            scan.append(obj)
 
-        self.card_table.clear()
-        self._minor_gc_count += 1
+        with stats.phase("copy"):
+            for root_id in self.roots:
+                obj = young.get(root_id)
+                if obj is not None and obj.id not in to_space:
+                    copy(obj)
 
-    def _promote(self, oid, obj):
+        # the remembered slots are roots too. entries whose child got
+        # promoted are pruned, the rest stay for the next minor gc
+        with stats.phase("remembered"):
+            for oid in list(remembered):
+                parent = old[oid]
+                slots = remembered[oid]
+                for i in list(slots):
+                    child = parent.slots[i]
+                    if child.id not in to_space and child.generation == 0:
+                        copy(child)
+                    if child.generation != 0:
+                        slots.discard(i)
+                if not slots:
+                    del remembered[oid]
 
-        if oid not in self.young:
-            return
+        with stats.phase("copy"):
+            i = 0
+            while i < len(scan):
+                obj = scan[i]
+                i += 1
+                promoted = obj.generation == 1
+                for j, child in enumerate(obj.slots):
+                    if child is None or child.generation != 0:
+                        continue
+                    if child.id not in to_space:
+                        copy(child)
+                    if promoted and child.generation == 0:
+                        # promoted ahead of its child: now an old -> young edge
+                        remembered.setdefault(obj.id, set()).add(j)
 
-        obj.generation = 1
-        obj.age = 0
-        del self.young[oid]
+        self.young = to_space
+        if self._pool is not None:
+            # survivors are in to-space under the same id, or promoted
+            self._recycle(
+                [o for o in young.values() if o.generation == 0 and to_space.get(o.id) is not o]
+            )
+        if self._young_finalizable:
+            self._scavenge_finalizable()
+        stats.freed += len(young) - len(scan)
+        self._minor_gc_count += 1
+        self._allocated = 0
+        self.policy.after_minor(self, len(young), len(scan))
 
-        self.old[oid] = obj
+    def _scavenge_finalizable(self) -> None:
+        # dead young objects with finalizers are flagged + queued right away,
+        # the promoted ones leave for old (the sweep finds those)
+        to_space = self.young
+        finalizable = self._finalizable
+        dead = []
+        still_young = {}
+        for obj in self._young_finalizable:
+            if obj not in finalizable or obj.generation != 0:
+                continue
+            if to_space.get(obj.id) is obj:
+                still_young[obj] = None
+            else:
+                dead.append(obj)
+        self._young_finalizable = still_young
+        self._recycle(dead)
 
-    def _free_young(self, oid):
-        obj = self.young.get(oid)
-        if obj:
-            obj.freed = True
-            obj.fields.clear()
-            del self.young[oid]
+    def weakref(self, obj_ref: ObjectRef) -> WeakRef:
+        # a reference that does not keep its target alive (see gc_common/finalize.py)
+        return WeakRef(self, obj_ref)
 
-    def full_gc(self) -> None:
-        for root_id in list(self.roots):
+    def finalize(self, obj_ref: ObjectRef, fn: Any, *args: Any) -> None:
+        # fn(*args) goes on self.finalizers once the object is freed
+        obj = self._get_obj(obj_ref)
+        if obj is None or obj.freed:
+            raise RuntimeError("finalize() on a freed or non existent object.")
+        self._finalizable.setdefault(obj, []).append((fn, args))
+        if obj.generation == 0:
+            self._young_finalizable[obj] = None
+
+    def _root_stack(self) -> MarkStack:
+        stack = MarkStack(self._mark_bit)
+        for root_id in self.roots:
             # obj = self.heap.get(root_id)
-            obj = self.young.get(root_id) or self.old.get(root_id)
+            stack.push(self.young.get(root_id) or self.old.get(root_id))
+        return stack
+
+    def full_gc(self) -> None:
+        self._finish_full()
+        stats = self._stats
+        with stats.pause("full"):
+            with stats.phase("mark"):
+                self._root_stack().drain()
+            with stats.phase("sweep"):
+                self._sweep()
+            self._after_full()
+
+    def parallel_full_gc(self, workers: int = 4) -> None:
+        # full gc with the marking spread over worker processes
+        # (see parallel_mark.py), the sweep reads the bitmap directly so
+        # survivors keep their white mark and no flip is needed
+        self._finish_full()
+        if self._mark_pool is None or self._mark_pool.workers != workers:
+            self.close()
+            self._mark_pool = MarkPool(workers)
+
+        stats = self._stats
+        with stats.pause("parallel_full"):
+            with stats.phase("mark"):
+                objs = [*self.young.values(), *self.old.values()]
+                roots = []
+                for root_id in self.roots:
+                    obj = self.young.get(root_id) or self.old.get(root_id)
+                    if obj is not None:
+                        roots.append(obj)
+                marks = self._mark_pool.mark(objs, roots)
+
+            with stats.phase("sweep"):
+                dead = []
+                for obj, marked in zip(objs, marks):
+                    if not marked:
+                        space = self.young if obj.generation == 0 else self.old
+                        del space[obj.id]
+                        self.remembered.pop(obj.id, None)
+                        dead.append(obj)
+                self._recycle(dead)
+                stats.freed += len(dead)
+            self._after_full()
+
+    def _after_full(self) -> None:
+        live = len(self.young) + len(self.old)
+        top = max(max(self.young, default=0), max(self.old, default=0)) - self._id_base
+        if self.auto_compact and self._pool is None and top > _COMPACT_SPARSENESS * live:
+            with self._stats.phase("compact"):
+                self.compact()
+        self.policy.after_full(self)
+
+    def compact(self) -> Dict[int, int]:
+        # sliding compaction of the id space: survivors keep their order but
+        # are renumbered into a dense range again, instead of a few objects
+        # spread over millions of ids. the range starts above every id handed
+        # out so far, so an id taken before the move never names another
+        # object after it, it just is not there anymore
+        # returns the forwarding table (old id -> new id) used to rewrite
+        # roots and the remembered set. ObjectRefs point at the _Obj itself, so they
+        # follow the move for free (the _Obj is its own forwarding pointer)
+        # not in recycle mode: there the ids stay dense on their own, and a
+        # renumbered id would look like a reused shell to every ref
+        if self._pool is not None:
+            raise RuntimeError("compact() does not work in recycle mode.")
+        self._finish_full()
+        objs = sorted([*self.young.values(), *self.old.values()], key=lambda o: o.id)
+        first = next(self._next_id)
+        forward: Dict[int, int] = {}
+        young: Dict[int, _Obj] = {}
+        old: Dict[int, _Obj] = {}
+        for new_id, obj in enumerate(objs, first):
+            forward[obj.id] = new_id
+            obj.id = new_id
+            if obj.generation == 0:
+                young[new_id] = obj
+            else:
+                old[new_id] = obj
+
+        # rebuilt in id order, iteration walks the ids front to back
+        self.young = young
+        self.old = old
+        self.roots = {forward[oid] for oid in self.roots if oid in forward}
+        self.remembered = {forward[oid]: slots for oid, slots in self.remembered.items()}
+        self._next_id = itertools.count(first + len(objs))
+        self._id_base = first - 1
+        return forward
+
+    async def collect_async(self, slice_budget: int = 1024, max_lag: Optional[float] = None) -> None:
+        # gc() with the full gc cut in slices of slice_budget objects, for
+        # asyncio programs: an await between two slices, other tasks may
+        # alloc / set_field in between (dijkstra barrier + allocating black,
+        # as in ms_gc's incremental cycle). with max_lag (seconds) the
+        # slices are resized to stay under it (see gc_slices.py)
+        # the minor gc before it is one slice, it only costs the survivors.
+        # minor gcs from other tasks are fine meanwhile, a full_gc() (or
+        # gc() wanting one) finishes this cycle first
+        # REM: no compaction at the end, it would be one pause over the heap.
+        # not sliced either: shading the roots, and the list of objects to
+        # sweep (one copy of young + old, at C speed)
+        slices = Slices(slice_budget, max_lag)
+        if self._cycle is None and self._sweep_objs is None:
+            slices.run(lambda budget: self.minor_gc())
+            await slices.pause()
+            slices.run(lambda budget: self._start_full())
+        while not slices.run(self._mark_slice):
+            await slices.pause()
+        if self._sweep_objs is None and self._cycle is not None:
+            # right after the last slice, nothing has been shaded since
+            self._start_sweep()
+        while self._sweep_objs is not None:
+            await slices.pause()
+            slices.run(self._sweep_slice)
+
+    def _start_full(self) -> None:
+        with self._stats.pause("full_start"), self._stats.phase("mark"):
+            self._cycle = self._root_stack()
+
+    def _mark_slice(self, budget: int) -> bool:
+        # True once there is nothing gray left
+        if self._cycle is None:
+            return True
+        stats = self._stats
+        with stats.pause("full_step"), stats.phase("mark"):
+            self._cycle.drain(budget)
+        return not self._cycle
 
-            if obj is not None:
-                self._mark(obj)
+    def _start_sweep(self) -> None:
+        stats = self._stats
+        with stats.pause("full_finish"), stats.phase("mark"):
+            self._cycle.drain()
+            self._cycle = None
+            self._sweep_objs = [*self.young.values(), *self.old.values()]
+            self._sweep_pos = 0
 
-        self._sweep()
+    def _sweep_slice(self, budget: int) -> int:
+        # sweep up to budget objects of collect_async()'s list, returns
+        # how many were freed. timed by hand like ms_gc's sweep_step
+        start = perf_counter_ns()
+        objs = self._sweep_objs
+        bit = self._mark_bit
+        end = min(self._sweep_pos + budget, len(objs))
+        dead = []
+        for i in range(self._sweep_pos, end):
+            obj = objs[i]
+            if obj.marked is bit or obj.freed:
+                continue
+            space = self.young if obj.generation == 0 else self.old
+            if space.get(obj.id) is not obj:
+                continue  # dropped by a minor gc meanwhile
+            del space[obj.id]
+            self.remembered.pop(obj.id, None)
+            dead.append(obj)
+        self._recycle(dead)
+        self._sweep_pos = end
+        stats = self._stats
+        stats.freed += len(dead)
+        stats.add_pause("sweep_step", perf_counter_ns() - start, "sweep")
+
+        if end == len(objs):
+            self._sweep_objs = None
+            self._sweep_pos = 0
+            self._mark_bit = not bit
+            self.policy.after_full(self)
+        return len(dead)
+
+    def _finish_full(self) -> None:
+        # the rest of a collect_async() cycle in one go
+        if self._cycle is not None:
+            self._start_sweep()
+        if self._sweep_objs is not None:
+            self._sweep_slice(len(self._sweep_objs))
+
+    def close(self) -> None:
+        # stop the parallel_full_gc() worker processes and the finalizer
+        # thread, if any
+        if self._mark_pool is not None:
+            self._mark_pool.close()
+            self._mark_pool = None
+        self.finalizers.stop()
 
     def gc(self):
-        self.minor_gc()
-        if self._minor_gc_count % 8 == 0:
-            self.full_gc()
+        with self._stats.pause("gc"):
+            self.minor_gc()
+            if self.policy.want_full(self):
+                self.full_gc()
 
     def heap_snapshot(self) -> str:
         total = len(self.young) + len(self.old)
@@ -235,7 +696,386 @@ class MarkSweepGC:
         ]
 
         # for oid in sorted(self.heap):
-        for oid in sorted({**self.young, **self.old}):
+        bit = self._mark_bit
+        for oid in sorted([*self.young, *self.old]):
             obj = self.young.get(oid) or self.old.get(oid)
-            lines.append(repr(obj))
+            lines.append(obj.describe(obj.marked is bit))
         return "\n".join(lines)
+
+    def iter_records(self) -> Iterator[HeapRecord]:
+        # streaming alternative to heap_snapshot(), young then old, unsorted
+        for space in (self.young, self.old):
+            for obj in space.values():
+                edges = [
+                    (n, c.id) for n, c in zip(obj.shape.names, obj.slots) if c is not None
+                ]
+                yield HeapRecord(obj.id, obj.value, obj.generation, obj.age, edges=edges)
+
+    def dump(self, path: str) -> int:
+        # binary heap dump (see gc_common/heap_dump.py), returns the number of objects
+        return write_dump(path, self.roots, self.iter_records())
+
+    @classmethod
+    def load(cls, path: str) -> "MarkSweepGC":
+        # a fresh collector holding the dumped heap, generations and ages kept
+        gc = cls()
+        objs: Dict[int, _Obj] = {}
+        white = not gc._mark_bit
+        links = []
+        with HeapDump(path) as dump:
+            for rec in dump:
+                obj = _Obj(rec.id, rec.value)
+                obj.marked = white
+                obj.generation = rec.generation
+                obj.age = rec.age
+                objs[rec.id] = obj
+                if obj.generation == 0:
+                    gc.young[rec.id] = obj
+                else:
+                    gc.old[rec.id] = obj
+                if rec.edges:
+                    links.append((obj, rec.edges))
+            gc.roots = set(dump.roots)
+
+        # children can come after their parents, link at the end and
+        # rebuild the remembered set on the way
+        for obj, edges in links:
+            for name, child in edges:
+                obj.put(name, objs[child])
+            if obj.generation == 1:
+                slots = {i for i, c in enumerate(obj.slots) if c.generation == 0}
+                if slots:
+                    gc.remembered[obj.id] = slots
+        gc._next_id = itertools.count(max(objs, default=0) + 1)
+        return gc
+
+
+class ConcurrentMarkSweepGC(MarkSweepGC):
+    # generational collector whose FULL gc marks on a background thread
+    # (see ConcurrentMarker), minor gcs stay stop-the-world
+    # REM: same GIL caveat as ms_gc.ConcurrentMarkSweepGC
+
+    def __init__(
+        self, step: int = 256, policy: Optional[GCPolicy] = None, auto_compact: bool = False
+    ):
+        super().__init__(policy, auto_compact=auto_compact)
+        self.step = step
+        # every mutator op holds this, the collector takes it to stop the world
+        self._world = threading.RLock()
+        self._marker: Optional[ConcurrentMarker] = None
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        # collect BEFORE taking the world lock: gc() waits for the marker
+        # thread, which needs the lock for its remark
+        if self._allocated >= self.policy.young_limit:
+            self.gc()
+        with self._world:
+            ref = self._alloc(value)
+            if self._marker is not None:
+                ref._obj.marked = self._mark_bit  # allocate black
+            return ref
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        with self._world:
+            marker = self._marker
+            if marker is not None:
+                parent = self._get_obj(parent_ref)
+                if parent is not None and not parent.freed:
+                    # SATB: log the value about to be overwritten (+ the new one)
+                    marker.shade(parent.get(field_name))
+                    marker.shade(self._get_obj(child_ref))
+            super().set_field(parent_ref, field_name, child_ref)
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        # collect BEFORE taking the world lock, as in alloc()
+        if self._allocated >= self.policy.young_limit:
+            self.gc()
+        with self._world:
+            refs = self._alloc_many(values)
+            if self._marker is not None:
+                bit = self._mark_bit
+                for ref in refs:
+                    ref._obj.marked = bit  # allocate black
+            return refs
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        with self._world:
+            parents, names, children = self._bulk_edges(parents, names, children)
+            marker = self._marker
+            if marker is not None:
+                # SATB for the whole batch, before any of it is written
+                for parent, name, child in zip(parents, names, children):
+                    marker.shade(parent.get(name))
+                    marker.shade(child)
+            self._set_edges(parents, names, children)
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        with self._world:
+            super().add_root(obj_ref)
+            if self._marker is not None:
+                self._marker.shade(self._get_obj(obj_ref))
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        with self._world:
+            super().remove_root(obj_ref)
+
+    def minor_gc(self):
+        # a minor gc moves objects between young and old, it must not run
+        # while the full gc is marking them
+        self.wait()
+        with self._world:
+            super().minor_gc()
+
+    def start_concurrent_full_gc(self) -> None:
+        # short pause: snapshot the roots and hand off to the marker thread
+        with self._world:
+            if self._marker is not None:
+                return
+            stats = self._stats
+            with stats.pause("full_start"), stats.phase("mark"):
+                stack = self._root_stack()
+            self._marker = ConcurrentMarker(
+                stack, self._world, self._remark_done, self.step
+            )
+            self._marker.start()
+
+    def _remark_done(self) -> None:
+        # called by the marker thread, world already stopped
+        # REM: the remark drain just before this is not timed, only the sweep
+        self._marker = None
+        stats = self._stats
+        with stats.pause("remark"):
+            with stats.phase("sweep"):
+                self._sweep()
+            self._after_full()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # block until the running full gc (if any) is swept, True when done
+        marker = self._marker
+        if marker is None:
+            return True
+        return marker.join(timeout)
+
+    def full_gc(self) -> None:
+        self.start_concurrent_full_gc()
+        self.wait()
+
+    def gc(self):
+        # no outer "gc" pause here: the full gc marks while the mutators
+        # run, only its start and the remark stop the world
+        self.minor_gc()
+        if self.policy.want_full(self):
+            self.full_gc()
+
+    def heap_snapshot(self) -> str:
+        with self._world:
+            return super().heap_snapshot()
+
+    def dump(self, path: str) -> int:
+        with self._world:
+            return super().dump(path)
+
+    def stats(self) -> GCStats:
+        with self._world:
+            return super().stats()
+
+
+class ThreadSafeMarkSweepGC(MarkSweepGC):
+    # generational collector safe to call from several mutator threads at
+    # once, same scheme as ms_gc.ThreadSafeMarkSweepGC (see gc_common/safepoint.py):
+    # per-thread ids and allocation buffers, set_field locks the parent's
+    # stripe (the remembered set entry of a parent is only touched under
+    # it), collections stop the world and move the buffers into young first
+    # no recycle mode: the pool would be one more shared list to fight over
+    #
+    # a young object may sit in an allocation buffer instead of young, so
+    # _get_obj cannot use "not in young" to spot dead from-space objects,
+    # the scavenge flags them itself instead
+    #
+    # collect_async() works: each slice is a stop, the world runs again at
+    # every await
+
+    def __init__(self, policy: Optional[GCPolicy] = None, auto_compact: bool = False):
+        super().__init__(policy, auto_compact=auto_compact)
+        self._safepoint = Safepoint()
+        self._next_id = ThreadIds()
+        self._stripes = stripes()
+        # _get_obj frees collect_async()'s unswept garbage from the mutators
+        self._free_lock = threading.Lock()
+
+    @contextmanager
+    def _stopped(self) -> Iterator[None]:
+        with self._safepoint.stopped():
+            self._safepoint.flush(self.young)
+            yield
+
+    def _collect_if_due(self) -> None:
+        # several threads can see the limit at once, only the first collects
+        with self._safepoint.stopped():
+            if self._allocated >= self.policy.young_limit:
+                self.gc()
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        # collect BEFORE entering: stopping the world from inside an
+        # operation is not allowed
+        if self._allocated >= self.policy.young_limit:
+            self._collect_if_due()
+        m = self._safepoint.enter()
+        try:
+            oid = next(self._next_id)
+            obj = _Obj(id=oid, value=value)
+            if self._cycle is None and self._sweep_objs is None:
+                obj.marked = not self._mark_bit  # white
+            else:
+                obj.marked = self._mark_bit  # black, see _alloc()
+            obj.generation = 0
+            obj.age = 0
+            buf = m.allocated
+            buf[oid] = obj
+            if not len(buf) & 255:
+                # the shared count is bumped once per 256 allocations of a
+                # thread, not on every one. REM: the += can lose an update
+                # to another thread, it only decides when to collect
+                self._allocated += 256
+            return ObjectRef(obj)
+        finally:
+            m.depth -= 1
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        if self._allocated >= self.policy.young_limit:
+            self._collect_if_due()
+        values = as_list(values)
+        if not values:
+            return []
+        m = self._safepoint.enter()
+        try:
+            first = self._next_id.take(len(values))
+            ids = range(first, first + len(values))
+            objs = list(map(_Obj, ids, values))
+            if self._cycle is None and self._sweep_objs is None:
+                marked = not self._mark_bit  # white
+            else:
+                marked = self._mark_bit  # black, see _alloc()
+            for obj in objs:
+                obj.marked = marked
+            m.allocated.update(zip(ids, objs))
+            self._allocated += len(values)
+            return list(map(ObjectRef, objs))
+        finally:
+            m.depth -= 1
+
+    def _get_obj(self, obj_ref: Optional[ObjectRef]) -> Optional[_Obj]:
+        if obj_ref is None:
+            return None
+        obj = obj_ref._obj
+        if self._sweep_objs is not None and obj.marked is not self._mark_bit and not obj.freed:
+            # see MarkSweepGC._get_obj. the sweep slices run with the world
+            # stopped, so this lock is just between mutators
+            with self._free_lock:
+                if not obj.freed:
+                    self._free(obj.id)
+                    self._stats.freed += 1
+        return obj
+
+    def _scavenge(self) -> None:
+        young = self.young
+        super()._scavenge()
+        to_space = self.young
+        self._recycle(
+            [o for o in young.values() if o.generation == 0 and to_space.get(o.id) is not o]
+        )
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        m = self._safepoint.enter()
+        try:
+            parent = self._get_obj(parent_ref)
+            if parent is None or parent.freed:
+                raise RuntimeError("setting field on freed or non existent parent.")
+            with self._stripes[parent.id & STRIPE_MASK]:
+                super().set_field(parent_ref, field_name, child_ref)
+        finally:
+            m.depth -= 1
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        with self._stopped():
+            super().set_fields_bulk(parents, names, children)
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            super().add_root(obj_ref)
+        finally:
+            m.depth -= 1
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            super().remove_root(obj_ref)
+        finally:
+            m.depth -= 1
+
+    def minor_gc(self):
+        with self._stopped():
+            super().minor_gc()
+
+    def full_gc(self) -> None:
+        with self._stopped():
+            super().full_gc()
+
+    def parallel_full_gc(self, workers: int = 4) -> None:
+        with self._stopped():
+            super().parallel_full_gc(workers)
+
+    def _start_full(self) -> None:
+        with self._stopped():
+            super()._start_full()
+
+    def _mark_slice(self, budget: int) -> bool:
+        with self._stopped():
+            return super()._mark_slice(budget)
+
+    def _start_sweep(self) -> None:
+        with self._stopped():
+            super()._start_sweep()
+
+    def _sweep_slice(self, budget: int) -> int:
+        with self._stopped():
+            return super()._sweep_slice(budget)
+
+    def compact(self) -> Dict[int, int]:
+        with self._stopped():
+            # above the chunks of every thread, not just this one's
+            self._next_id = itertools.count(self._next_id.take(0))
+            forward = super().compact()
+            self._next_id = ThreadIds(next(self._next_id))
+            return forward
+
+    def gc(self):
+        with self._stopped():
+            super().gc()
+
+    def heap_snapshot(self) -> str:
+        with self._stopped():
+            return super().heap_snapshot()
+
+    def dump(self, path: str) -> int:
+        with self._stopped():
+            return super().dump(path)
+
+    def stats(self) -> GCStats:
+        with self._stopped():
+            return super().stats()
+
+    @classmethod
+    def load(cls, path: str) -> "ThreadSafeMarkSweepGC":
+        gc = super().load(path)
+        gc._next_id = ThreadIds(max(max(gc.young, default=0), max(gc.old, default=0)) + 1)
+        return gc
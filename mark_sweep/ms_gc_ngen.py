@@ -0,0 +1,272 @@
+from typing import Dict, List, Optional, Any, Sequence, Set
+import itertools
+
+from gc_common.gc_stats import GCStats
+from ms_gc_gen import ObjectRef, _Obj
+
+# ms_gc_gen.MarkSweepGC with any number of generations instead of young/old
+#
+# generation 0 is the nursery, generation n - 1 the oldest. collect(k)
+# collects generations 0..k at once: a cheney scan (see ms_gc_gen.minor_gc)
+# from the roots and from the remembered slots of generations older than k.
+# every survivor gets a year older, once it reaches tenure[g] it moves up to
+# generation g + 1, otherwise it stays in g. the old dicts of 0..k are then
+# dropped as a whole, the dead are only flagged freed when touched
+#
+# scheduling is cpython style: generation k (and everything younger) is
+# collected once generation k - 1 was collected every[k] times since.
+# a 3 generation heap gives medium lived objects a tier where they can die
+# without waiting for (and dragging out) a full gc
+#
+# dynamic tenuring (hotspot's adaptive tenuring): with survivor_target[g]
+# set, tenure[g] is recomputed after every collection of g so that about
+# survivor_target[g] objects stay behind, the oldest survivors go up first.
+# tenure[g] given in the constructor is then the upper bound
+
+
+class NGenMarkSweepGC:
+    def __init__(
+        self,
+        generations: int = 3,
+        every: Optional[Sequence[int]] = None,
+        tenure: Optional[Sequence[int]] = None,
+        survivor_target: Optional[Sequence[Optional[int]]] = None,
+        nursery: Optional[int] = None,
+    ):
+        if generations < 2:
+            raise ValueError("need at least 2 generations.")
+        n = generations
+        self.n = n
+        # every[0] is unused, gen 0 is collected on every gc()
+        self.every: List[int] = list(every) if every is not None else [1] + [8] * (n - 1)
+        # tenure[g] = age at which an object leaves generation g, no entry
+        # for the oldest generation
+        self.max_tenure: List[int] = list(tenure) if tenure is not None else [2] * (n - 1)
+        self.tenure: List[int] = list(self.max_tenure)
+        self.survivor_target: List[Optional[int]] = (
+            list(survivor_target) if survivor_target is not None else [None] * (n - 1)
+        )
+        if len(self.every) != n or len(self.tenure) != n - 1 or len(self.survivor_target) != n - 1:
+            raise ValueError("every needs one entry per generation, tenure and survivor_target one less.")
+
+        self._next_id = itertools.count(1)
+        self.roots: Set[int] = set()
+        self.generations: List[Dict[int, _Obj]] = [{} for _ in range(n)]
+        # parent id -> indexes of its slots that point into a YOUNGER generation
+        self.remembered: Dict[int, Set[int]] = {}
+        # _counts[g] = collections of generation g - 1 since g was last collected
+        self._counts: List[int] = [0] * n
+        self.collections: List[int] = [0] * n
+
+        # gc() from alloc() after this many allocations, None = never
+        self.nursery = nursery
+        self._allocated = 0
+
+        self._stats = GCStats()
+
+    def stats(self) -> GCStats:
+        # counters, phase timings and pauses so far (see gc_common/gc_stats.py),
+        # collections are counted as "gen0", "gen1" ...
+        stats = self._stats
+        stats.heap_size = sum(len(space) for space in self.generations)
+        stats.allocated = stats.heap_size + stats.freed
+        return stats
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        if self.nursery is not None and self._allocated >= self.nursery:
+            self.gc()
+        self._allocated += 1
+        oid = next(self._next_id)
+        obj = _Obj(id=oid, value=value)
+        self.generations[0][oid] = obj
+        return ObjectRef(obj)
+
+    def _get_obj(self, obj_ref: Optional[ObjectRef]) -> Optional[_Obj]:
+        if obj_ref is None:
+            return None
+        obj = obj_ref._obj
+        if not obj.freed and self.generations[obj.generation].get(obj.id) is not obj:
+            # left behind when its generation was collected, flag it now
+            obj.freed = True
+            obj.clear()
+        return obj
+
+    def _find(self, oid: int) -> Optional[_Obj]:
+        for space in self.generations:
+            obj = space.get(oid)
+            if obj is not None:
+                return obj
+        return None
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, child_ref: Optional[ObjectRef]
+    ) -> None:
+        parent = self._get_obj(parent_ref)
+        if parent is None or parent.freed:
+            raise RuntimeError("setting field on freed or non existent parent.")
+
+        child = self._get_obj(child_ref)
+        parent.put(field_name, child)
+        # write-barrier: remember older -> younger stores, forget the slot
+        # when it is overwritten with anything else
+        if parent.generation == 0:
+            return
+        if child is not None and child.generation < parent.generation:
+            i = parent.shape.index[field_name]
+            slots = self.remembered.get(parent.id)
+            if slots is None:
+                self.remembered[parent.id] = {i}
+            else:
+                slots.add(i)
+        else:
+            slots = self.remembered.get(parent.id)
+            if slots is not None:
+                slots.discard(parent.shape.index.get(field_name))
+                if not slots:
+                    del self.remembered[parent.id]
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        obj = self._get_obj(obj_ref)
+        if obj is None or obj.freed:
+            return
+        self.roots.add(obj.id)
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        obj = self._get_obj(obj_ref)
+        if obj is None or obj.freed:
+            return
+        self.roots.discard(obj.id)
+
+    def collect(self, k: int) -> None:
+        # collect generations 0..k
+        with self._stats.pause(f"gen{k}"):
+            self._scavenge(k)
+
+    def _scavenge(self, k: int) -> None:
+        gens = self.generations
+        from_spaces = gens[: k + 1]
+        to_spaces: List[Dict[int, _Obj]] = [{} for _ in range(k + 1)]
+        tenure = self.tenure
+        top = self.n - 1
+        scan: List[_Obj] = []
+        remembered = self.remembered
+        stats = self._stats
+
+        def copy(obj: _Obj) -> None:
+            g = obj.generation
+            obj.age += 1
+            if g < top and obj.age >= tenure[g]:
+                g += 1
+                obj.generation = g
+                obj.age = 0
+            if g <= k:
+                to_spaces[g][obj.id] = obj
+            else:
+                gens[g][obj.id] = obj  # promoted out of the collected range
+            scan.append(obj)
+
+        def copied(obj: _Obj) -> bool:
+            # only asked for generation <= k: anything promoted past k is
+            # never looked at again, its generation says so
+            return to_spaces[obj.generation].get(obj.id) is obj
+
+        with stats.phase("copy"):
+            for root_id in self.roots:
+                for g in range(k + 1):
+                    obj = from_spaces[g].get(root_id)
+                    if obj is not None:
+                        if not copied(obj):
+                            copy(obj)
+                        break
+
+        # remembered slots of older generations are roots too, entries of
+        # the collected generations are rebuilt by the scan below
+        with stats.phase("remembered"):
+            for oid in list(remembered):
+                parent = self._find(oid)
+                if parent is None or parent.generation <= k:
+                    del remembered[oid]
+                    continue
+                slots = remembered[oid]
+                for i in list(slots):
+                    child = parent.slots[i]
+                    if child.generation <= k and not copied(child):
+                        copy(child)
+                    if child.generation >= parent.generation:
+                        slots.discard(i)
+                if not slots:
+                    del remembered[oid]
+
+        with stats.phase("copy"):
+            i = 0
+            while i < len(scan):
+                obj = scan[i]
+                i += 1
+                g = obj.generation
+                for j, child in enumerate(obj.slots):
+                    if child is None:
+                        continue
+                    if child.generation <= k and not copied(child):
+                        copy(child)
+                    if child.generation < g:
+                        remembered.setdefault(obj.id, set()).add(j)
+
+        stats.freed += sum(len(space) for space in from_spaces) - len(scan)
+        for g in range(k + 1):
+            gens[g] = to_spaces[g]
+
+        self.collections[k] += 1
+        for g in range(1, k + 1):
+            self._counts[g] = 0
+        if k + 1 < self.n:
+            self._counts[k + 1] += 1
+        self._allocated = 0
+        for g in range(min(k + 1, top)):
+            if self.survivor_target[g] is not None:
+                self._adjust_tenure(g)
+
+    def _adjust_tenure(self, g: int) -> None:
+        # hotspot: walk the survivors by age, youngest first, the age at
+        # which they no longer fit in the target becomes the threshold
+        ages: Dict[int, int] = {}
+        for obj in self.generations[g].values():
+            ages[obj.age] = ages.get(obj.age, 0) + 1
+        target = self.survivor_target[g]
+        total = 0
+        threshold = self.max_tenure[g]
+        for age in sorted(ages):
+            total += ages[age]
+            if total > target:
+                threshold = min(max(age, 1), threshold)
+                break
+        self.tenure[g] = threshold
+
+    def gc(self) -> None:
+        # the oldest generation that is due, plus everything younger
+        k = 0
+        while k + 1 < self.n and self._counts[k + 1] + 1 >= self.every[k + 1]:
+            k += 1
+        self.collect(k)
+
+    def full_gc(self) -> None:
+        self.collect(self.n - 1)
+
+    def heap_snapshot(self) -> str:
+        sizes = [len(space) for space in self.generations]
+        lines = [
+            f"HEAP total={sum(sizes)}, generations={sizes}, ROOTS={sorted(list(self.roots))}"
+        ]
+        objs = sorted(
+            (obj for space in self.generations for obj in space.values()),
+            key=lambda o: o.id,
+        )
+        for obj in objs:
+            flds = [
+                f"{n} -> #{c.id}" for n, c in zip(obj.shape.names, obj.slots) if c is not None
+            ]
+            fstr = "[" + ", ".join(flds) + "]" if flds else "[]"
+            lines.append(
+                f"_Obj #{obj.id} (val={obj.value!r}, gen={obj.generation}, "
+                f"age={obj.age}, fields={fstr})"
+            )
+        return "\n".join(lines)
@@ -1,4 +1,19 @@
-from ms_gc import MarkSweepGC
+import asyncio
+import random
+import sys
+import threading
+
+import pytest
+
+from gc_slices import Slices
+from ms_gc import ConcurrentMarkSweepGC, MarkSweepGC, ObjectRef, ThreadSafeMarkSweepGC
+
+try:
+    from ms_gc_array import ArrayMarkSweepGC
+except ImportError:  # numpy not installed
+    ArrayMarkSweepGC = None
+
+HEAPS = [MarkSweepGC] + ([ArrayMarkSweepGC] if ArrayMarkSweepGC else [])
 
 gc = MarkSweepGC()
 """
@@ -49,3 +64,750 @@ print(gc.heap_snapshot())
 
 gc.gc()
 print(gc.heap_snapshot())
+
+
+@pytest.mark.parametrize("heap", HEAPS)
+def test_tree_and_cycles(heap):
+    gc = heap()
+    obj_a = gc.alloc("Node A")
+    obj_b = gc.alloc("Node B")
+    obj_c = gc.alloc("Node C")
+    obj_d = gc.alloc("Node D")
+    gc.set_field(obj_a, "left", obj_b)
+    gc.set_field(obj_a, "right", obj_d)
+    gc.set_field(obj_b, "child", obj_c)
+    gc.add_root(obj_a)
+
+    gc.gc()
+    assert len(gc.heap) == 4
+
+    gc.set_field(obj_a, "right", None)
+    gc.gc()
+    print(gc.heap_snapshot())
+    assert len(gc.heap) == 3
+    assert "fields=[left -> #2]" in gc.heap_snapshot()
+
+    orphans = [gc.alloc(v) for v in "XYZ"]
+    for i in range(3):
+        gc.set_field(orphans[i], "next", orphans[(i + 1) % 3])
+    gc.set_field(obj_c, "next", obj_a)
+    assert len(gc.heap) == 6
+
+    gc.gc()
+    assert len(gc.heap) == 3
+    with pytest.raises(RuntimeError):
+        gc.set_field(obj_d, "next", obj_a)
+
+    gc.remove_root(obj_a)
+    gc.gc()
+    assert len(gc.heap) == 0
+
+
+@pytest.mark.parametrize("heap", HEAPS)
+def test_long_chain_marks_without_recursion(heap):
+    # a few thousand nodes used to hit RecursionError in _mark
+    gc = heap()
+    head = gc.alloc(0)
+    gc.add_root(head)
+    prev = head
+    for i in range(1, 100_000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+
+    gc.alloc("garbage")
+    gc.gc()
+    assert len(gc.heap) == 100_000
+
+    gc.set_field(head, "next", None)
+    gc.gc()
+    assert len(gc.heap) == 1
+
+
+@pytest.mark.parametrize("heap", HEAPS)
+def test_wide_tree(heap):
+    gc = heap()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(1000):
+        child = gc.alloc(i)
+        gc.set_field(root, f"c{i}", child)
+        for j in range(10):
+            gc.set_field(child, f"c{j}", gc.alloc((i, j)))
+
+    gc.gc()
+    assert len(gc.heap) == 1 + 1000 + 1000 * 10
+
+
+@pytest.mark.parametrize("heap", HEAPS)
+def test_core_api(heap):
+    gc = heap()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    gc.add_root(root)  # twice is once
+    a, b = gc.alloc("a"), gc.alloc("b")
+    gc.set_field(root, "x", a)
+    gc.set_field(root, "x", b)  # overwrite, a is garbage now
+    gc.set_field(root, "missing", None)  # clearing a field never set
+    gc.remove_root(b)  # not a root, nothing happens
+    gc.gc()
+    assert len(gc.heap) == 2
+    assert "fields=[x -> #3]" in gc.heap_snapshot()
+
+    # a stale parent is refused, a stale root ignored: never aliased to the
+    # new object in its slot (array heap)
+    gc.alloc("reuses a's slot in the array heap")
+    with pytest.raises(RuntimeError):
+        gc.set_field(a, "y", root)
+    gc.add_root(a)
+    assert gc.roots == {1}
+
+    # many objects x many field names, no two edges may share a key
+    objs = [gc.alloc(i) for i in range(50)]
+    for i, o in enumerate(objs):
+        gc.set_field(root, f"o{i}", o)
+        for j in range(50):
+            gc.set_field(o, f"f{j}", objs[(i + j) % 50])
+    gc.gc()
+    assert len(gc.heap) == 2 + 50
+    snapshot = gc.heap_snapshot()
+    assert snapshot.count(" -> #") == 1 + 50 + 50 * 50
+
+    gc.remove_root(root)
+    gc.gc()
+    assert len(gc.heap) == 0
+
+
+@pytest.mark.skipif(ArrayMarkSweepGC is None, reason="numpy not installed")
+def test_array_field_name_limit(monkeypatch):
+    import ms_gc_array
+
+    # the name id has to fit next to the slot in the edge key
+    monkeypatch.setattr(ms_gc_array, "_MAX_NAMES", 3)
+    gc = ArrayMarkSweepGC()
+    obj = gc.alloc("obj")
+    for name in "abc":
+        gc.set_field(obj, name, obj)
+    with pytest.raises(RuntimeError):
+        gc.set_field(obj, "d", obj)
+    gc.set_field(obj, "a", None)  # known names still work
+
+
+@pytest.mark.skipif(ArrayMarkSweepGC is None, reason="needs numpy")
+def test_array_field_names_use_the_full_width(monkeypatch):
+    import ms_gc_array
+
+    # 2 name bits instead of 32, so the top name ids are a few fields away
+    monkeypatch.setattr(ms_gc_array, "_NAME_BITS", 2)
+    monkeypatch.setattr(ms_gc_array, "_MAX_NAMES", 4)
+    gc = ArrayMarkSweepGC()
+    root, a, b = gc.alloc("root"), gc.alloc("a"), gc.alloc("b")
+    gc.add_root(root)
+    junk = gc.alloc("junk")
+    for name in "wxyz":
+        gc.set_field(b, name, a)
+    gc.set_field(root, "z", b)
+    gc.set_field(root, "y", a)
+    assert "z -> #3, y -> #2" in gc.heap_snapshot()
+    assert "w -> #2, x -> #2, y -> #2, z -> #2" in gc.heap_snapshot()
+
+    # the sweep rebuilds the edge index from the stored names
+    gc.set_field(junk, "w", junk)
+    gc.gc()
+    gc.set_field(b, "z", root)
+    assert "w -> #2, x -> #2, y -> #2, z -> #1" in gc.heap_snapshot()
+
+
+def test_shapes_are_shared():
+    gc = MarkSweepGC()
+    a, b, c = gc.alloc("A"), gc.alloc("B"), gc.alloc("C")
+    gc.set_field(a, "left", b)
+    gc.set_field(a, "right", c)
+    gc.set_field(b, "left", c)
+    gc.set_field(b, "right", a)
+    assert a._obj.shape is b._obj.shape
+    assert a._obj.shape.names == ["left", "right"]
+
+    # deleting keeps the slot, the shape stays shared
+    gc.set_field(b, "left", None)
+    assert a._obj.shape is b._obj.shape
+    assert b._obj.fields.keys() == {"right"}
+
+    # very wide objects get a private shape instead of a long transition chain
+    wide = gc.alloc("wide")
+    for i in range(100):
+        gc.set_field(wide, f"f{i}", a)
+    assert wide._obj.shape.transitions is None
+    assert len(wide._obj.slots) == 100
+
+
+def test_mark_bit_flips_instead_of_resetting():
+    gc = MarkSweepGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+
+    for cycle in range(4):
+        # garbage and a new live child every cycle, allocated under either bit
+        gc.alloc(f"garbage {cycle}")
+        gc.set_field(root, "child", gc.alloc(f"child {cycle}"))
+
+        bit = gc._mark_bit
+        gc.gc()
+        # the sweep never wrote the survivor back, the bit moved instead
+        assert root._obj.marked is bit
+        assert gc._mark_bit is not bit
+        assert len(gc.heap) == 2
+        assert "marked=True" not in gc.heap_snapshot()
+
+
+def test_lazy_sweep():
+    gc = MarkSweepGC(lazy_sweep=True, sweep_budget=10)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    keep = gc.alloc("keep")
+    gc.set_field(root, "keep", keep)
+    garbage = [gc.alloc(i) for i in range(100)]
+
+    gc.gc()
+    # only marked, nothing freed inside the pause
+    assert len(gc.heap) == 102
+    snap = gc.heap_snapshot()
+    assert snap.startswith("HEAP size=2,")
+    assert "marked=True" not in snap
+
+    # a pending-garbage object behaves as if it was already swept
+    with pytest.raises(RuntimeError):
+        gc.set_field(garbage[50], "x", root)
+    assert garbage[50]._obj.freed
+
+    # allocation pays for the sweep, 10 objects per alloc: ids 1..50 are
+    # swept, that is root, keep and 48 garbage objects
+    fresh = [gc.alloc(f"new {i}") for i in range(5)]
+    assert len(gc.heap) == 102 - 1 - 48 + 5
+    assert gc.sweep_step(1000) == 51
+    assert len(gc.heap) == 2 + 5
+
+    # objects allocated during the sweep were black, the next gc frees them
+    gc.set_field(root, "fresh", fresh[0])
+    gc.gc()
+    gc.sweep_step(1000)
+    assert len(gc.heap) == 3
+    assert not keep._obj.freed and not fresh[0]._obj.freed
+
+
+def test_incremental_marking_with_mutation():
+    gc = MarkSweepGC()
+    a, b, c = gc.alloc("A"), gc.alloc("B"), gc.alloc("C")
+    gc.add_root(a)
+    gc.set_field(a, "b", b)
+    gc.set_field(b, "c", c)
+    junk = gc.alloc("junk")
+
+    gc.start_cycle()
+    assert not gc.mark_step(1)  # A scanned (black), B gray, C still white
+
+    # move C behind the black A and cut the only path the marker would take,
+    # without the write barrier C is never seen and gets freed
+    gc.set_field(a, "c", c)
+    gc.set_field(b, "c", None)
+
+    # allocated during the cycle: black, survives this cycle even unreferenced
+    late = gc.alloc("late")
+    late_root = gc.alloc("late root")
+    gc.add_root(late_root)
+
+    while not gc.mark_step(1):
+        pass
+    gc.finish_cycle()
+
+    assert not c._obj.freed
+    assert junk._obj.freed
+    assert not late._obj.freed
+    assert len(gc.heap) == 5
+
+    gc.gc()
+    assert late._obj.freed
+    assert len(gc.heap) == 4
+
+
+@pytest.mark.parametrize("cls", [MarkSweepGC, ThreadSafeMarkSweepGC])
+def test_gc_during_incremental_cycle(cls):
+    gc = cls()
+    root, a = gc.alloc("root"), gc.alloc("A")
+    gc.add_root(root)
+    gc.set_field(root, "a", a)
+
+    gc.start_cycle()
+    late = gc.alloc("late")  # black
+    gc.set_field(root, "a", None)  # shaded by the barrier
+    # gc() does not stop at finishing the running cycle, which keeps both
+    gc.gc()
+    assert late._obj.freed and a._obj.freed
+    assert gc._cycle is None and len(gc.heap) == 1
+
+
+def _reachable_ok(gc, root):
+    # walk from the root: nothing reachable may have been freed
+    seen, stack = set(), [root._obj]
+    while stack:
+        obj = stack.pop()
+        assert not obj.freed
+        if obj.id in seen:
+            continue
+        seen.add(obj.id)
+        stack.extend(c for c in obj.slots if c is not None)
+    return seen
+
+
+def test_concurrent_mark_with_mutator_threads():
+    gc = ConcurrentMarkSweepGC(step=16)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    chain = [root]
+    for i in range(20_000):
+        node = gc.alloc(i)
+        gc.set_field(chain[-1], "next", node)
+        chain.append(node)
+    junk = [gc.alloc("junk") for _ in range(100)]
+
+    stop = threading.Event()
+
+    def mutator(k):
+        rng = random.Random(k)
+        while not stop.is_set():
+            # move a chain node behind the root and cut it out of the chain,
+            # then put it back: the marker may be anywhere along the chain
+            i = rng.randrange(1, len(chain) - 1)
+            gc.set_field(root, f"hold{k}", chain[i])
+            gc.set_field(chain[i - 1], "next", None)
+            gc.set_field(chain[i - 1], "next", chain[i])
+            # and some garbage: the previous node in this field dies
+            gc.set_field(root, f"new{k}", gc.alloc(("new", k)))
+
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(2)]
+    for t in threads:
+        t.start()
+    gc.start_concurrent_cycle()
+    assert gc.wait(timeout=30)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert all(j._obj.freed for j in junk)
+    assert len(_reachable_ok(gc, root)) >= len(chain)
+
+    # and a second, quiet cycle leaves exactly the reachable objects
+    gc.gc()
+    assert len(gc.heap) == len(_reachable_ok(gc, root))
+
+    # gc() in the middle of an incremental cycle finishes it, and then
+    # still collects what died after it started
+    gc.start_cycle()
+    gc.mark_step(10)
+    late = gc.alloc("late garbage")  # black: the running cycle keeps it
+    gc.gc()
+    assert late._obj.freed
+    assert gc._cycle is None and len(gc.heap) == len(_reachable_ok(gc, root))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_gc(workers):
+    # 3 roots x 200 chains x 10 nodes: wide enough that the parent hands
+    # the frontier out to the workers
+    gc = MarkSweepGC()
+    roots = [gc.alloc(f"root {k}") for k in range(3)]
+    for root in roots:
+        gc.add_root(root)
+        for c in range(200):
+            prev = root
+            for i in range(10):
+                node = gc.alloc(i)
+                gc.set_field(prev, f"c{c}" if prev is root else "next", node)
+                gc.set_field(node, "back", root)
+                prev = node
+    cycle = [gc.alloc(v) for v in "XYZ"]
+    for i in range(3):
+        gc.set_field(cycle[i], "next", cycle[(i + 1) % 3])
+
+    try:
+        gc.parallel_gc(workers)
+        assert len(gc.heap) == 3 * 2001
+        assert all(obj._obj.freed for obj in cycle)
+
+        gc.remove_root(roots[0])
+        gc.parallel_gc(workers)
+        assert len(gc.heap) == 2 * 2001
+        # plain gc still agrees afterwards
+        gc.gc()
+        assert len(gc.heap) == 2 * 2001
+    finally:
+        gc.close()
+
+
+def test_parallel_gc_redeals_skewed_work(monkeypatch):
+    import parallel_mark
+
+    # a fan of leaves plus one branch holding a 5000 node tree: after the
+    # first deal one worker has nearly all the work, the later rounds have
+    # to spread it again
+    monkeypatch.setattr(parallel_mark, "_ROUND_BUDGET", 100)
+    gc = MarkSweepGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(300):
+        gc.set_field(root, f"leaf{i}", gc.alloc(i))
+    big = gc.alloc("big")
+    gc.set_field(root, "big", big)
+    level = [big]
+    count = 1
+    while count < 5000:
+        nxt = []
+        for parent in level:
+            for k in range(4):
+                child = gc.alloc(count)
+                gc.set_field(parent, f"c{k}", child)
+                nxt.append(child)
+                count += 1
+        level = nxt
+    gc.alloc("garbage")
+    try:
+        gc.parallel_gc(2)
+        assert gc._mark_pool.rounds > 10
+        assert len(gc.heap) == 1 + 300 + count
+    finally:
+        gc.close()
+
+
+def test_dump_and_load(tmp_path):
+    gc = MarkSweepGC(lazy_sweep=True)
+    root = gc.alloc({"name": "root"})
+    gc.add_root(root)
+    prev = root
+    for i in range(100):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        gc.set_field(node, "back", root)
+        prev = node
+    gc.alloc("garbage")
+    gc.gc()  # sweep still pending, the dump must leave the garbage out
+
+    path = tmp_path / "heap.bin"
+    assert gc.dump(str(path)) == 101
+    records = list(gc.iter_records())
+    assert {r.id for r in records} == set(gc.heap) - {102}
+
+    loaded = MarkSweepGC.load(str(path))
+    assert loaded.roots == gc.roots
+    assert len(loaded.heap) == 101
+    assert loaded.heap[1].value == {"name": "root"}
+    assert loaded.heap[1].get("next") is loaded.heap[2]
+    assert loaded.heap[101].get("back") is loaded.heap[1]
+
+    # a working collector: new ids continue, gc keeps the chain
+    assert loaded.alloc("new")._obj.id == 102
+    loaded.gc()
+    assert len(loaded.heap) == 101
+
+
+def test_stats():
+    gc = MarkSweepGC(lazy_sweep=True, sweep_budget=10)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(100):
+        gc.alloc(i)
+    seen = []
+    gc.stats().callbacks.append(lambda kind, ns, phases: seen.append((kind, phases)))
+
+    gc.gc()
+    # gc() is one pause, its start / finish steps are counted inside it
+    assert [kind for kind, _ in seen] == ["gc"]
+    assert set(seen[0][1]) == {"mark", "sweep"}
+
+    while gc.sweep_step(10):
+        pass
+    s = gc.stats()
+    assert (s.allocated, s.freed, s.heap_size) == (101, 100, 1)
+    assert s.collections["gc"] == 1 and s.collections["cycle_start"] == 1
+    assert s.collections["sweep_step"] == len(seen) - 1 == 11
+    assert s.pauses.count == len(seen)
+    assert 0 < s.pauses.percentile(50) <= s.pauses.percentile(99) <= s.pauses.max_ns
+    assert s.summary()["pauses"]["max_ns"] == s.pauses.max_ns
+
+
+def _random_edges(seed, objects=50, edges=300):
+    # (parent index, field, child index), child == objects means None
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(objects), rng.choice("abc"), rng.randrange(objects + 1))
+        for _ in range(edges)
+    ]
+
+
+def test_bulk_construction():
+    # alloc_many + set_fields_bulk build exactly what alloc + set_field do
+    edges = _random_edges(7)
+    one = MarkSweepGC()
+    refs = [one.alloc(i) for i in range(50)]
+    refs.append(None)
+    for p, name, c in edges:
+        one.set_field(refs[p], name, refs[c])
+
+    bulk = MarkSweepGC()
+    brefs = bulk.alloc_many(range(50))
+    assert [r._obj.id for r in brefs] == list(range(1, 51))
+    # refs and ids mixed, id 0 clears a field
+    bulk.set_fields_bulk(
+        [brefs[p] for p, _, _ in edges],
+        [name for _, name, _ in edges],
+        [c + 1 if c < 50 else 0 for _, _, c in edges],
+    )
+    assert bulk.heap_snapshot() == one.heap_snapshot()
+
+    # a bad batch is refused before anything is written
+    with pytest.raises(RuntimeError):
+        bulk.set_fields_bulk([1, 999], "a", [2, 3])
+    with pytest.raises(ValueError):
+        bulk.set_fields_bulk([1, 2], ["a"], [2, 3])
+    assert bulk.heap_snapshot() == one.heap_snapshot()
+
+    for gc in (one, bulk):
+        gc.add_root(ObjectRef(gc.heap[1]))
+        gc.gc()
+    assert bulk.heap_snapshot() == one.heap_snapshot()
+
+
+def test_bulk_construction_numpy():
+    np = pytest.importorskip("numpy")
+    gc = MarkSweepGC(lazy_sweep=True)
+    gc.alloc("garbage")
+    gc.gc()  # a sweep is pending, the batch finishes it first
+    refs = gc.alloc_many(np.arange(1000))
+    first = refs[0]._obj.id
+    parents = np.arange(999) + first
+    gc.set_fields_bulk(parents, "next", parents + 1)
+    gc.add_root(refs[0])
+    x = gc.alloc("x")  # unreachable, until the batch below
+
+    gc.start_cycle()  # the barrier shades every new child while marking
+    gc.set_fields_bulk(np.array([first]), np.array(["extra"]), np.array([x._obj.id]))
+    gc.finish_cycle()
+    assert len(gc.heap) == 1001
+    assert refs[998]._obj.get("next") is refs[999]._obj
+    assert refs[0]._obj.get("extra").value == "x"
+
+
+def test_thread_safe():
+    gc = ThreadSafeMarkSweepGC()
+
+    # 8 threads build their own rooted chain, new nodes sit in the threads'
+    # allocation buffers until the gc() below moves them into the heap
+    def build(k):
+        head = gc.alloc(("head", k))
+        gc.add_root(head)
+        prev = head
+        for i in range(500):
+            node = gc.alloc(i)
+            gc.set_field(prev, "next", node)
+            prev = node
+            gc.alloc("junk")
+
+    threads = [threading.Thread(target=build, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not gc.heap
+    gc.gc()
+    assert len(gc.heap) == 8 * 501
+    for oid in gc.roots:
+        assert len(_reachable_ok(gc, ObjectRef(gc.heap[oid]))) == 501
+
+    # a collector thread stops the world over and over while mutators
+    # rewire a fixed rooted set and drop fresh objects right away
+    nodes = [gc.alloc(i) for i in range(32)]
+    for node in nodes:
+        gc.add_root(node)
+    stop = threading.Event()
+
+    def mutator(k):
+        rng = random.Random(k)
+        for i in range(2000):
+            gc.alloc(i)
+            gc.set_field(rng.choice(nodes), rng.choice("ab"), rng.choice(nodes + [None]))
+
+    def collector():
+        while not stop.is_set():
+            gc.gc()
+
+    c = threading.Thread(target=collector)
+    c.start()
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    c.join()
+    gc.gc()
+    assert gc.stats().heap_size == 8 * 501 + 32
+    assert gc.stats().collections["gc"] > 1
+
+
+def test_thread_safe_collect_async():
+    # the slices run on the event loop's thread, mutator threads keep going
+    # in between: rewiring a rooted set, dropping fresh objects, and reading
+    # stale refs to garbage the sweep has not reached yet (freed on the spot)
+    gc = ThreadSafeMarkSweepGC()
+    nodes = [gc.alloc(i) for i in range(32)]
+    for node in nodes:
+        gc.add_root(node)
+    prev = nodes[0]
+    for i in range(3000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    junk = [gc.alloc("junk") for _ in range(500)]
+    for j in junk:
+        gc.set_field(nodes[1], f"junk{j._obj.id}", j)
+    gc.gc()
+    assert gc.stats().heap_size == 32 + 3000 + 500
+    for j in junk:
+        gc.set_field(nodes[1], f"junk{j._obj.id}", None)
+    stop = threading.Event()
+
+    def mutator(k):
+        rng = random.Random(k)
+        while not stop.is_set():
+            gc.alloc(k)
+            gc.set_field(rng.choice(nodes[1:]), rng.choice("ab"), rng.choice(nodes + [None]))
+            gc.weakref(rng.choice(junk))()
+
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        asyncio.run(gc.collect_async(slice_budget=64))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    collections = gc.stats().collections
+    assert collections["mark_step"] > 10 and collections["sweep_step"] > 10
+    assert all(j._obj.freed for j in junk)
+    assert len(_reachable_ok(gc, nodes[0])) >= 3001
+    gc.gc()
+    assert gc.stats().heap_size == 32 + 3000
+
+
+def test_collect_async():
+    gc = MarkSweepGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    chain = [root]
+    for i in range(5000):
+        node = gc.alloc(i)
+        gc.set_field(chain[-1], "next", node)
+        chain.append(node)
+    junk = [gc.alloc("junk") for _ in range(100)]
+
+    async def mutator(done):
+        # runs between the slices, same moves as the concurrent test
+        rng = random.Random(0)
+        while not done.is_set():
+            i = rng.randrange(1, len(chain) - 1)
+            gc.set_field(root, "hold", chain[i])
+            gc.set_field(chain[i - 1], "next", None)
+            gc.set_field(chain[i - 1], "next", chain[i])
+            gc.set_field(root, "new", gc.alloc("new"))
+            await asyncio.sleep(0)
+
+    async def main():
+        done = asyncio.Event()
+        task = asyncio.create_task(mutator(done))
+        await gc.collect_async(slice_budget=64)
+        done.set()
+        await task
+
+    asyncio.run(main())
+    collections = gc.stats().collections
+    assert collections["mark_step"] > 10 and collections["sweep_step"] > 10
+    assert all(j._obj.freed for j in junk)
+    assert len(_reachable_ok(gc, root)) >= len(chain)
+    gc.gc()
+    assert len(gc.heap) == len(_reachable_ok(gc, root))
+
+    # a gc() from another task finishes the cycle, collect_async just ends
+    async def both():
+        task = asyncio.create_task(gc.collect_async(slice_budget=16))
+        await asyncio.sleep(0)
+        gc.gc()
+        await task
+
+    gc.alloc("junk")
+    asyncio.run(both())
+    assert len(gc.heap) == len(_reachable_ok(gc, root))
+
+    # max_lag resizes the slices: way over the bound -> 1 object, way under
+    # -> at most double
+    slices = Slices(1000, max_lag=1e-9)
+    slices.run(lambda budget: None)
+    assert slices.budget == 1
+    slices = Slices(1000, max_lag=10.0)
+    slices.run(lambda budget: None)
+    assert slices.budget == 2000
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_weakref_and_finalizers(lazy, monkeypatch):
+    gc = MarkSweepGC(lazy_sweep=lazy)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    keep = gc.alloc("keep")
+    gc.set_field(root, "keep", keep)
+    dead = [gc.alloc(i) for i in range(100)]
+    ran = []
+    for i, ref in enumerate(dead):
+        gc.finalize(ref, ran.append, i)
+    gc.finalize(keep, ran.append, "keep")
+    weak_keep, weak_dead = gc.weakref(keep), gc.weakref(dead[0])
+    assert weak_dead() is dead[0]
+
+    gc.gc()
+    # a lazy sweep has not freed them yet, the weak ref reads them as gone
+    assert weak_keep() is keep and weak_dead() is None
+    gc.sweep_step(len(gc.heap) + len(dead))
+    # queued by the collection, nothing ran inside it
+    assert ran == [] and len(gc.finalizers) == 100
+    assert gc.finalizers.run(64) == 64
+    assert gc.finalizers.run() == 36
+    assert ran == list(range(100)) and gc.finalizers.ran == 100
+
+    with pytest.raises(RuntimeError):
+        gc.finalize(dead[1], ran.append, "late")
+
+    # an exception goes to sys.excepthook, the rest still run
+    def boom():
+        raise ValueError("boom")
+
+    seen = []
+    monkeypatch.setattr(sys, "excepthook", lambda *exc: seen.append(exc[0]))
+    a, b = gc.alloc("a"), gc.alloc("b")
+    gc.finalize(a, boom)
+    gc.finalize(b, ran.append, "b")
+    gc.gc()
+    gc.sweep_step(len(gc.heap) + 2)
+    assert gc.finalizers.run() == 2
+    assert seen == [ValueError] and ran[-1] == "b"
+
+    # the worker thread drains what the next collections queue
+    gc.finalizers.start(batch=8)
+    done = threading.Event()
+    refs = [gc.alloc(i) for i in range(20)]
+    for ref in refs:
+        gc.finalize(ref, lambda: len(gc.finalizers) or done.set())
+    gc.set_field(root, "keep", None)
+    gc.gc()
+    gc.sweep_step(len(gc.heap) + len(refs) + 1)
+    assert done.wait(5)
+    gc.close()
+    assert ran[-1] == "keep" and weak_keep() is None
@@ -1,4 +1,10 @@
-from ms_gc import MarkSweepGC
+import asyncio
+import os
+import tempfile
+import threading
+
+from gc_policy import GoalPolicy, ThresholdPolicy
+from ms_gc_gen import ConcurrentMarkSweepGC, MarkSweepGC, ThreadSafeMarkSweepGC
 
 
 def print_section(title):
@@ -96,7 +102,7 @@ def test_promotion():
 
 
 def test_old_to_young_references():
-    print_section("TEST 4: Old->Young References (Card Table)")
+    print_section("TEST 4: Old->Young References (Remembered Set)")
     gc = MarkSweepGC()
 
     old_obj = gc.alloc("Old Object")
@@ -114,9 +120,9 @@ def test_old_to_young_references():
     print(gc.heap_snapshot())
 
     gc.set_field(old_obj, "ref", young_obj)
-    print("\n3. After creating old->young reference (triggers card table):")
+    print("\n3. After creating old->young reference (triggers remembered set):")
     print(gc.heap_snapshot())
-    print(f"   Card table: {gc.card_table}")
+    print(f"   Remembered set: {gc.remembered}")
 
     gc.minor_gc()
     print("\n4. After minor GC - young object kept alive by old object:")
@@ -168,6 +174,628 @@ def test_root_management():
     print(gc.heap_snapshot())
 
 
+def test_long_chain():
+    print_section("TEST 7: Long Chain (no recursion limit)")
+    gc = MarkSweepGC()
+
+    head = gc.alloc(0)
+    gc.add_root(head)
+    prev = head
+    for i in range(1, 50_000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+
+    gc.minor_gc()
+    print(f"\n1. After minor GC: young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.young) == 50_000
+
+    gc.minor_gc()
+    gc.full_gc()
+    print(f"\n2. After promotion + full GC: young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.old) == 50_000
+
+
+def test_concurrent_full_gc():
+    print_section("TEST 8: Concurrent Full GC")
+    gc = ConcurrentMarkSweepGC(step=16)
+
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(10_000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    gc.minor_gc()
+    gc.minor_gc()  # everything promoted to old
+    junk = [gc.alloc("junk") for _ in range(50)]
+
+    stop = threading.Event()
+
+    def mutator():
+        while not stop.is_set():
+            young = gc.alloc("young")
+            gc.set_field(root, "young", young)  # old -> young, remembered set
+
+    t = threading.Thread(target=mutator)
+    t.start()
+    gc.full_gc()
+    stop.set()
+    t.join()
+
+    print(f"\n1. After concurrent full GC: young={len(gc.young)}, old={len(gc.old)}")
+    assert all(j._obj.freed for j in junk)
+    assert len(gc.old) == 10_001
+    assert not root._obj.get("young").freed
+
+    gc.minor_gc()
+    print(f"\n2. After minor GC: young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.young) == 1
+
+
+def test_copying_nursery():
+    print_section("TEST 9: Semi-space Nursery")
+    gc = MarkSweepGC()
+
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    temps = [gc.alloc(f"temp {i}") for i in range(1000)]
+    keep = gc.alloc("keep")
+    gc.set_field(holder, "keep", keep)
+    from_space = gc.young
+
+    gc.minor_gc()
+    print(f"\n1. After scavenge: young={len(gc.young)}, old={len(gc.old)}")
+    # only the survivors made it to the new to-space, from-space is gone
+    assert gc.young is not from_space
+    assert set(gc.young) == {holder._obj.id, keep._obj.id}
+
+    # the dead are flagged when touched, like a swept object would be
+    assert not temps[0]._obj.freed
+    try:
+        gc.set_field(temps[0], "x", keep)
+        assert False, "temp should be freed"
+    except RuntimeError:
+        pass
+    assert temps[0]._obj.freed
+
+    # holder gets promoted, a fresh child stays young: the old -> young edge
+    # must outlive the scavenge that created it
+    child = gc.alloc("child")
+    gc.set_field(holder, "child", child)
+    gc.minor_gc()
+    print(f"\n2. holder promoted: young={len(gc.young)}, old={len(gc.old)}")
+    print(f"   Remembered set: {gc.remembered}")
+    assert holder._obj.generation == 1 and child._obj.generation == 0
+    assert holder._obj.id in gc.remembered
+
+    gc.minor_gc()
+    assert not child._obj.freed
+    assert child._obj.generation == 1
+
+
+def test_compaction():
+    print_section("TEST 10: Old Generation Compaction")
+    gc = MarkSweepGC(auto_compact=True)
+
+    # every 10th object survives, the rest is garbage spread between them
+    objs = [gc.alloc(f"obj {i}") for i in range(1000)]
+    keep = objs[::10]
+    for a, b in zip(keep, keep[1:]):
+        gc.set_field(a, "next", b)
+    gc.add_root(keep[0])
+    gc.minor_gc()
+    gc.minor_gc()  # whole chain promoted
+
+    old_id = keep[50]._obj.id
+    gc.remove_root(keep[0])
+    gc.add_root(keep[50])
+    gc.set_field(keep[49], "next", None)
+    young = gc.alloc("young")
+    gc.set_field(keep[60], "young", young)
+    gc.full_gc()
+
+    ids = sorted([*gc.young, *gc.old])
+    print(f"\n1. After full GC: {len(ids)} objects, ids {ids[0]}..{ids[-1]}")
+    # keep[50:] are the 50 survivors, plus the young one, renumbered above
+    # the 1001 ids handed out so far
+    assert ids == list(range(1002, 1053))
+    assert old_id == 501 and keep[50]._obj.id == 1002
+    assert gc.roots == {1002}
+    # the remembered slot of keep[60] moved with it
+    assert gc.remembered == {keep[60]._obj.id: {1}}
+
+    # refs taken before the move still work, raw ids do not resolve at all
+    # (no live object ever gets one of them again)
+    assert keep[99]._obj.value == "obj 990"
+    gc.set_field(keep[99], "next", keep[50])
+    try:
+        gc.set_fields_bulk([old_id], "x", [keep[99]])
+        assert False, "a stale id was accepted"
+    except RuntimeError:
+        pass
+    assert gc.alloc("new")._obj.id == 1053
+
+    gc.minor_gc()
+    assert not young._obj.freed
+
+    # without auto_compact the ids are never renumbered behind our back:
+    # raw ids taken before a full gc still name the same objects
+    gc = MarkSweepGC()
+    objs = [gc.alloc(f"obj {i}") for i in range(1000)]
+    keep = objs[::10]
+    for a, b in zip(keep, keep[1:]):
+        gc.set_field(a, "next", b)
+    gc.add_root(keep[0])
+    ids = [k._obj.id for k in keep]
+    gc.gc()
+    gc.full_gc()
+    print(f"2. no auto_compact: ids {ids[0]}..{ids[-1]} kept over {len(ids)} objects")
+    assert sorted([*gc.young, *gc.old]) == ids
+    gc.set_fields_bulk(ids[1:], "back", ids[:-1])
+    assert all(keep[i]._obj.get("back") is keep[i - 1]._obj for i in range(1, len(keep)))
+
+
+def test_remembered_set():
+    print_section("TEST 11: Field Granular Remembered Set")
+    gc = MarkSweepGC()
+
+    parent = gc.alloc("parent")
+    gc.add_root(parent)
+    olds = [gc.alloc(f"old {i}") for i in range(10)]
+    for i, o in enumerate(olds):
+        gc.set_field(parent, f"f{i}", o)
+    gc.minor_gc()
+    gc.minor_gc()
+    assert parent._obj.generation == 1
+
+    # only the slot holding the young child is remembered
+    young = gc.alloc("young")
+    gc.set_field(parent, "f3", young)
+    print(f"\n1. After old -> young store: {gc.remembered}")
+    assert gc.remembered == {parent._obj.id: {3}}
+
+    # survives a minor gc while the child is still young
+    gc.minor_gc()
+    print(f"\n2. After 1 minor GC: {gc.remembered}")
+    assert young._obj.generation == 0
+    assert gc.remembered == {parent._obj.id: {3}}
+
+    # pruned once the child is promoted
+    gc.minor_gc()
+    print(f"\n3. After promotion: {gc.remembered}")
+    assert young._obj.generation == 1
+    assert gc.remembered == {}
+
+    # pruned when the field is overwritten
+    young2 = gc.alloc("young 2")
+    gc.set_field(parent, "f5", young2)
+    gc.set_field(parent, "f5", olds[5])
+    print(f"\n4. After overwrite: {gc.remembered}")
+    assert gc.remembered == {}
+    gc.minor_gc()
+    assert young2._obj.id not in gc.young
+
+
+def test_dump_and_load():
+    print_section("TEST 12: Binary Heap Dump")
+    gc = MarkSweepGC()
+
+    parent = gc.alloc("parent")
+    gc.add_root(parent)
+    gc.minor_gc()
+    gc.minor_gc()
+    child = gc.alloc(["young", 1])
+    gc.set_field(parent, "child", child)
+    gc.minor_gc()  # child is young with age 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "heap.bin")
+        n = gc.dump(path)
+        print(f"\n1. Dumped {n} objects, {os.path.getsize(path)} bytes")
+        loaded = MarkSweepGC.load(path)
+
+    print("\n2. Loaded heap:")
+    print(loaded.heap_snapshot())
+    assert loaded.heap_snapshot() == gc.heap_snapshot()
+    assert loaded.remembered == gc.remembered
+    assert loaded.young[child._obj.id].age == 1
+
+    # the remembered set came back, the young child survives a minor gc
+    loaded.minor_gc()
+    assert loaded.old[child._obj.id].value == ["young", 1]
+
+
+def test_gc_policy():
+    print_section("TEST 13: Allocation Triggered GC Policies")
+
+    # short lived garbage: a minor gc every 100 allocations, nothing survives,
+    # the nursery stays at its minimum
+    gc = MarkSweepGC(ThresholdPolicy(nursery=100, adaptive=True, min_nursery=100))
+    for i in range(1000):
+        gc.alloc(i)
+    print(f"\n1. garbage only: {gc._minor_gc_count} minor GCs, young={len(gc.young)}")
+    assert gc._minor_gc_count == 9
+    assert gc.policy.young_limit == 100
+
+    # everything survives: the nursery grows instead of copying over and over
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(3000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    print(f"\n2. all live: nursery grew to {gc.policy.young_limit}")
+    assert gc.policy.young_limit > 100
+
+    # go style: a full gc once old doubled since the last live size
+    full = []
+
+    class Recording(GoalPolicy):
+        def want_full(self, gc):
+            if super().want_full(gc):
+                full.append(len(gc.old))
+                return True
+            return False
+
+    gc = MarkSweepGC(Recording(gogc=100, min_old=500, nursery=100, adaptive=False))
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(3000):
+        # each object lives long enough to be promoted, then half of them die
+        node = gc.alloc(i)
+        gc.set_field(root, f"f{i % 400}", node)
+    print(f"\n3. GOGC=100: full GCs at old sizes {full}, next goal {gc.policy.goal}")
+    assert full[0] >= 500
+    assert all(size >= 2 * 301 for size in full[1:])  # 301 objects stay live
+    assert gc.policy.goal == max(500, 2 * gc.policy._old_live)
+
+    # the full trigger adapts too: full GCs that free nothing come later,
+    # one that frees most of old brings it back down
+    gc = MarkSweepGC(ThresholdPolicy(nursery=100, min_old=200, full_growth=0.25))
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(5000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    grown = gc.policy.full_growth
+    print(f"\n4. all live: full_growth 0.25 -> {grown}")
+    assert 0.25 < grown <= gc.policy.max_full_growth
+    gc.set_field(root, "next", None)
+    gc.gc()
+    gc.full_gc()
+    print(f"   old freed: full_growth -> {gc.policy.full_growth}")
+    assert gc.policy.full_growth == max(grown / 2, 0.25)
+
+    # a pause target: minor pauses over it keep the nursery from growing
+    gc = MarkSweepGC(ThresholdPolicy(nursery=100, max_pause_ms=1e-6))
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(3000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    print(f"\n5. max_pause_ms: nursery stays at {gc.policy.young_limit}")
+    assert gc.policy.young_limit == 100
+    # a pause with a full gc in it does not count
+    gc.policy.max_pause_ms = 1000.0
+    gc.policy.after_pause(gc, "gc", 10**12, {"mark": 1})
+    assert gc.policy._nursery_cap == 100
+    gc.policy.after_pause(gc, "minor", 1, {"copy": 1})
+    assert gc.policy._nursery_cap == 200
+
+
+def test_stats():
+    print_section("TEST 14: GC Statistics")
+    gc = MarkSweepGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    for i in range(1000):
+        node = gc.alloc(i)
+        if i % 10 == 0:
+            gc.set_field(root, f"f{i % 50}", node)
+        if i % 100 == 99:
+            gc.gc()
+
+    s = gc.stats()
+    print(f"\n1. {s.summary()}")
+    assert s.allocated == 1001
+    assert s.allocated == s.freed + s.heap_size == s.freed + len(gc.young) + len(gc.old)
+    # 10 gc() calls, one full gc among them (the 8th)
+    assert s.collections == {"gc": 10, "minor": 10, "full": 1}
+    assert s.pauses.count == 10
+    assert {"copy", "remembered", "mark", "sweep"} <= set(s.phase_ns)
+
+
+def test_bulk_construction():
+    print_section("TEST 15: Bulk Construction")
+    gc = MarkSweepGC()
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    gc.gc()
+    gc.gc()
+    gc.gc()  # holder is old now
+    assert holder._obj.generation == 1
+
+    refs = gc.alloc_many(range(100))
+    ids = [r._obj.id for r in refs]
+    assert ids == list(range(ids[0], ids[0] + 100))
+    gc.set_fields_bulk(ids[:-1], "next", ids[1:])
+    # old -> young edges go through the write barrier, by ref or by id
+    gc.set_fields_bulk([holder, holder._obj.id], ["head", "tmp"], [refs[0], ids[50]])
+    print(f"\n1. remembered after the batch: {gc.remembered}")
+    assert gc.remembered == {holder._obj.id: {0, 1}}
+    gc.set_fields_bulk([holder], "tmp", [None])
+    assert gc.remembered == {holder._obj.id: {0}}
+
+    gc.gc()
+    print(f"2. after a minor gc: young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.young) + len(gc.old) == 101
+    assert holder._obj.get("head").get("next").value == 1
+
+
+def test_recycling():
+    print_section("TEST 16: Recycled Objects And Ids")
+    gc = MarkSweepGC(recycle=True)
+    holder = gc.alloc("holder")
+    gc.add_root(holder)
+    dead = gc.alloc("dead")
+    dead_id = dead._obj.id
+    gc.gc()
+    assert dead._obj.freed and gc._pool == [dead._obj]
+
+    # the shell comes back with the same slot and the next tag
+    new = gc.alloc("new")
+    print(f"\n1. dead id {dead_id:#x} -> reused as {new._obj.id:#x}")
+    assert new._obj is dead._obj
+    assert new._obj.id == dead_id + (1 << 32)
+    # the stale ref does not alias the new object
+    try:
+        gc.set_field(dead, "x", holder)
+        assert False, "stale ref was accepted"
+    except RuntimeError:
+        pass
+    gc.add_root(dead)  # ignored, like any dead ref
+    assert gc.roots == {holder._obj.id}
+    gc.set_field(holder, "new", new)
+    assert holder._obj.get("new").value == "new"
+
+    # churn: shells and slots stay at the peak heap size
+    shells = set()
+    for i in range(2000):
+        tmp = gc.alloc(i)
+        gc.set_field(tmp, "data", gc.alloc(None))
+        gc.set_field(holder, "tmp", tmp)
+        shells.add(id(tmp._obj))
+        if i % 100 == 99:
+            gc.gc()
+    slots = {oid & 0xFFFFFFFF for oid in [*gc.young, *gc.old]}
+    print(f"2. 4000 allocations, {len(shells)} distinct shells, top slot {max(slots)}")
+    assert len(shells) <= 210
+    assert max(slots) <= 210
+
+    # compaction renumbers ids, which would turn every ref stale
+    try:
+        gc.compact()
+        assert False, "compact() ran in recycle mode"
+    except RuntimeError:
+        pass
+    gc.full_gc()
+    assert len(gc.young) + len(gc.old) == 4
+
+
+def test_thread_safe():
+    print_section("TEST 17: Several Mutator Threads")
+    gc = ThreadSafeMarkSweepGC()
+    holders = [gc.alloc(("holder", k)) for k in range(8)]
+    for holder in holders:
+        gc.add_root(holder)
+    gc.gc()
+    gc.gc()  # holders are old now
+    assert all(h._obj.generation == 1 for h in holders)
+
+    # every thread hangs young objects off its own old holder and off a
+    # shared one: the remembered set entries must all be there afterwards
+    def mutator(k):
+        for i in range(300):
+            node = gc.alloc((k, i))
+            gc.set_field(holders[k], f"f{i % 10}", node)
+            gc.set_field(holders[0], f"t{k}", node)
+            gc.alloc("junk")
+
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"\n1. before the minor gc: young={len(gc.young)} (the rest is in allocation buffers)")
+    assert gc.remembered[holders[0]._obj.id] == set(range(18))
+    gc.minor_gc()
+    print(f"2. after: young={len(gc.young)}, old={len(gc.old)}")
+    # 8 holders, 10 fields each, holders[0] also keeps each thread's last node
+    # (the same object as that thread's f9)
+    assert len(gc.young) + len(gc.old) == 8 + 8 * 10
+    assert holders[3]._obj.get("f9").value == (3, 299)
+
+    # a collector thread stops the world over and over meanwhile
+    stop = threading.Event()
+
+    def collector():
+        while not stop.is_set():
+            gc.gc()
+
+    c = threading.Thread(target=collector)
+    c.start()
+    threads = [threading.Thread(target=lambda: [gc.alloc(i) for i in range(3000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    c.join()
+    gc.gc()
+    stats = gc.stats()
+    print(f"3. {stats.collections['minor']} minor gcs under 4 allocating threads, heap={stats.heap_size}")
+    assert stats.heap_size == 8 + 8 * 10
+
+
+def test_collect_async():
+    print_section("TEST 18: Full GC In Slices Under asyncio")
+    gc = MarkSweepGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(3000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    gc.gc()
+    gc.gc()  # the chain is old now
+    old = gc.alloc("old garbage")
+    gc.set_field(root, "tmp", old)
+    gc.gc()
+    gc.gc()
+    assert old._obj.generation == 1
+    gc.set_field(root, "tmp", None)
+
+    async def mutator(done):
+        # between the slices: young objects hung off the (old, maybe already
+        # scanned) root, and minor gcs moving objects under the full gc
+        i = 0
+        while not done.is_set():
+            gc.set_field(root, f"young{i % 4}", gc.alloc(("young", i)))
+            i += 1
+            if i % 50 == 0:
+                gc.minor_gc()
+            await asyncio.sleep(0)
+
+    async def main():
+        done = asyncio.Event()
+        task = asyncio.create_task(mutator(done))
+        await gc.collect_async(slice_budget=32)
+        done.set()
+        await task
+
+    asyncio.run(main())
+    stats = gc.stats()
+    print(f"\n1. {stats.collections['full_step']} mark slices, {stats.collections['sweep_step']} sweep slices")
+    assert stats.collections["full_step"] > 10 and stats.collections["sweep_step"] > 10
+    assert old._obj.freed
+    assert all(root._obj.get(f"young{k}") is not None for k in range(4))
+    assert not any(o.freed for o in [*gc.young.values(), *gc.old.values()])
+
+    # full_gc() from another task finishes the running cycle first
+    async def both():
+        task = asyncio.create_task(gc.collect_async(slice_budget=16))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        gc.full_gc()
+        await task
+
+    asyncio.run(both())
+    print(f"2. after a full_gc() in the middle: young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.young) + len(gc.old) == 3001 + 4
+
+
+def test_weakref_and_finalizers():
+    print_section("TEST 19: Weak References And Finalizers")
+    for recycle in (False, True):
+        gc = MarkSweepGC(recycle=recycle)
+        root = gc.alloc("root")
+        gc.add_root(root)
+        ran = []
+        old = gc.alloc("old")
+        gc.set_field(root, "old", old)
+        gc.finalize(old, ran.append, "old")
+        gc.minor_gc()
+        gc.minor_gc()
+        assert old._obj.generation == 1
+
+        # young and dead: queued by the minor gc that dropped them
+        young = [gc.alloc(i) for i in range(10)]
+        for i, ref in enumerate(young):
+            gc.finalize(ref, ran.append, i)
+        kept = gc.alloc("kept")
+        gc.set_field(root, "kept", kept)
+        gc.finalize(kept, ran.append, "kept")
+        weak_young, weak_kept = gc.weakref(young[0]), gc.weakref(kept)
+        gc.minor_gc()
+        print(f"\n{1 + recycle}. recycle={recycle}: {len(gc.finalizers)} queued after a minor gc")
+        assert ran == [] and len(gc.finalizers) == 10
+        assert weak_young() is None and weak_kept() is kept
+        assert gc.finalizers.run(4) == 4 and gc.finalizers.run() == 6
+        assert ran == list(range(10))
+
+        # promoted, then dead: queued by the full gc
+        gc.minor_gc()
+        assert kept._obj.generation == 1
+        gc.set_field(root, "kept", None)
+        gc.set_field(root, "old", None)
+        gc.full_gc()
+        assert ran[10:] == [] and len(gc.finalizers) == 2
+        gc.finalizers.run()
+        assert sorted(ran[10:]) == ["kept", "old"] and weak_kept() is None
+
+        # a reused shell does not bring the weak ref back
+        gc.alloc("reuse")
+        assert weak_kept() is None and weak_young() is None
+        assert not gc._finalizable and not gc._young_finalizable
+
+
+def test_thread_safe_collect_async():
+    print_section("TEST 20: Sliced Full GC With Mutator Threads")
+    gc = ThreadSafeMarkSweepGC()
+    holders = [gc.alloc(("holder", k)) for k in range(8)]
+    for holder in holders:
+        gc.add_root(holder)
+    prev = holders[0]
+    for i in range(2000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    junk = [gc.alloc("junk") for _ in range(300)]
+    for i, j in enumerate(junk):
+        gc.set_field(holders[1], f"j{i}", j)
+    gc.gc()
+    gc.gc()  # all old now
+    for i in range(len(junk)):
+        gc.set_field(holders[1], f"j{i}", None)
+    stop = threading.Event()
+
+    # between the slices: young objects hung off the old holders (barrier +
+    # remembered set), and stale refs to old garbage read before the sweep
+    # gets to it
+    def mutator(k):
+        i = 0
+        while not stop.is_set():
+            if i < 500:
+                gc.set_field(holders[k], f"f{i % 10}", gc.alloc((k, i)))
+            gc.weakref(junk[i % len(junk)])()
+            i += 1
+
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(2, 8)]
+    for t in threads:
+        t.start()
+    try:
+        asyncio.run(gc.collect_async(slice_budget=32))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    stats = gc.stats()
+    print(f"\n1. {stats.collections['full_step']} mark slices, {stats.collections['sweep_step']} sweep slices")
+    assert stats.collections["full_step"] > 10 and stats.collections["sweep_step"] > 10
+    assert all(j._obj.freed for j in junk)
+    gc.gc()
+    print(f"2. after a gc(): young={len(gc.young)}, old={len(gc.old)}")
+    assert len(gc.young) + len(gc.old) == 8 + 2000 + 6 * 10
+
+
 if __name__ == "__main__":
     print("\n" + "█" * 60)
     print("  GENERATIONAL MARK-AND-SWEEP GC TEST SUITE")
@@ -179,6 +807,20 @@ if __name__ == "__main__":
     test_old_to_young_references()
     test_full_gc_trigger()
     test_root_management()
+    test_long_chain()
+    test_concurrent_full_gc()
+    test_copying_nursery()
+    test_compaction()
+    test_remembered_set()
+    test_dump_and_load()
+    test_gc_policy()
+    test_stats()
+    test_bulk_construction()
+    test_recycling()
+    test_thread_safe()
+    test_collect_async()
+    test_weakref_and_finalizers()
+    test_thread_safe_collect_async()
 
     print("\n" + "█" * 60)
     print("  ALL TESTS COMPLETED")
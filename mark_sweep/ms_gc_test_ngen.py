@@ -0,0 +1,135 @@
+from ms_gc_ngen import NGenMarkSweepGC
+
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def test_promotion_through_generations():
+    print_section("TEST 1: Promotion Through 3 Generations")
+    gc = NGenMarkSweepGC(generations=3, every=[1, 4, 4], tenure=[2, 3])
+
+    root = gc.alloc("root")
+    gc.add_root(root)
+    child = gc.alloc("child")
+    gc.set_field(root, "child", child)
+    gc.alloc("garbage")
+
+    gc.collect(0)
+    print("\n1. After 1 young collection:")
+    print(gc.heap_snapshot())
+    assert [len(s) for s in gc.generations] == [2, 0, 0]
+
+    gc.collect(0)
+    print("\n2. After 2 young collections (tenure 2 -> gen 1):")
+    print(gc.heap_snapshot())
+    assert [len(s) for s in gc.generations] == [0, 2, 0]
+
+    for _ in range(3):
+        gc.collect(1)
+    print("\n3. After 3 gen 1 collections (tenure 3 -> gen 2):")
+    print(gc.heap_snapshot())
+    assert [len(s) for s in gc.generations] == [0, 0, 2]
+    assert root._obj.generation == 2 and root._obj.age == 0
+
+
+def test_schedule():
+    print_section("TEST 2: Per Generation Frequency")
+    gc = NGenMarkSweepGC(generations=3, every=[1, 4, 3])
+    for _ in range(24):
+        gc.gc()
+    print(f"\n1. collections per generation after 24 gc(): {gc.collections}")
+    # gen 1 every 4th, gen 2 every 3rd of those
+    assert gc.collections == [18, 4, 2]
+    assert gc.stats().collections == {"gen0": 18, "gen1": 4, "gen2": 2}
+
+
+def test_older_to_younger_edges():
+    print_section("TEST 3: Remembered Set Across Generations")
+    gc = NGenMarkSweepGC(generations=3, tenure=[1, 1])
+
+    old = gc.alloc("old")
+    gc.add_root(old)
+    gc.collect(0)
+    gc.collect(1)
+    assert old._obj.generation == 2
+
+    mid = gc.alloc("mid")
+    gc.set_field(old, "mid", mid)
+    gc.collect(0)  # mid -> gen 1
+    young = gc.alloc("young")
+    gc.set_field(mid, "young", young)
+    print(f"\n1. old -> mid -> young: {gc.remembered}")
+    assert gc.remembered == {old._obj.id: {0}, mid._obj.id: {0}}
+
+    # only gen 0 is collected: young is reachable through mid's remembered slot
+    gc.collect(0)
+    assert not young._obj.freed and young._obj.generation == 1
+    print(f"\n2. young promoted next to mid: {gc.remembered}")
+    assert gc.remembered == {old._obj.id: {0}}
+
+    gc.set_field(old, "mid", None)
+    assert gc.remembered == {}
+    gc.collect(1)
+    try:
+        gc.set_field(mid, "x", None)
+        assert False, "mid should be freed"
+    except RuntimeError:
+        pass
+
+
+def test_medium_lived_tier():
+    print_section("TEST 4: Medium Lived Objects Die In The Middle")
+    gc = NGenMarkSweepGC(generations=3, every=[1, 4, 8], tenure=[2, 8])
+    root = gc.alloc("root")
+    gc.add_root(root)
+
+    # every batch survives a few young collections, then is dropped
+    for batch in range(40):
+        head = gc.alloc(f"batch {batch}")
+        gc.set_field(root, f"b{batch % 4}", head)
+        for i in range(20):
+            gc.set_field(head, f"n{i}", gc.alloc(i))
+        gc.gc()
+
+    sizes = [len(s) for s in gc.generations]
+    print(f"\n1. generation sizes after 40 batches: {sizes}, collections {gc.collections}")
+    # nothing but the root made it to the oldest generation
+    assert sizes[2] <= 1 + 4 * 21
+    assert gc.collections[2] == 1
+
+
+def test_dynamic_tenuring():
+    print_section("TEST 5: Dynamic Tenuring Age")
+    gc = NGenMarkSweepGC(generations=2, tenure=[6], survivor_target=[50])
+    root = gc.alloc("root")
+    gc.add_root(root)
+
+    # a few survivors: the threshold stays at the max
+    gc.set_field(root, "a", gc.alloc("a"))
+    gc.collect(0)
+    assert gc.tenure == [6]
+
+    # 200 survivors do not fit the target of 50, the threshold drops
+    for i in range(200):
+        gc.set_field(root, f"f{i}", gc.alloc(i))
+    gc.collect(0)
+    print(f"\n1. tenuring threshold after a big survivor volume: {gc.tenure}")
+    assert gc.tenure == [1]
+    gc.collect(0)
+    print(f"   generation sizes: {[len(s) for s in gc.generations]}")
+    assert len(gc.generations[0]) == 0
+
+
+if __name__ == "__main__":
+    test_promotion_through_generations()
+    test_schedule()
+    test_older_to_younger_edges()
+    test_medium_lived_tier()
+    test_dynamic_tenuring()
+
+    print("\n" + "█" * 60)
+    print("  ALL TESTS COMPLETED")
+    print("█" * 60)
@@ -0,0 +1,168 @@
+from array import array
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence
+import multiprocessing
+
+# full-heap marking spread over worker PROCESSES (threads would just take
+# turns on the GIL for this kind of pure python traversal)
+#
+# 1. the heap is exported once into a shared memory block as CSR:
+#      offsets[n + 1]  int64, children of object i are targets[offsets[i]:offsets[i+1]]
+#      targets[m]      int64, dense object indexes (not ids)
+#      marks[n]        uint8, the shared mark bitmap
+# 2. the parent expands a few bfs levels from the roots until there is
+#    enough frontier to go around, then deals it out round robin
+# 3. every worker runs a plain stack mark from its share, checking and
+#    setting the SHARED bitmap, for at most _ROUND_BUDGET objects. two
+#    workers can race on the same object and both scan it, that only costs
+#    a little duplicate work, never a wrong mark
+# 4. the workers hand back what is left on their stacks, the parent pools
+#    it and goes back to 2, until nothing is left. so a worker that drew
+#    the big subgraph only keeps it for one round, the next one spreads it
+# 5. the parent reads the bitmap back and sweeps
+#
+# REM: the export is serial python, O(objects + edges), so the speedup only
+# shows when marking dominates (big heaps, several cores). a chain stays
+# serial whatever we do: its frontier is one object wide
+
+# frontier objects per worker before the parent hands out work
+_SEED_PER_WORKER = 64
+# objects a worker scans before it hands its stack back for a new deal
+_ROUND_BUDGET = 50_000
+
+
+class _Graph:
+    # views into the shared block, works the same in the parent and in workers
+    def __init__(self, shm: shared_memory.SharedMemory, n: int, m: int):
+        self.shm = shm
+        buf = shm.buf
+        self.offsets = buf[: 8 * (n + 1)].cast("q")
+        self.targets = buf[8 * (n + 1) : 8 * (n + 1 + m)].cast("q")
+        self.marks = buf[8 * (n + 1 + m) : 8 * (n + 1 + m) + n]
+
+    def close(self) -> None:
+        # views must go before the block can be closed
+        self.offsets.release()
+        self.targets.release()
+        self.marks.release()
+        self.shm.close()
+
+
+def _export(objs: Sequence[Any], index: Dict[int, int]) -> _Graph:
+    offsets = array("q", [0])
+    targets = array("q")
+    for obj in objs:
+        for child in obj.slots:
+            if child is not None:
+                i = index.get(child.id)
+                if i is not None:
+                    targets.append(i)
+        offsets.append(len(targets))
+
+    n, m = len(objs), len(targets)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * (n + 1 + m) + n))
+    graph = _Graph(shm, n, m)
+    graph.offsets[:] = offsets
+    graph.targets[:] = targets
+    graph.marks[:] = bytes(n)
+    return graph
+
+
+def _mark_from(graph: _Graph, stack: List[int], budget: Optional[int] = None) -> int:
+    # scans at most budget objects (all for None), the rest stays on stack
+    offsets, targets, marks = graph.offsets, graph.targets, graph.marks
+    pop = stack.pop
+    push = stack.append
+    scanned = 0
+    while stack and scanned != budget:
+        i = pop()
+        scanned += 1
+        for j in range(offsets[i], offsets[i + 1]):
+            child = targets[j]
+            if not marks[child]:
+                marks[child] = 1
+                push(child)
+    return scanned
+
+
+def _worker(args) -> List[int]:
+    # one round: mark from the share, return what is still to scan
+    name, n, m, share, budget = args
+    graph = _Graph(shared_memory.SharedMemory(name=name), n, m)
+    try:
+        _mark_from(graph, share, budget)
+        return share
+    finally:
+        graph.close()
+
+
+class MarkPool:
+    # worker processes kept around between collections, forking a fresh
+    # pool per gc would cost more than the marking itself
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[Any] = None
+        self.rounds = 0  # deals of the last parallel mark
+
+    def _get_pool(self):
+        if self._pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self._pool = ctx.Pool(self.workers)
+        return self._pool
+
+    def mark(self, objs: Sequence[Any], roots: Sequence[Any]) -> bytes:
+        # returns the mark bitmap, marks[i] for objs[i]
+        index = {obj.id: i for i, obj in enumerate(objs)}
+        graph = _export(objs, index)
+        try:
+            marks = graph.marks
+            frontier = []
+            for root in roots:
+                i = index.get(root.id)
+                if i is not None and not marks[i]:
+                    marks[i] = 1
+                    frontier.append(i)
+
+            if self.workers <= 1:
+                _mark_from(graph, frontier)
+            else:
+                self._mark_parallel(graph, frontier, len(objs))
+            return bytes(marks)
+        finally:
+            shm = graph.shm
+            graph.close()
+            shm.unlink()
+
+    def _mark_parallel(self, graph: _Graph, frontier: List[int], n: int) -> None:
+        offsets, targets, marks = graph.offsets, graph.targets, graph.marks
+        want = self.workers * _SEED_PER_WORKER
+        m = len(graph.targets)
+        self.rounds = 0
+        while frontier:
+            # widen the frontier with a few bfs levels so every worker gets a share
+            while frontier and len(frontier) < want:
+                nxt = []
+                for i in frontier:
+                    for j in range(offsets[i], offsets[i + 1]):
+                        child = targets[j]
+                        if not marks[child]:
+                            marks[child] = 1
+                            nxt.append(child)
+                frontier = nxt
+            if not frontier:
+                return
+
+            shares = [frontier[k :: self.workers] for k in range(self.workers)]
+            left = self._get_pool().map(
+                _worker,
+                [(graph.shm.name, n, m, share, _ROUND_BUDGET) for share in shares if share],
+            )
+            self.rounds += 1
+            frontier = [i for share in left for i in share]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
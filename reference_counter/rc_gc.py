@@ -1,22 +1,53 @@
-from dataclasses import dataclass, field
-from typing import Dict, Optional, Any, Set
+from time import perf_counter_ns
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Set, Tuple, Union
 import itertools
+import threading
 
+from gc_common.finalize import FinalizerQueue, WeakRef
+from gc_common.gc_stats import GCStats
+from gc_common.heap_dump import HeapDump, HeapRecord, write_dump
+from gc_common.layout import (
+    EMPTY_SHAPE,
+    NO_SLOTS,
+    HeapObject,
+    as_list,
+    bulk_edges,
+    resolve_many,
+)
+from gc_common.safepoint import STRIPE_MASK, Safepoint, ThreadIds, stripes
 
-@dataclass
-class _Obj:
-    id: int
-    value: Any = None
-    fields: Dict[str, "ObjectRef"] = field(default_factory=dict)
-    refcount: int = 0
-    freed: bool = False
+
+# cycle collection colors (bacon-rajan, see collect_cycles)
+_BLACK = 0  # in use, or free
+_GRAY = 1  # possible member of a cycle
+_WHITE = 2  # member of a garbage cycle
+_PURPLE = 3  # possible root of a cycle
+
+
+class _Obj(HeapObject):
+    # fields as shape + slots, shared by all collectors (see gc_common/layout.py)
+    __slots__ = ("refcount", "color", "buffered")
+
+    def __init__(self, id: int, value: Any = None, refcount: int = 0):
+        self.id = id
+        self.value = value
+        self.shape = EMPTY_SHAPE
+        self.slots = NO_SLOTS  # list of child _Obj (or None), once set
+        self.refcount = refcount
+        self.freed = False
+        self.color = _BLACK
+        self.buffered = False
 
     def __repr__(self):
-        flds = [f"{k} -> #{v._obj.id}" for k, v in self.fields.items()]
-        return f"_Obj #{self.id} (val={self.value!r}, rc={self.refcount}), fields={flds}, freed={self.freed}"
+        return (
+            f"_Obj #{self.id} (val={self.value!r}, rc={self.refcount}), "
+            f"fields={self.field_list()}, freed={self.freed}"
+        )
 
 
 class ObjectRef:
+    __slots__ = ("_obj",)
+
     def __init__(self, _obj: _Obj):
         self._obj = _obj
 
@@ -24,8 +55,13 @@ class ObjectRef:
         return f"ObjectRef(#{self._obj.id}), val={self._obj.value!r}"
 
 
+_Obj.ref_type = ObjectRef  # for _Obj.fields
+
+
 class ReferenceCountingGC:
-    def __init__(self):
+    def __init__(
+        self, deferred: bool = False, free_budget: Optional[int] = None, coalesced: bool = False
+    ):
         # created an infinite couter (1..infinity)
         # each call to next() returns 1,2,3... and so on
         self._next_id = itertools.count(1)
@@ -36,17 +72,70 @@ class ReferenceCountingGC:
         # "root" objects, these are protected from garbage collection
         self.roots: Set[int] = set()
 
+        # deferred rc (deutsch-bobrow): roots are not counted, so refcount is
+        # heap references only, and whatever drops to zero is not freed on the
+        # spot but parked in the zero count table (id -> obj). gc() later frees
+        # the entries that are still at zero and are not roots. set_field then
+        # only ever does two counter updates, the free cascades run in gc()
+        # REM: like the tracing collectors, an object the program holds onto
+        # only through its ObjectRef has to be a root across gc()
+        self.deferred = deferred = deferred or coalesced
+        self._zct: Optional[Dict[int, _Obj]] = {} if deferred else None
+
+        # coalesced rc (levanoni-petrank), on top of deferred: set_field does
+        # no counting at all. the first write to an object in an epoch saves
+        # a copy of its slots in the log (parent -> old slots), later writes
+        # just write. gc() ends the epoch: per logged slot, old vs current is
+        # the net change, so a slot overwritten a thousand times costs one
+        # incref + one decref, and a slot written back to its old value none
+        self.coalesced = coalesced
+        self._log: Optional[Dict[_Obj, tuple]] = {} if coalesced else None
+
+        # dead objects not freed yet. a count hitting zero queues the object
+        # and drains the queue, at most free_budget objects per call (None:
+        # everything), so a big structure dying does not stop the program
+        # for the whole cascade: the rest is freed on the next allocs and
+        # decrefs, or by drain()
+        self.free_budget = free_budget
+        self._pending: List[_Obj] = []
+
+        # cycle collection (bacon-rajan, synchronous): a decref that leaves
+        # the count above zero may have just cut the last outside reference
+        # to a cycle, so the object is remembered here (purple). gc() /
+        # collect_cycles() then trial deletes only from these candidates,
+        # never the whole heap
+        self._candidates: List[_Obj] = []
+
+        # finalize(): obj -> its (fn, args), queued when it is freed (by a
+        # cascade or the cycle collector) and run from the queue, never in
+        # the middle of a free (see gc_common/finalize.py)
+        self._finalizable: Dict[_Obj, List[Tuple[Any, tuple]]] = {}
+        self.finalizers = FinalizerQueue()
+
+        # a "pause" here is one whole free cascade (see gc_common/gc_stats.py)
+        self._stats = GCStats()
+
+    def stats(self) -> GCStats:
+        stats = self._stats
+        stats.heap_size = len(self.heap)
+        stats.allocated = stats.heap_size + stats.freed
+        return stats
+
     def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        if self._pending:
+            self.drain(self.free_budget)
+
         # get new counter id, build new instance, push to heap
         oid = next(self._next_id)
         obj = _Obj(
             id=oid,
             value=value,
             refcount=0,  # nobody references it yet, so sad :(
-            fields={},  # neither is it referenced by other objects
-            freed=False,  # it means the object is alive
         )
         self.heap[oid] = obj
+        if self._zct is not None:
+            # starts at zero: dead at the next gc() unless something points at it
+            self._zct[oid] = obj
 
         return ObjectRef(obj)
 
@@ -56,47 +145,110 @@ class ReferenceCountingGC:
         return obj_ref._obj
 
     def incref(self, obj_ref: Optional[ObjectRef]) -> None:
-        obj = self._get_obj(obj_ref)
+        self._incref(self._get_obj(obj_ref))
+
+    def decref(self, obj_ref: Optional[ObjectRef]) -> None:
+        self._decref(self._get_obj(obj_ref))
+
+    # the heap stores children as plain _Obj, so internally we count on those
+    def _incref(self, obj: Optional[_Obj]) -> None:
         if obj is None or obj.freed:
             return
         obj.refcount += 1
+        obj.color = _BLACK
 
-    def decref(self, obj_ref: Optional[ObjectRef]) -> None:
-        obj = self._get_obj(obj_ref)
+    def _decref(self, obj: Optional[_Obj]) -> None:
         if obj is None or obj.freed:
             return
         obj.refcount -= 1
         if obj.refcount <= 0:
-            self._free(obj)
+            if self._zct is not None:
+                self._zct[obj.id] = obj
+                return
+            self._pending.append(obj)
+            self.drain(self.free_budget)
+        elif obj.color != _PURPLE:
+            self._possible_root(obj)
 
-    def _free(self, obj: _Obj) -> None:
-        # helps to deallocate an object from memory
-        # the CORE of the garbage collection program
+    def _possible_root(self, obj: _Obj) -> None:
+        obj.color = _PURPLE
+        if not obj.buffered:
+            obj.buffered = True
+            self._candidates.append(obj)
 
-        if obj.freed:
-            # this helps to guard against double free, and prevent infinte recursion
-            return
-        obj.freed = True
-        # this prevents circular recursions
+    def drain(self, max_objects: Optional[int] = None) -> int:
+        # free up to max_objects of the queued dead objects (all of them for
+        # None), returns how many were freed
+        if not self._pending:
+            return 0
+        if self._log:
+            # coalesced, mid epoch: a queued object may have been linked
+            # again since, and only the log knows. its counts go in first
+            self._apply_log()
+        stats = self._stats
+        if stats.in_pause:
+            # from gc(), which times the whole reconcile itself
+            return self._drain(max_objects)
+        # only cascades go in the pause histogram: a single free is not
+        # much of a pause, and recording it would cost more than the free
+        start = perf_counter_ns()
+        freed = self._drain(max_objects)
+        if freed > 1:
+            stats.add_pause("free", perf_counter_ns() - start)
+        return freed
 
-        children = list(obj.fields.values())
-        # extracing all the objectRefs that this obj points to
-        # and create a copy, because we are about to clear the dict below
-        # and now the obj is an disconnected fully
-        obj.fields.clear()
+    def _drain(self, max_objects: Optional[int]) -> int:
+        # helps to deallocate objects from memory
+        # the CORE of the garbage collection program
+        #
+        # cascade chain rxn happens heere, but as a loop over the queue, not
+        # a recursion: A->B->C freeing A will decrement B, which then gets
+        # queued, freeing B decrements C... so no depth is too deep, and the
+        # budget can stop it half way
+        pending = self._pending
+        heap = self.heap
+        roots = self.roots
+        finalizable = self._finalizable
+        budget = len(heap) if max_objects is None else max_objects
+        freed = 0
+        while pending and freed < budget:
+            obj = pending.pop()
+            # already gone (queued twice), or pointed at / rooted again while
+            # it waited (deferred roots are not counted)
+            if obj.freed or obj.refcount > 0 or obj.id in roots:
+                continue
+            obj.freed = True
+            freed += 1
 
-        # cascade chain rxn starts heere
-        # A->B->C freeing A will decrement B, potentially freeing B, which drecrements C...
-        for child_ref in children:
-            self.decref(child_ref)
+            children = obj.slots
+            # grab the children this obj points to, clear() swaps in a fresh
+            # empty slots so the list we hold on to is not touched
+            # and now the obj is an disconnected fully
+            obj.clear()
+            for child in children:
+                if child is not None and not child.freed:
+                    child.refcount -= 1
+                    if child.refcount <= 0:
+                        pending.append(child)
+                    elif child.color != _PURPLE:
+                        self._possible_root(child)
 
-        if obj.id in self.heap:
             # we remove the object from memory, it's gone for ever.
             # fly me to the moon
             # and let me play among the stars
             # and let me see what spring is like
             # on a jupiter and mars
-            del self.heap[obj.id]
+            del heap[obj.id]
+            if finalizable:
+                self._queue_finalizers(obj)
+
+        self._stats.freed += freed
+        return freed
+
+    def _queue_finalizers(self, obj: _Obj) -> None:
+        fns = self._finalizable.pop(obj, None)
+        if fns is not None:
+            self.finalizers.put(fns)
 
     def set_field(
         self, parent_ref: ObjectRef, field_name: str, new_child_ref: Optional[ObjectRef]
@@ -107,20 +259,121 @@ class ReferenceCountingGC:
             # print("Setting field on freed or non existent parent")
             raise RuntimeError("Setting field on freed or non existent parent.")
 
-        old_child_ref = parent.fields.get(field_name)
-        if old_child_ref is new_child_ref:
+        log = self._log
+        if log is not None:
+            # coalesced: no counting, and put() inlined for existing fields
+            if parent not in log:
+                log[parent] = tuple(parent.slots)
+            new_child = None if new_child_ref is None else new_child_ref._obj
+            i = parent.shape.index.get(field_name)
+            if i is None:
+                parent.put(field_name, new_child)
+            else:
+                parent.slots[i] = new_child
             return
-        if new_child_ref is not None:
-            self.incref(new_child_ref)
 
-        if new_child_ref is None:
-            if field_name in parent.fields:
-                del parent.fields[field_name]
-        else:
-            parent.fields[field_name] = new_child_ref
+        old_child = parent.get(field_name)
+        new_child = self._get_obj(new_child_ref)
+        if old_child is new_child:
+            return
+        zct = self._zct
+        if zct is not None:
+            # deferred: the two counter updates inline, a zero only gets noted
+            if new_child is not None and not new_child.freed:
+                new_child.refcount += 1
+                new_child.color = _BLACK
+            parent.put(field_name, new_child)
+            if old_child is not None:
+                old_child.refcount -= 1
+                if old_child.refcount <= 0:
+                    zct[old_child.id] = old_child
+                elif old_child.color != _PURPLE:
+                    self._possible_root(old_child)
+            return
+
+        if new_child is not None:
+            self._incref(new_child)
+
+        parent.put(field_name, new_child)
+
+        if old_child is not None:
+            self._decref(old_child)
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        # alloc() for a whole sequence (or numpy array) of values: one id
+        # range, one heap update. ids are consecutive, refs[i] gets first id + i
+        if self._pending:
+            self.drain(self.free_budget)
+        values = as_list(values)
+        if not values:
+            return []
+        first = next(self._next_id)
+        ids = range(first, first + len(values))
+        self._next_id = itertools.count(first + len(values))
+        objs = list(map(_Obj, ids, values))
+        self.heap.update(zip(ids, objs))
+        if self._zct is not None:
+            self._zct.update(zip(ids, objs))
+        return list(map(ObjectRef, objs))
+
+    def _resolve_many(self, items: Iterable[Any], parents: bool = False) -> List[Optional[_Obj]]:
+        return resolve_many(items, self.heap.get, self._get_obj, ObjectRef, parents)
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        # set_field() for many edges: parents[i].names[i] = children[i]
+        # parents / children are ObjectRefs or object ids (lists or numpy
+        # arrays, a child None / 0 clears the field), names is one field
+        # name for every edge or one per edge. edges apply in order.
+        # the counts are done for the batch as a whole: every new child +1
+        # first, then every overwritten one -1, so a child that is set and
+        # overwritten within the batch never goes through a free
+        parents, names, children = bulk_edges(parents, names, children, self._resolve_many)
 
-        if old_child_ref is not None:
-            self.decref(old_child_ref)
+        log = self._log
+        if log is not None:
+            # coalesced: nothing to count, the epoch end does it
+            for parent, name, child in zip(parents, names, children):
+                if parent not in log:
+                    log[parent] = tuple(parent.slots)
+                parent.put(name, child)
+            return
+
+        dropped = []
+        for parent, name, child in zip(parents, names, children):
+            shape = parent.shape
+            i = shape.index.get(name)
+            if i is None:
+                if child is None:
+                    continue
+                parent.put(name, child)
+            else:
+                old = parent.slots[i]
+                if old is child:
+                    continue
+                parent.slots[i] = child
+                if old is not None:
+                    dropped.append(old)
+            if child is not None and not child.freed:
+                child.refcount += 1
+                child.color = _BLACK
+
+        zct = self._zct
+        pending = self._pending
+        for obj in dropped:
+            if obj.freed:
+                continue
+            obj.refcount -= 1
+            if obj.refcount <= 0:
+                if zct is not None:
+                    zct[obj.id] = obj
+                else:
+                    pending.append(obj)
+            elif obj.color != _PURPLE:
+                self._possible_root(obj)
+        if pending:
+            self.drain(self.free_budget)
 
     def add_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -131,7 +384,8 @@ class ReferenceCountingGC:
             return
 
         self.roots.add(obj.id)
-        self.incref(obj_ref)
+        if not self.deferred:
+            self.incref(obj_ref)
 
     def remove_root(self, obj_ref: ObjectRef) -> None:
         obj = self._get_obj(obj_ref)
@@ -141,10 +395,505 @@ class ReferenceCountingGC:
             return
 
         self.roots.remove(obj.id)
-        self.decref(obj_ref)
+        if not self.deferred:
+            self.decref(obj_ref)
+        elif obj.refcount <= 0:
+            self._zct[obj.id] = obj
+        else:
+            # still pointed at, maybe only by its own cycle
+            self._possible_root(obj)
+
+    def weakref(self, obj_ref: ObjectRef) -> WeakRef:
+        # a reference that does not count (see gc_common/finalize.py)
+        return WeakRef(self, obj_ref)
+
+    def finalize(self, obj_ref: ObjectRef, fn: Any, *args: Any) -> None:
+        # fn(*args) goes on self.finalizers once the object is freed
+        obj = self._get_obj(obj_ref)
+        if obj is None or obj.freed:
+            raise RuntimeError("finalize() on a freed or non existent object.")
+        self._finalizable.setdefault(obj, []).append((fn, args))
+
+    def gc(self) -> None:
+        # deferred mode: reconcile the zero count table against the roots.
+        # an entry still at zero that is not a root is garbage, it goes to
+        # the free queue, and so do its children once their count hits zero
+        # (the queue skips roots). entries back above zero or rooted just
+        # drop out, they come back on their next decref to zero / remove_root
+        # (in both modes this also works off the free queue, budget permitting)
+        if self._zct or self._pending or self._log:
+            with self._stats.pause("reconcile"):
+                self._end_epoch()
+                self.drain(self.free_budget)
+        self.collect_cycles()
+
+    def _end_epoch(self) -> None:
+        # coalesced: apply the log, then (both deferred modes) the zero
+        # count table goes to the free queue
+        if self._log:
+            with self._stats.phase("log"):
+                self._apply_log()
+        zct = self._zct
+        if zct:
+            if self.coalesced:
+                # a cycle made and cut off within one epoch never had
+                # its outside edge counted, so no decref made it a
+                # candidate. it is new though, so it went through here
+                for obj in zct.values():
+                    if obj.refcount > 0 and obj.color != _PURPLE:
+                        self._possible_root(obj)
+            self._pending.extend(zct.values())
+            zct.clear()
+
+    def _apply_log(self) -> None:
+        # the net count changes of the epoch, increments first so nothing
+        # that is still pointed at passes through zero on the way
+        log = self._log
+        if not log:
+            return
+        zct = self._zct
+        drops = []
+        for obj, old in log.items():
+            if obj.freed:
+                continue
+            n = len(old)
+            for i, child in enumerate(obj.slots):
+                before = old[i] if i < n else None
+                if child is before:
+                    continue
+                if child is not None and not child.freed:
+                    child.refcount += 1
+                    child.color = _BLACK
+                if before is not None:
+                    drops.append(before)
+        log.clear()
+
+        for obj in drops:
+            if obj.freed:
+                continue
+            obj.refcount -= 1
+            if obj.refcount <= 0:
+                zct[obj.id] = obj
+            elif obj.color != _PURPLE:
+                self._possible_root(obj)
+
+    def collect_cycles(self) -> int:
+        # bacon-rajan trial deletion over the buffered candidates, returns
+        # how many objects it freed:
+        #   mark:    from every purple candidate, take away the counts that
+        #            come from inside its subgraph (gray)
+        #   scan:    whatever is still above zero (or a root) is referenced
+        #            from outside, it and everything under it get their
+        #            counts back (black); the rest is garbage (white)
+        #   collect: free the white objects
+        # the work is proportional to the subgraphs under the candidates.
+        # all three walks use their own stack, no recursion
+        stats = self._stats
+        if self._log:
+            # coalesced: trial deletion on the counts of the last epoch end
+            # would take edges written since for not there, end it first
+            with stats.pause("reconcile"):
+                self._end_epoch()
+        candidates = self._candidates
+        if not candidates:
+            return 0
+        freed = stats.freed
+        with stats.pause("cycles"):
+            with stats.phase("mark"):
+                live = []
+                for obj in candidates:
+                    if obj.color == _PURPLE and not obj.freed:
+                        self._mark_gray(obj)
+                        live.append(obj)
+                    else:
+                        obj.buffered = False
+                candidates.clear()
+            with stats.phase("scan"):
+                for obj in live:
+                    self._scan(obj)
+            with stats.phase("collect"):
+                for obj in live:
+                    obj.buffered = False
+                    self._collect_white(obj)
+        return stats.freed - freed
+
+    def _mark_gray(self, obj: _Obj) -> None:
+        if obj.color == _GRAY:
+            return
+        obj.color = _GRAY
+        stack = [obj]
+        while stack:
+            for child in stack.pop().slots:
+                if child is not None:
+                    child.refcount -= 1
+                    if child.color != _GRAY:
+                        child.color = _GRAY
+                        stack.append(child)
+
+    def _scan(self, obj: _Obj) -> None:
+        roots = self.roots
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            if obj.color != _GRAY:
+                continue
+            # deferred roots are not in the count, they are outside refs too
+            if obj.refcount > 0 or obj.id in roots:
+                self._scan_black(obj)
+            else:
+                obj.color = _WHITE
+                stack.extend(c for c in obj.slots if c is not None)
+
+    def _scan_black(self, obj: _Obj) -> None:
+        obj.color = _BLACK
+        stack = [obj]
+        while stack:
+            for child in stack.pop().slots:
+                if child is not None:
+                    child.refcount += 1
+                    if child.color != _BLACK:
+                        child.color = _BLACK
+                        stack.append(child)
+
+    def _collect_white(self, obj: _Obj) -> None:
+        # counts inside the garbage are not fixed up: it is all going away,
+        # and the black objects it points to got theirs taken in _mark_gray
+        heap = self.heap
+        finalizable = self._finalizable
+        freed = 0
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            if obj.color != _WHITE or obj.buffered:
+                continue
+            obj.color = _BLACK
+            obj.freed = True
+            freed += 1
+            stack.extend(c for c in obj.slots if c is not None)
+            obj.clear()
+            del heap[obj.id]
+            if finalizable:
+                self._queue_finalizers(obj)
+        self._stats.freed += freed
 
     def heap_snapshot(self) -> str:
+        self._apply_log()  # show real counts
         lines = [f"HEAP size={len(self.heap)}, ROOTS={sorted(list(self.roots))}"]
         for oid in sorted(self.heap):
             lines.append(repr(self.heap[oid]))
         return "\n".join(lines)
+
+    def iter_records(self) -> Iterator[HeapRecord]:
+        # streaming alternative to heap_snapshot(), heap order, nothing sorted
+        # refcounts are always written the non deferred way, roots included
+        self._apply_log()
+        roots = self.roots if self.deferred else ()
+        for obj in self.heap.values():
+            edges = [(n, c.id) for n, c in zip(obj.shape.names, obj.slots) if c is not None]
+            refcount = obj.refcount + 1 if obj.id in roots else obj.refcount
+            yield HeapRecord(obj.id, obj.value, refcount=refcount, edges=edges)
+
+    def dump(self, path: str) -> int:
+        # binary heap dump (see gc_common/heap_dump.py), returns the number of objects
+        return write_dump(path, self.roots, self.iter_records())
+
+    @classmethod
+    def load(
+        cls, path: str, deferred: bool = False, coalesced: bool = False
+    ) -> "ReferenceCountingGC":
+        # a fresh collector holding the dumped heap, refcounts restored as is
+        # (they already include the roots and every edge, so linking the
+        # children below must not count them again)
+        gc = cls(deferred=deferred, coalesced=coalesced)
+        deferred = gc.deferred
+        heap = gc.heap
+        links = []
+        with HeapDump(path) as dump:
+            for rec in dump:
+                obj = _Obj(rec.id, rec.value, rec.refcount)
+                heap[rec.id] = obj
+                if rec.edges:
+                    links.append((obj, rec.edges))
+            gc.roots = set(dump.roots)
+
+        for obj, edges in links:
+            for name, child in edges:
+                obj.put(name, heap[child])
+        if deferred:
+            # roots are not counted in deferred mode, take them back out
+            for oid in gc.roots:
+                heap[oid].refcount -= 1
+        # anything dead but not freed yet at dump time goes back where it was
+        dead = [obj for obj in heap.values() if obj.refcount <= 0 and obj.id not in gc.roots]
+        if deferred:
+            gc._zct.update((obj.id, obj) for obj in dead)
+        else:
+            gc._pending.extend(dead)
+        # the dump does not say which objects were cycle candidates, so the
+        # first collect_cycles() looks at everything once
+        for obj in heap.values():
+            if obj.refcount > 0:
+                gc._possible_root(obj)
+        gc._next_id = itertools.count(max(heap, default=0) + 1)
+        return gc
+
+
+class ThreadSafeReferenceCountingGC(ReferenceCountingGC):
+    # safe to call from several mutator threads at once, without one lock
+    # around every operation (see gc_common/safepoint.py):
+    #   a count change holds the stripe of the object counted, a field
+    #   write the stripe of its parent, and never two stripes at once, so
+    #   there is no lock order to get wrong. the new child is counted up
+    #   before the store and the old one down after it, so a child moving
+    #   between two fields never passes through zero on the way
+    #   ids come from per-thread chunks
+    #   gc() / collect_cycles() stop the world at a safepoint, trial
+    #   deletion borrows counts all over the heap
+    # new objects go straight into the shared heap, not a per-thread
+    # allocation buffer: any thread may free any object at any time here,
+    # it has to find it. the roots and the stats get a small lock each,
+    # neither is on the set_field path
+
+    def __init__(
+        self, deferred: bool = False, free_budget: Optional[int] = None, coalesced: bool = False
+    ):
+        super().__init__(deferred, free_budget, coalesced)
+        self._safepoint = Safepoint()
+        self._next_id = ThreadIds()
+        self._stripes = stripes()
+        self._roots_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def alloc(self, value: Optional[Any] = None) -> ObjectRef:
+        m = self._safepoint.enter()
+        try:
+            if self._pending and not self._log:
+                self.drain(self.free_budget)
+            oid = next(self._next_id)
+            obj = _Obj(oid, value)
+            self.heap[oid] = obj
+            if self._zct is not None:
+                self._zct[oid] = obj
+            return ObjectRef(obj)
+        finally:
+            m.depth -= 1
+
+    def alloc_many(self, values: Iterable[Any]) -> List[ObjectRef]:
+        values = as_list(values)
+        if not values:
+            return []
+        m = self._safepoint.enter()
+        try:
+            if self._pending and not self._log:
+                self.drain(self.free_budget)
+            first = self._next_id.take(len(values))
+            ids = range(first, first + len(values))
+            objs = list(map(_Obj, ids, values))
+            self.heap.update(zip(ids, objs))
+            if self._zct is not None:
+                self._zct.update(zip(ids, objs))
+            return list(map(ObjectRef, objs))
+        finally:
+            m.depth -= 1
+
+    def incref(self, obj_ref: Optional[ObjectRef]) -> None:
+        m = self._safepoint.enter()
+        try:
+            self._incref(self._get_obj(obj_ref))
+        finally:
+            m.depth -= 1
+
+    def decref(self, obj_ref: Optional[ObjectRef]) -> None:
+        m = self._safepoint.enter()
+        try:
+            self._decref(self._get_obj(obj_ref))
+        finally:
+            m.depth -= 1
+
+    def _incref(self, obj: Optional[_Obj]) -> None:
+        if obj is None:
+            return
+        with self._stripes[obj.id & STRIPE_MASK]:
+            if obj.freed:
+                return
+            obj.refcount += 1
+            obj.color = _BLACK
+
+    def _decref(self, obj: Optional[_Obj]) -> None:
+        if obj is None:
+            return
+        with self._stripes[obj.id & STRIPE_MASK]:
+            if obj.freed:
+                return
+            obj.refcount -= 1
+            if obj.refcount > 0:
+                if obj.color != _PURPLE:
+                    self._possible_root(obj)
+                return
+            if self._zct is not None:
+                self._zct[obj.id] = obj
+                return
+            self._pending.append(obj)
+        self.drain(self.free_budget)
+
+    def drain(self, max_objects: Optional[int] = None) -> int:
+        if not self._pending:
+            return 0
+        if self._log:
+            # only from outside a mutator region: alloc / alloc_many leave
+            # the queue alone while the epoch has writes, it waits for gc()
+            with self._safepoint.stopped():
+                self._apply_log()
+        stats = self._stats
+        if stats.in_pause:
+            return self._drain(max_objects)
+        start = perf_counter_ns()
+        freed = self._drain(max_objects)
+        if freed > 1:
+            with self._stats_lock:
+                stats.add_pause("free", perf_counter_ns() - start)
+        return freed
+
+    def _drain(self, max_objects: Optional[int]) -> int:
+        # ReferenceCountingGC._drain, with each object's checks and count
+        # change under its stripe. whoever sets obj.freed owns the free,
+        # other threads draining at the same time skip it
+        pending = self._pending
+        heap = self.heap
+        roots = self.roots
+        finalizable = self._finalizable
+        locks = self._stripes
+        budget = len(heap) if max_objects is None else max_objects
+        freed = 0
+        while freed < budget:
+            try:
+                obj = pending.pop()
+            except IndexError:
+                break
+            with locks[obj.id & STRIPE_MASK]:
+                if obj.freed or obj.refcount > 0 or obj.id in roots:
+                    continue
+                obj.freed = True
+                children = obj.slots
+                obj.clear()
+            freed += 1
+            for child in children:
+                if child is None:
+                    continue
+                with locks[child.id & STRIPE_MASK]:
+                    if child.freed:
+                        continue
+                    child.refcount -= 1
+                    if child.refcount <= 0:
+                        pending.append(child)
+                    elif child.color != _PURPLE:
+                        self._possible_root(child)
+            del heap[obj.id]
+            if finalizable:
+                self._queue_finalizers(obj)
+
+        if freed:
+            with self._stats_lock:
+                self._stats.freed += freed
+        return freed
+
+    def set_field(
+        self, parent_ref: ObjectRef, field_name: str, new_child_ref: Optional[ObjectRef]
+    ) -> None:
+        m = self._safepoint.enter()
+        try:
+            parent = self._get_obj(parent_ref)
+            if parent is None or parent.freed:
+                raise RuntimeError("Setting field on freed or non existent parent.")
+            new_child = self._get_obj(new_child_ref)
+            lock = self._stripes[parent.id & STRIPE_MASK]
+
+            log = self._log
+            if log is not None:
+                # coalesced: the first write of the epoch saves the old slots
+                with lock:
+                    if parent not in log:
+                        log[parent] = tuple(parent.slots)
+                    parent.put(field_name, new_child)
+                return
+
+            # deferred mode counts the same way, a zero only ends up in the zct
+            self._incref(new_child)
+            with lock:
+                old_child = parent.get(field_name)
+                parent.put(field_name, new_child)
+            self._decref(old_child)
+        finally:
+            m.depth -= 1
+
+    def set_fields_bulk(
+        self, parents: Iterable[Any], names: Union[str, Iterable[str]], children: Iterable[Any]
+    ) -> None:
+        with self._safepoint.stopped():
+            super().set_fields_bulk(parents, names, children)
+
+    def add_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            obj = self._get_obj(obj_ref)
+            if obj is None or obj.freed:
+                return
+            # counted under the roots lock: a remove_root of the same object
+            # can then never decrement before this incremented
+            with self._roots_lock:
+                if obj.id in self.roots:
+                    return
+                self.roots.add(obj.id)
+                if not self.deferred:
+                    self._incref(obj)
+        finally:
+            m.depth -= 1
+
+    def remove_root(self, obj_ref: ObjectRef) -> None:
+        m = self._safepoint.enter()
+        try:
+            obj = self._get_obj(obj_ref)
+            if obj is None or obj.freed:
+                return
+            with self._roots_lock:
+                if obj.id not in self.roots:
+                    return
+                self.roots.remove(obj.id)
+            if not self.deferred:
+                self._decref(obj)
+                return
+            with self._stripes[obj.id & STRIPE_MASK]:
+                if obj.refcount <= 0:
+                    self._zct[obj.id] = obj
+                else:
+                    self._possible_root(obj)
+        finally:
+            m.depth -= 1
+
+    def gc(self) -> None:
+        with self._safepoint.stopped():
+            super().gc()
+
+    def collect_cycles(self) -> int:
+        with self._safepoint.stopped():
+            return super().collect_cycles()
+
+    def heap_snapshot(self) -> str:
+        with self._safepoint.stopped():
+            return super().heap_snapshot()
+
+    def dump(self, path: str) -> int:
+        with self._safepoint.stopped():
+            return super().dump(path)
+
+    def stats(self) -> GCStats:
+        with self._safepoint.stopped():
+            return super().stats()
+
+    @classmethod
+    def load(
+        cls, path: str, deferred: bool = False, coalesced: bool = False
+    ) -> "ThreadSafeReferenceCountingGC":
+        gc = super().load(path, deferred, coalesced)
+        gc._next_id = ThreadIds(max(gc.heap, default=0) + 1)
+        return gc
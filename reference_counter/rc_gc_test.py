@@ -1,4 +1,9 @@
-from rc_gc import ReferenceCountingGC
+import os
+import random
+import tempfile
+import threading
+
+from rc_gc import ObjectRef, ReferenceCountingGC, ThreadSafeReferenceCountingGC
 
 """
 gc = ReferenceCountingGC()
@@ -59,3 +64,415 @@ def smoke_test_cycle():
 
 
 smoke_test_cycle()
+
+
+def test_dump_and_load():
+    print("dump + load: refcounts and edges come back as they were")
+    gc = ReferenceCountingGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    a = gc.alloc("A")
+    b = gc.alloc("B")
+    gc.set_field(root, "left", a)
+    gc.set_field(root, "right", b)
+    gc.set_field(a, "peer", b)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "heap.bin")
+        gc.dump(path)
+        loaded = ReferenceCountingGC.load(path)
+    print(loaded.heap_snapshot())
+    assert loaded.heap_snapshot() == gc.heap_snapshot()
+
+    # counts are live: dropping the root cascades through the loaded heap
+    loaded.remove_root(ObjectRef(loaded.heap[1]))
+    assert len(loaded.heap) == 0
+    print("-" * 60)
+
+
+test_dump_and_load()
+
+
+def test_stats():
+    print("stats: a cascade is one pause, single frees are only counted")
+    gc = ReferenceCountingGC()
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(100):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    gc.set_field(root, "extra", gc.alloc("extra"))
+    gc.set_field(root, "extra", None)  # frees 1 object
+
+    gc.remove_root(root)  # frees all 101 in one cascade
+    s = gc.stats()
+    print(s.summary())
+    assert (s.allocated, s.freed, s.heap_size) == (102, 102, 0)
+    assert s.collections == {"free": 1}
+    assert s.pauses.count == 1
+    print("-" * 60)
+
+
+test_stats()
+
+
+def test_deferred():
+    print("deferred rc: set_field / remove_root never free, gc() does")
+    gc = ReferenceCountingGC(deferred=True)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    assert root._obj.refcount == 0  # roots are not counted
+    prev = root
+    for i in range(10_000):  # deep enough to blow the stack if gc() recursed
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+    gc.set_field(root, "extra", gc.alloc("extra"))
+    gc.set_field(root, "extra", None)
+    assert len(gc.heap) == 10_002  # "extra" is only in the zero count table
+
+    gc.gc()
+    assert len(gc.heap) == 10_001
+
+    a = gc.alloc("A")
+    b = gc.alloc("B")
+    gc.set_field(a, "peer", b)
+    gc.set_field(b, "peer", a)
+    gc.gc()
+    print(f"heap after gc(), chain + leaked cycle: {len(gc.heap)}")
+    assert len(gc.heap) == 10_003  # still rc: the cycle stays
+
+    # dumps carry the normal (root counted) refcounts
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "heap.bin")
+        gc.dump(path)
+        assert ReferenceCountingGC.load(path).heap[1].refcount == 1
+        loaded = ReferenceCountingGC.load(path, deferred=True)
+    assert loaded.heap_snapshot() == gc.heap_snapshot()
+
+    gc.remove_root(root)
+    assert len(gc.heap) == 10_003
+    gc.gc()
+    assert len(gc.heap) == 2
+    s = gc.stats()
+    print(s.summary())
+    assert s.collections == {"reconcile": 3}
+    assert s.freed == 10_002
+    print("-" * 60)
+
+
+test_deferred()
+
+
+def test_free_budget():
+    print("free budget: a dying 50k list is freed a bit at a time, no recursion")
+    gc = ReferenceCountingGC(free_budget=1000)
+    root = gc.alloc("root")
+    gc.add_root(root)
+    prev = root
+    for i in range(50_000):
+        node = gc.alloc(i)
+        gc.set_field(prev, "next", node)
+        prev = node
+
+    gc.remove_root(root)
+    assert len(gc.heap) == 50_001 - 1000
+    assert gc.drain(500) == 500
+    gc.alloc("x")  # allocs drain another budget's worth first
+    assert len(gc.heap) == 50_001 - 2500 + 1
+    print(f"still queued after 2500 frees: {len(gc.heap) - 1}")
+
+    assert gc.drain() == 50_001 - 2500
+    assert len(gc.heap) == 1
+    s = gc.stats()
+    print(s.summary())
+    assert s.collections == {"free": 4}
+    print("-" * 60)
+
+
+test_free_budget()
+
+
+def test_cycle_collection():
+    print("cycle collection: gc() trial deletes from the candidates, frees dead cycles")
+    for deferred in (False, True):
+        gc = ReferenceCountingGC(deferred=deferred)
+        holder = gc.alloc("holder")
+        gc.add_root(holder)
+
+        # a dead ring, a ring still pointed at from the live side, and a
+        # 50k ring (would blow the stack if any of the walks recursed)
+        for size in (3, 50_000):
+            ring = [gc.alloc(i) for i in range(size)]
+            for i in range(size):
+                gc.set_field(ring[i], "next", ring[(i + 1) % size])
+            gc.set_field(holder, "ring", ring[0])
+        gc.set_field(holder, "ring", None)
+
+        kept = [gc.alloc("k0"), gc.alloc("k1")]
+        gc.set_field(kept[0], "peer", kept[1])
+        gc.set_field(kept[1], "peer", kept[0])
+        gc.set_field(holder, "kept", kept[1])
+        gc.set_field(holder, "tmp", kept[0])
+        gc.set_field(holder, "tmp", None)  # kept[0] is a candidate, but live
+
+        # a cycle rooted directly, then unrooted
+        a, b = gc.alloc("A"), gc.alloc("B")
+        gc.set_field(a, "peer", b)
+        gc.set_field(b, "peer", a)
+        gc.add_root(a)
+        gc.remove_root(a)
+
+        assert len(gc.heap) == 1 + 3 + 50_000 + 2 + 2
+        gc.gc()
+        print(f"deferred={deferred}: heap after gc() {sorted(o.value for o in gc.heap.values())}")
+        assert sorted(o.value for o in gc.heap.values()) == ["holder", "k0", "k1"]
+        assert [o._obj.refcount for o in kept] == [1, 2]
+        assert not gc._candidates
+
+        # the survivors are counted right: dropping the last edge frees them
+        gc.set_field(holder, "kept", None)
+        gc.gc()
+        assert len(gc.heap) == 1
+        s = gc.stats()
+        assert s.freed == 3 + 50_000 + 2 + 2
+        assert s.phase_ns.keys() >= {"mark", "scan", "collect"}
+    print("-" * 60)
+
+
+test_cycle_collection()
+
+
+def test_coalesced():
+    print("coalesced rc: counts move only at epoch end (gc()), by the net change")
+    gc = ReferenceCountingGC(coalesced=True)
+    assert gc.deferred
+    root = gc.alloc("root")
+    gc.add_root(root)
+    objs = [gc.alloc(i) for i in range(10)]
+    for i, o in enumerate(objs):
+        gc.set_field(root, f"k{i}", o)
+    assert all(o._obj.refcount == 0 for o in objs)  # nothing counted yet
+    gc.gc()
+    assert all(o._obj.refcount == 1 for o in objs)
+
+    # hammer one slot: only the first and last value matter
+    for j in range(1000):
+        gc.set_field(objs[0], "x", objs[j % 10])
+    gc.set_field(objs[1], "x", objs[2])
+    gc.set_field(objs[1], "x", None)  # back to how it was: no change at all
+    gc.gc()
+    print([o._obj.refcount for o in objs])
+    assert [o._obj.refcount for o in objs] == [1] * 9 + [2]
+
+    # garbage made during the epoch goes at its end, cycles too
+    tmp = gc.alloc("tmp")
+    gc.set_field(root, "tmp", tmp)
+    gc.set_field(tmp, "child", gc.alloc("child"))
+    gc.set_field(root, "tmp", None)
+    a, b = gc.alloc("A"), gc.alloc("B")
+    gc.set_field(a, "peer", b)
+    gc.set_field(b, "peer", a)
+    gc.set_field(root, "tmp", a)
+    gc.set_field(root, "tmp", None)
+    assert len(gc.heap) == 15
+    gc.gc()
+    assert len(gc.heap) == 11
+
+    # snapshots and dumps see the real counts
+    for i in range(10):
+        gc.set_field(root, f"k{i}", None)
+    assert "rc=" in gc.heap_snapshot()
+    assert all(o._obj.refcount == 0 for o in objs[:9])
+    gc.gc()
+    assert len(gc.heap) == 1
+
+    # collect_cycles() on its own ends the epoch first: the edge a -> c is
+    # only in the log, trial deletion on the old counts would free c and d
+    a, c, d = gc.alloc("a"), gc.alloc("c"), gc.alloc("d")
+    gc.add_root(a)
+    gc.add_root(c)
+    gc.set_field(c, "d", d)
+    gc.set_field(d, "c", c)
+    gc.gc()
+    gc.remove_root(c)
+    gc.set_field(a, "x", c)
+    assert gc.collect_cycles() == 0
+    assert not c._obj.freed and not d._obj.freed
+    assert a._obj.get("x") is c._obj and c._obj.refcount == 2
+    gc.set_field(a, "x", None)
+    gc.collect_cycles()
+    assert c._obj.freed and d._obj.freed
+
+    # with a free budget: b waits in the free queue after gc(), gets linked
+    # again (only in the log), and the next alloc must not free it
+    for cls in (ReferenceCountingGC, ThreadSafeReferenceCountingGC):
+        gc = cls(coalesced=True, free_budget=1)
+        r = gc.alloc("r")
+        gc.add_root(r)
+        a, b = gc.alloc("a"), gc.alloc("b")
+        gc.set_field(r, "x", a)
+        gc.set_field(a, "y", b)
+        gc.gc()
+        gc.set_field(r, "x", None)
+        gc.gc()
+        assert a._obj.freed and not b._obj.freed  # b is queued
+        gc.set_field(r, "x", b)
+        gc.alloc("new")
+        gc.drain()
+        assert not b._obj.freed and r._obj.get("x") is b._obj
+        gc.gc()
+        assert b._obj.refcount == 1 and not b._obj.freed
+        gc.set_field(r, "x", None)
+        gc.gc()
+        gc.drain()
+        assert b._obj.freed and len(gc.heap) == 1
+    print("-" * 60)
+
+
+test_coalesced()
+
+
+def test_bulk_construction():
+    print("bulk: alloc_many + set_fields_bulk, counts done for the whole batch")
+    for kw in ({}, {"deferred": True}, {"coalesced": True}):
+        one = ReferenceCountingGC(**kw)
+        bulk = ReferenceCountingGC(**kw)
+        root = one.alloc("root")
+        one.add_root(root)
+        refs = [one.alloc(i) for i in range(20)]
+        bulk.add_root(bulk.alloc("root"))
+        brefs = bulk.alloc_many(range(20))
+        assert [r._obj.id for r in brefs] == list(range(2, 22))
+
+        edges = [(1, "a", 2), (2, "a", 3), (3, "a", 4), (1, "b", 3), (1, "a", 5), (3, "a", 0)]
+        byid = {1: root, 0: None}
+        byid.update((r._obj.id, r) for r in refs)
+        for p, name, c in edges:
+            one.set_field(byid[p], name, byid[c])
+        # 4 is set, then dropped again within the batch
+        bulk.set_fields_bulk(
+            [p for p, _, _ in edges], [n for _, n, _ in edges], [c for _, _, c in edges]
+        )
+        one.gc()
+        bulk.gc()
+        assert bulk.heap_snapshot() == one.heap_snapshot(), kw
+    print(bulk.heap_snapshot().splitlines()[:4])
+    print("-" * 60)
+
+
+test_bulk_construction()
+
+
+def test_thread_safe():
+    print("threads: 8 mutators share a rooted set, counts stay exact")
+
+    def mutator(k):
+        rng = random.Random(k)
+        for i in range(1000):
+            # a fresh object under a shared node, the one it replaces dies
+            gc.set_field(rng.choice(nodes), "tmp", gc.alloc(i))
+            gc.set_field(rng.choice(nodes), rng.choice("ab"), rng.choice(nodes + [None]))
+
+    for kw in ({}, {"deferred": True}, {"coalesced": True}):
+        gc = ThreadSafeReferenceCountingGC(**kw)
+        nodes = [gc.alloc(i) for i in range(32)]
+        for node in nodes:
+            gc.add_root(node)
+        threads = [threading.Thread(target=mutator, args=(k,)) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        gc.gc()
+        # each count is exactly the edges into the object (+ 1 for the root)
+        expected = {node._obj: 0 if gc.deferred else 1 for node in nodes}
+        for node in nodes:
+            for child in node._obj.slots:
+                if child is not None:
+                    expected[child] = expected.get(child, 0) + 1
+        assert {o: o.refcount for o in gc.heap.values()} == expected, kw
+        for node in nodes:
+            gc.set_field(node, "tmp", None)
+        gc.gc()
+        assert len(gc.heap) == 32, kw
+
+    # eager frees run on the mutator threads while another one keeps
+    # stopping the world for cycle collection
+    gc = ThreadSafeReferenceCountingGC()
+    nodes = [gc.alloc(i) for i in range(32)]
+    for node in nodes:
+        gc.add_root(node)
+    stop = threading.Event()
+
+    def collector():
+        while not stop.is_set():
+            gc.gc()
+
+    c = threading.Thread(target=collector)
+    c.start()
+    threads = [threading.Thread(target=mutator, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    c.join()
+    for node in nodes:
+        gc.set_field(node, "tmp", None)
+        gc.set_field(node, "a", None)
+        gc.set_field(node, "b", None)
+    gc.gc()
+    print(f"  {gc.stats().collections}, heap={len(gc.heap)}")
+    assert len(gc.heap) == 32
+    print("-" * 60)
+
+
+test_thread_safe()
+
+
+def test_weakref_and_finalizers():
+    print("finalizers: queued when a cascade or the cycle collector frees, run later")
+    for cls, kw in (
+        (ReferenceCountingGC, {}),
+        (ReferenceCountingGC, {"deferred": True}),
+        (ReferenceCountingGC, {"coalesced": True}),
+        (ThreadSafeReferenceCountingGC, {}),
+    ):
+        gc = cls(**kw)
+        root = gc.alloc("root")
+        gc.add_root(root)
+        ran = []
+        chain = [gc.alloc(i) for i in range(5)]
+        for i in range(4):
+            gc.set_field(chain[i], "next", chain[i + 1])
+        gc.set_field(root, "chain", chain[0])
+        for i, ref in enumerate(chain):
+            gc.finalize(ref, ran.append, i)
+        a, b = gc.alloc("A"), gc.alloc("B")
+        gc.set_field(a, "peer", b)
+        gc.set_field(b, "peer", a)
+        gc.set_field(root, "ring", a)
+        gc.finalize(a, ran.append, "A")
+        weak_chain, weak_ring = gc.weakref(chain[2]), gc.weakref(b)
+
+        gc.set_field(root, "chain", None)
+        gc.set_field(root, "ring", None)
+        gc.gc()
+        assert ran == [] and len(gc.finalizers) == 6, kw
+        assert weak_chain() is None and weak_ring() is None
+        assert gc.finalizers.run(2) == 2 and gc.finalizers.run() == 4
+        assert sorted(ran, key=str) == [0, 1, 2, 3, 4, "A"], kw
+        assert weak_ring() is None and gc.weakref(root)() is root
+        try:
+            gc.finalize(a, ran.append, "late")
+            assert False, "finalize() on a dead object"
+        except RuntimeError:
+            pass
+        print(f"  {cls.__name__} {kw}: ran {gc.finalizers.ran}")
+    print("-" * 60)
+
+
+test_weakref_and_finalizers()